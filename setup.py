@@ -1,3 +1,20 @@
 # for python-2 to install this in edit mode
+import sys
 from setuptools import setup
-setup()
+from setuptools.command.build_py import build_py
+
+# modules that have syntax only for Python 3
+PY3_MODULES = ["util_async"]
+
+
+class BuildPy(build_py):
+    """Leave out Python 3 only modules when building on Python 2"""
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[0] < 3:
+            modules = [m for m in modules if m[1] not in PY3_MODULES]
+        return modules
+
+
+setup(cmdclass={"build_py": BuildPy})
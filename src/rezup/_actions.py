@@ -8,21 +8,29 @@ Should be safe as long as this script has not been imported (been compiled) and
 most importantly, not being called as "_actions.pyc". Still, to be more safe,
 better add "-B" flag to the interpreter before calling this script.
 
+Usage:
+    rez-python -B _actions.py RESULT_FILE ACTION [ARGS..]
+
+The JSON serialized result of action is written into RESULT_FILE, output to
+stdout/stderr is for diagnostics only. Use `-` as RESULT_FILE for action
+`action_serve`, which responds over stdout.
+
 """
 import os
 import sys
 import json
 
-global message_wrap
+global result_file
 
 
-def _flush(message):
-    message = message_wrap % message
-    sys.stdout.write(message)
-    sys.stdout.flush()
+def _output(result):
+    # result goes to a dedicated file, so whatever printed to stdout/stderr
+    #   (e.g. by package commands) won't corrupt it
+    with open(result_file, "w") as f:
+        json.dump(result, f)
 
 
-def action_resolve(requests_or_rxt):
+def _resolve(requests_or_rxt, save_rxt=None):
     from rez.resolved_context import ResolvedContext  # noqa
 
     if os.path.isfile(requests_or_rxt):
@@ -31,12 +39,143 @@ def action_resolve(requests_or_rxt):
         context = ResolvedContext(requests_or_rxt.split(" "))
 
     resolved_env = context.get_environ()
-    resolved_env_str = json.dumps(resolved_env)
-    _flush(resolved_env_str)
+    if save_rxt:
+        context.save(save_rxt)
+    return resolved_env
+
+
+def _clear_caches():
+    # packages may have been released since last resolve
+    try:
+        from rez.package_repository import package_repository_manager
+    except ImportError:
+        return
+    package_repository_manager.clear_caches()
+
+
+def _ping():
+    return {"pid": os.getpid(), "python": sys.version}
+
+
+def _serve_resolve(requests_or_rxt, save_rxt=None):
+    _clear_caches()
+    return _resolve(requests_or_rxt, save_rxt)
+
+
+def _resolve_many(items):
+    """Resolve each (requests_or_rxt, save_rxt) item, errors are returned"""
+    import traceback
+
+    _clear_caches()
+    results = []
+    for requests_or_rxt, save_rxt in items:
+        try:
+            result = {"ok": True, "result": _resolve(requests_or_rxt,
+                                                     save_rxt)}
+        except Exception:
+            result = {"ok": False, "error": traceback.format_exc()}
+        results.append(result)
+    return results
+
+
+def _bake_config(save_path):
+    """Merge rez config files into one, returns the sourced file paths
+
+    Merged from rez's root config and files in `$REZ_CONFIG_FILE`, but not
+    the one in user home, which is still loaded by rez at runtime. Setting
+    that is not a Python literal, e.g. function, can not be baked.
+
+    """
+    import ast
+    from rez.config import (  # noqa
+        _load_config_from_filepaths,
+        get_module_root_config,
+    )
+
+    filepaths = [get_module_root_config()]
+    filepaths += [
+        p for p in os.getenv("REZ_CONFIG_FILE", "").split(os.pathsep) if p
+    ]
+    data, sourced = _load_config_from_filepaths(filepaths)
+
+    lines = ["# Baked by rezup, merged from:"]
+    lines += ["#   %s" % path for path in sourced]
+    for key in sorted(data):
+        value = repr(data[key])
+        try:
+            valid = ast.literal_eval(value) == data[key]
+        except (ValueError, SyntaxError):
+            valid = False
+        if not valid:
+            raise ValueError("Setting %r is not a literal: %s" % (key, value))
+        lines.append("%s = %s" % (key, value))
+
+    with open(save_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return sourced[1:]
+
+
+_served = {
+    "ping": _ping,
+    "resolve": _serve_resolve,
+    "resolve_many": _resolve_many,
+    "bake_config": _bake_config,
+}
+
+
+def action_resolve(requests_or_rxt, save_rxt=None):
+    _output(_resolve(requests_or_rxt, save_rxt))
+
+
+def action_resolve_many(items_json):
+    _output(_resolve_many(json.loads(items_json)))
+
+
+def action_bake_config(save_path_json):
+    _output(_bake_config(json.loads(save_path_json)))
+
+
+def action_serve():
+    """Serve actions in JSON lines until stdin closed
+
+    Each request line is an object like `{"action": "resolve", "args": []}`
+    and each response line is either `{"ok": true, "result": ...}` or
+    `{"ok": false, "error": "traceback.."}`. Requests are served in order,
+    and the `id` of request (if any) is returned with its response.
+
+    The original stdout is reserved for responses, anything else that is
+    printed (e.g. by package commands) goes to stderr.
+
+    """
+    import traceback
+
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break  # client closed or exited
+        if not line.strip():
+            continue
+
+        request = dict()
+        try:
+            request = json.loads(line)
+            func = _served[request["action"]]
+            response = {"ok": True, "result": func(*request.get("args", []))}
+        except Exception:
+            response = {"ok": False, "error": traceback.format_exc()}
+        response["id"] = request.get("id")
+
+        channel.write(json.dumps(response) + "\n")
+        channel.flush()
 
 
 if __name__ == "__main__":
-    message_wrap, action_name = sys.argv[1:3]
+    result_file, action_name = sys.argv[1:3]
 
     action_func = sys.modules[__name__].__dict__.get(action_name)
     if action_func is None:
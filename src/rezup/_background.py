@@ -0,0 +1,101 @@
+
+import os
+import sys
+import subprocess
+
+
+def rezup_command(*args):
+    """Returns command for calling rezup with current interpreter"""
+    return [sys.executable, "-m", "rezup"] + list(args)
+
+
+def spawn_detached(args, log_file=None, env=None):
+    """Start a process that is detached from current session
+
+    The process will keep running after current process exited, and won't
+    receive signals (e.g. Ctrl+C) that sent to current terminal.
+
+    Args:
+        args (list): Command to run
+        log_file (str or path-like, optional): Where the output goes to,
+            discard output if not given.
+        env (dict, optional): Process environment, use current if not given.
+
+    Returns:
+        int: The pid of spawned process
+
+    """
+    env = dict(env or os.environ)
+    env.pop("REZUP_CONTAINER", None)  # not entered
+
+    kwargs = dict()
+    if sys.platform == "win32":
+        detached_process = 0x00000008
+        create_new_process_group = 0x00000200
+        kwargs["creationflags"] = detached_process | create_new_process_group
+    else:
+        kwargs["preexec_fn"] = os.setsid
+        kwargs["close_fds"] = True
+
+    if log_file is not None:
+        log_file = str(log_file)
+        dirname = os.path.dirname(log_file)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        output = open(log_file, "ab")
+    else:
+        output = open(os.devnull, "wb")
+
+    with open(os.devnull, "rb") as stdin:
+        try:
+            popen = subprocess.Popen(
+                args,
+                stdin=stdin,
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                env=env,
+                **kwargs
+            )
+        finally:
+            output.close()
+
+    # not going to wait for it, also silences py3 "still running" warning
+    popen.returncode = 0
+
+    return popen.pid
+
+
+def run_low_priority(args, env=None):
+    """Run command with lowered CPU and IO priority and wait for it
+
+    Args:
+        args (list): Command to run
+        env (dict, optional): Process environment, use current if not given.
+
+    Returns:
+        tuple: Return code and the combined output of the process
+
+    """
+    from .launch import shell
+
+    kwargs = dict()
+    if sys.platform == "win32":
+        below_normal_priority_class = 0x00004000
+        kwargs["creationflags"] = below_normal_priority_class
+    else:
+        kwargs["preexec_fn"] = lambda: os.nice(10)
+        ionice = shell.which("ionice")
+        if ionice:
+            args = [ionice, "-c", "3"] + list(args)  # idle io class
+
+    popen = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        env=env,
+        **kwargs
+    )
+    output, _ = popen.communicate()
+
+    return popen.returncode, output
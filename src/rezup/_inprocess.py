@@ -0,0 +1,198 @@
+
+import os
+import re
+import sys
+import json
+import platform
+import threading
+import traceback
+from contextlib import contextmanager
+
+
+_lock = threading.RLock()
+_imported = dict()  # rez modules imported in rez context, by key
+
+# oldest rez that in-process resolve is verified with, for private config
+#   API like `rez.config._replace_config` and `Setting._parse_env_var`
+MIN_REZ_VERSION = (2, 83)
+
+
+def venv_python(revision):
+    """Returns Python implementation and version of revision's rez venv
+
+    Read from `pyvenv.cfg` of the venv.
+
+    Returns:
+        tuple: Implementation name and version string, or None if unknown.
+
+    """
+    cfg = revision.path() / "venv" / "rez" / "pyvenv.cfg"
+    values = dict()
+    try:
+        with open(str(cfg), "r") as f:
+            for line in f:
+                key, _, value = line.partition("=")
+                values[key.strip()] = value.strip()
+    except (OSError, IOError):
+        return
+
+    version = values.get("version_info") or values.get("version")
+    if version:
+        return values.get("implementation", "CPython"), version
+
+
+def is_compatible(revision):
+    """Returns True if rez in revision could be imported by this interpreter
+
+    Which requires Python 3, the rez venv to be created by the same Python
+    implementation in the same major and minor version, and rez not older
+    than `MIN_REZ_VERSION`.
+
+    """
+    python = venv_python(revision)
+    if python is None or sys.version_info[0] < 3:
+        return False
+    rez_version = (revision.metadata() or {}).get("rez_version") or ""
+    if tuple(int(v) for v in re.findall(r"\d+", rez_version)[:2]) \
+            < MIN_REZ_VERSION:
+        return False
+    implementation, version = python
+    return implementation.lower() == platform.python_implementation().lower() \
+        and version.split(".")[:2] == [str(v) for v in sys.version_info[:2]]
+
+
+def _is_rez_module(name):
+    return name.split(".", 1)[0] in ("rez", "rezplugins")
+
+
+class _RezFinder(object):
+    """Finds only top-level `rez` and `rezplugins` from location
+
+    So other packages that located next to rez (e.g. in the same
+    site-packages) are not importable from rez context.
+
+    """
+
+    def __init__(self, location):
+        self.location = location
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname in ("rez", "rezplugins"):
+            from importlib.machinery import PathFinder
+            return PathFinder.find_spec(fullname, [self.location])
+
+
+@contextmanager
+def rez_context(key, location):
+    """Import rez from location, isolated from other imports
+
+    Rez modules (including vendored ones, which are under `rez.vendor`)
+    that imported in this context are stashed by `key` on exit and restored
+    on next entering. So rez is only imported once per key and won't be
+    seen by other code, same as rez that other code imported won't be seen
+    in this context. Other modules that rez imports, e.g. from standard
+    library, are left in `sys.modules` and shared. Contexts are serialized
+    with a lock, because rez has global states, e.g. config.
+
+    Args:
+        key (str): Identity of the rez import, e.g. revision and environ
+        location (str): Where rez package is located
+
+    """
+    with _lock:
+        saved_modules = {
+            n: sys.modules.pop(n) for n in list(sys.modules)
+            if _is_rez_module(n)
+        }
+        for name, module in _imported.get(key, {}).items():
+            sys.modules.setdefault(name, module)
+        finder = _RezFinder(location)
+        sys.meta_path.insert(0, finder)
+
+        try:
+            yield
+        finally:
+            sys.meta_path.remove(finder)
+            stash = _imported.setdefault(key, dict())
+            for name in list(sys.modules):
+                if _is_rez_module(name):
+                    stash[name] = sys.modules.pop(name)
+            sys.modules.update(saved_modules)
+
+
+def _rez_config(env):
+    """Returns rez config that loaded with given environment
+
+    Same as how rez creates its main config from `os.environ`, but settings
+    that overridden by `REZ_*` env vars are passed as config overrides.
+
+    """
+    from rez.config import Config, get_module_root_config
+
+    filepaths = [get_module_root_config()]
+    filepaths += [
+        p for p in env.get("REZ_CONFIG_FILE", "").split(os.pathsep) if p
+    ]
+    if env.get("REZ_DISABLE_HOME_CONFIG", "").lower() not in ("1", "t",
+                                                              "true"):
+        filepaths.append(os.path.expanduser("~/.rezconfig"))
+
+    overrides = dict()
+    for key, setting_cls in Config.schema._schema.items():
+        key = getattr(key, "_schema", key)  # e.g. `Optional("key")`
+        setting = setting_cls(None, key)
+        value = env.get(setting._env_var_name)
+        if value is not None:
+            overrides[key] = setting._parse_env_var(value)
+            continue
+        value = env.get(setting._env_var_name + "_JSON")
+        if value is not None:
+            overrides[key] = json.loads(value)
+
+    return Config(filepaths, overrides=overrides, locked=True)
+
+
+def resolve_many(key, location, env, items):
+    """Resolve in this process, same as `_actions._resolve_many()`
+
+    The environment is not applied onto `os.environ`, it's passed to rez as
+    config overrides and the parent environment of resolved contexts.
+
+    Raises:
+        ImportError: If rez can not be imported from location, or its config
+            can not be loaded with the environment, e.g. private API that
+            `_rez_config()` relies on has changed.
+
+    """
+    with rez_context(key, location):
+        from rez.resolved_context import ResolvedContext
+        try:
+            from rez.package_repository import package_repository_manager
+        except ImportError:
+            pass
+        else:
+            package_repository_manager.clear_caches()
+
+        try:
+            from rez.config import _replace_config
+            config = _rez_config(env)
+        except (AttributeError, ImportError, TypeError) as e:
+            raise ImportError("Failed to load rez config: %s" % e)
+
+        results = []
+        with _replace_config(config):
+            for requests_or_rxt, save_rxt in items:
+                try:
+                    if os.path.isfile(requests_or_rxt):
+                        context = ResolvedContext.load(requests_or_rxt)
+                    else:
+                        context = ResolvedContext(requests_or_rxt.split(" "))
+                    resolved_env = context.get_environ(parent_environ=env)
+                    if save_rxt:
+                        context.save(save_rxt)
+                    result = {"ok": True, "result": resolved_env}
+                except Exception:
+                    result = {"ok": False, "error": traceback.format_exc()}
+                results.append(result)
+
+        return results
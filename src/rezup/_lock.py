@@ -0,0 +1,240 @@
+
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import logging
+import threading
+
+from .exceptions import ContainerError
+
+
+_log = logging.getLogger("rezup")
+
+
+def pid_exists(pid):
+    """Returns True if process of given pid is alive on this host"""
+    if pid <= 0:
+        return False
+
+    if sys.platform == "win32":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        process_query_limited_information = 0x1000
+        still_active = 259
+
+        handle = kernel32.OpenProcess(
+            process_query_limited_information, 0, pid)
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == still_active
+
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM  # alive, but not ours
+    return True
+
+
+class FileLock(object):
+    """Inter-process exclusive lock that backed by a lock file
+
+    The lock file is created exclusively and stamped with hostname and pid
+    of the owner. While the lock is being held, a heartbeat keeps touching
+    the lock file, so a lock that's left by a crashed process can be told
+    and stolen, either by checking the pid when on the same host, or by the
+    age of last heartbeat.
+
+    ```
+    with FileLock("/path/to/some.lock", timeout=60):
+        ...
+    ```
+
+    Args:
+        path (str or path-like): The lock file path
+        timeout (float, optional): Seconds to wait for the lock, wait
+            forever if `None`.
+        stale_after (float, optional): Seconds without heartbeat for a lock
+            that's owned by other host to be considered as stale.
+        description (str, optional): What the lock is for, for logging.
+
+    """
+    HEARTBEAT = 10
+    POLL_INTERVAL = 0.5
+    REPORT_INTERVAL = 15
+
+    def __init__(self, path, timeout=None, stale_after=120, description=""):
+        self._path = str(path)
+        self._guard = self._path + ".steal"
+        self._timeout = timeout
+        self._stale_after = stale_after
+        self._description = description or self._path
+        self._stamp = None
+        self._heartbeat = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def path(self):
+        return self._path
+
+    def owner(self):
+        """Returns the stamp of current lock owner, or `None` if not locked
+        """
+        try:
+            with open(self._path, "r") as f:
+                return json.load(f)
+        except (OSError, IOError, ValueError):
+            return
+
+    def is_locked(self):
+        """Returns True if the lock is being held and not stale
+        """
+        owner = self.owner()
+        return owner is not None and not self._is_stale(owner)
+
+    def acquire(self, blocking=True):
+        """Acquire the lock
+
+        Args:
+            blocking (bool): Default True. Return immediately if False.
+
+        Returns:
+            bool: True if acquired, or False if not blocking and the lock
+                is being held by other.
+
+        Raises:
+            ContainerError: When timed out.
+
+        """
+        start = time.time()
+        reported = start
+
+        while not self._try_create():
+            owner = self.owner()
+            if owner is not None and self._is_stale(owner):
+                self._steal(owner)
+                continue
+
+            if not blocking:
+                return False
+
+            now = time.time()
+            if self._timeout is not None and now - start > self._timeout:
+                raise ContainerError(
+                    "Timed out after %d seconds waiting for %s, held by %s"
+                    % (self._timeout, self._description, _format(owner))
+                )
+            if now - reported > self.REPORT_INTERVAL:
+                _log.info("Waiting for %s, held by %s (%d sec).."
+                          % (self._description, _format(owner), now - start))
+                reported = now
+
+            time.sleep(self.POLL_INTERVAL)
+
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat)
+        self._heartbeat.daemon = True
+        self._heartbeat.start()
+
+        return True
+
+    def release(self):
+        """Release the lock if being held by this instance"""
+        if self._stamp is None:
+            return
+
+        self._stop.set()
+        self._heartbeat.join()
+        self._heartbeat = None
+
+        if self.owner() == self._stamp:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+        self._stamp = None
+
+    def _try_create(self):
+        stamp = {
+            "hostname": socket.gethostname(),
+            "pid": os.getpid(),
+            "time": time.time(),
+        }
+        dirname = os.path.dirname(self._path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                pass  # possibly created by other process
+
+        try:
+            fd = os.open(self._path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return False
+            raise
+
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(stamp))
+        self._stamp = stamp
+
+        return True
+
+    def _is_stale(self, owner):
+        if owner.get("hostname") == socket.gethostname():
+            return not pid_exists(owner.get("pid", 0))
+
+        try:
+            age = time.time() - os.stat(self._path).st_mtime
+        except OSError:
+            return False
+        return self._stale_after is not None and age > self._stale_after
+
+    def _steal(self, owner):
+        # only one process could steal at a time, so a fresh lock that just
+        # got created by other stealer won't be removed as the stale one.
+        try:
+            fd = os.open(self._guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            try:
+                if time.time() - os.stat(self._guard).st_mtime > 60:
+                    os.remove(self._guard)  # stealer died
+            except OSError:
+                pass
+            time.sleep(self.POLL_INTERVAL)
+            return
+
+        os.close(fd)
+        try:
+            if self.owner() == owner:
+                os.remove(self._path)
+                _log.warning("Stale lock from %s removed: %s"
+                             % (_format(owner), self._path))
+        finally:
+            os.remove(self._guard)
+
+    def _beat(self):
+        while not self._stop.wait(self.HEARTBEAT):
+            try:
+                os.utime(self._path, None)
+            except OSError:
+                pass
+
+
+def _format(owner):
+    if owner is None:
+        return "unknown"
+    return "%s (pid %s)" % (owner.get("hostname"), owner.get("pid"))
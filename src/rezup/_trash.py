@@ -0,0 +1,259 @@
+
+import os
+import sys
+import time
+import stat
+import shutil
+import socket
+import logging
+from multiprocessing.pool import ThreadPool
+
+from ._lock import FileLock
+from ._background import spawn_detached
+
+
+_log = logging.getLogger("rezup")
+
+TRASH_DIRNAME = ".trash"
+_LOCK_NAME = ".lock"
+
+try:
+    _scandir = os.scandir  # py3
+except AttributeError:
+    try:
+        from scandir import scandir as _scandir  # noqa, py2 backport
+    except ImportError:
+        _scandir = None
+
+
+def trash_dir(root):
+    """Returns the trash directory of given container root"""
+    return os.path.join(str(root), TRASH_DIRNAME)
+
+
+def move_to_trash(path, root):
+    """Move path into the trash directory of root by renaming
+
+    Renaming is atomic and instant, the path disappears from its parent
+    right away no matter how many files it has.
+
+    Args:
+        path (str or path-like): File or directory to remove
+        root (str or path-like): The container root that holds `path`
+
+    Returns:
+        str: The path in trash, or None if failed to rename, e.g. `path`
+            and the root are on different devices.
+
+    """
+    path = str(path)
+    trash = trash_dir(root)
+    name = "%s-%s-%d-%d" % (os.path.basename(path),
+                            socket.gethostname(),
+                            os.getpid(),
+                            int(time.time() * 1000))
+    dst = os.path.join(trash, name)
+
+    for _ in range(2):  # trash dir may get removed by the emptying worker
+        try:
+            if not os.path.isdir(trash):
+                os.makedirs(trash)
+            os.rename(path, dst)
+        except OSError as e:
+            error = e
+            continue
+        _log.debug("Moved to trash: %s -> %s" % (path, dst))
+        return dst
+
+    _log.debug("Failed to move %s to trash: %s" % (path, error))
+
+
+def remove(path, root):
+    """Remove path by moving it into trash and empty trash in background
+
+    Falls back to remove in place if the path can not be moved to trash.
+
+    Args:
+        path (str or path-like): File or directory to remove
+        root (str or path-like): The container root that holds `path`
+
+    """
+    if move_to_trash(path, root) is None:
+        shutil.rmtree(str(path))
+    else:
+        empty_in_background(root)
+
+
+def _lock(root):
+    return FileLock(os.path.join(trash_dir(root), _LOCK_NAME),
+                    description="emptying trash %s" % trash_dir(root))
+
+
+def has_garbage(root):
+    """Returns True if there is anything left in the trash of root"""
+    try:
+        names = os.listdir(trash_dir(root))
+    except OSError:
+        return False
+    return any(not n.startswith(_LOCK_NAME) for n in names)
+
+
+def empty_in_background(root):
+    """Empty the trash of root in a detached process
+
+    Nothing will be spawned if the trash is being emptied by other process.
+
+    """
+    if _lock(root).is_locked():
+        return
+    args = [sys.executable, "-m", "rezup._trash", str(root)]
+    pid = spawn_detached(args)
+    _log.debug("Trash emptying process started (pid %d): %s"
+               % (pid, trash_dir(root)))
+
+
+def reclaim(roots):
+    """Empty left over trash of given roots in background
+
+    Trash could be left over if the emptying process got killed, this only
+    costs one `listdir` per root when there's nothing to reclaim.
+
+    Args:
+        roots (list): Container roots
+
+    """
+    for root in roots:
+        if has_garbage(root):
+            empty_in_background(root)
+
+
+def empty_trash(root, jobs=8):
+    """Delete everything in the trash of root
+
+    The trash directory, and the root if it's then empty, will be removed
+    at the end. Returns immediately if the trash is being emptied by other
+    process.
+
+    Args:
+        root (str or path-like): Container root
+        jobs (int): Number of threads for deleting files
+
+    Returns:
+        bool: False if the trash is being emptied by other process.
+
+    """
+    trash = trash_dir(root)
+    if not os.path.isdir(trash):
+        return True
+
+    lock = _lock(root)
+    if not lock.acquire(blocking=False):
+        return False
+
+    pool = ThreadPool(max(1, jobs))
+    try:
+        # keep going until nothing new is coming in
+        while True:
+            names = [n for n in os.listdir(trash)
+                     if not n.startswith(_LOCK_NAME)]
+            if not names:
+                break
+            for name in names:
+                _log.debug("Deleting %s" % os.path.join(trash, name))
+                parallel_rmtree(os.path.join(trash, name), pool)
+    finally:
+        pool.close()
+        pool.join()
+        lock.release()
+
+    # keep tidy, fails if anything got moved in just now
+    for path in (trash, str(root)):
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+    return True
+
+
+def parallel_rmtree(path, pool):
+    """Remove directory tree with a thread pool
+
+    Directories are scanned and their files are unlinked level by level in
+    parallel, then directories are removed from the deepest level up. This
+    is a lot faster than `shutil.rmtree` on network file systems where each
+    call is a round trip.
+
+    Args:
+        path (str): Directory to remove
+        pool (`multiprocessing.pool.ThreadPool`): Threads to work with
+
+    """
+    if os.path.islink(path) or not os.path.isdir(path):
+        _unlink(path)
+        return
+
+    levels = []
+    level = [path]
+    while level:
+        levels.append(level)
+        subdirs = []
+        for dirs in pool.imap_unordered(_unlink_files, level):
+            subdirs += dirs
+        level = subdirs
+
+    for level in reversed(levels):
+        pool.map(_rmdir, level)
+
+    if os.path.isdir(path):
+        # some failed, e.g. permission, try harder in one go
+        shutil.rmtree(path, onerror=_on_rmtree_error)
+
+
+def _unlink_files(dirpath):
+    """Unlink files in directory, returns sub-directories"""
+    subdirs = []
+    try:
+        if _scandir is not None:
+            for entry in _scandir(dirpath):
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    _unlink(entry.path)
+        else:
+            for name in os.listdir(dirpath):
+                path = os.path.join(dirpath, name)
+                if stat.S_ISDIR(os.lstat(path).st_mode):
+                    subdirs.append(path)
+                else:
+                    _unlink(path)
+    except OSError as e:
+        _log.debug("Failed to scan %s: %s" % (dirpath, e))
+    return subdirs
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except OSError:
+        try:
+            os.chmod(path, stat.S_IWRITE)  # read-only file on Windows
+            os.remove(path)
+        except OSError as e:
+            _log.debug("Failed to remove %s: %s" % (path, e))
+
+
+def _rmdir(path):
+    try:
+        os.rmdir(path)
+    except OSError as e:
+        _log.debug("Failed to remove %s: %s" % (path, e))
+
+
+def _on_rmtree_error(func, path, exc_info):
+    _log.error("Failed to remove %s: %s" % (path, exc_info[1]))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for _root in sys.argv[1:]:
+        empty_trash(_root)
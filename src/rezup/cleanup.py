@@ -0,0 +1,237 @@
+
+import os
+import re
+import time
+import logging
+
+from .container import Container, iter_containers
+from .usage import revision_usage
+from ._lock import FileLock
+from ._background import rezup_command, spawn_detached
+
+
+_log = logging.getLogger("rezup")
+
+_age_units = {
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 60 * 60 * 24,
+    "w": 60 * 60 * 24 * 7,
+}
+
+
+def parse_age(value):
+    """Parse age string into seconds
+
+    Age string is a number with optional unit suffix, one of `s`, `m`, `h`,
+    `d` and `w`. Number without unit is in days.
+
+    Example:
+        >>> parse_age("12h")
+        43200.0
+        >>> parse_age("30")  # days
+        2592000.0
+
+    Returns:
+        float: Seconds, or None if value is empty.
+
+    Raises:
+        ValueError: If the value is not a valid age string.
+
+    """
+    if value is None or value == "":
+        return
+    match = re.match(r"^\s*([0-9.]+)\s*([smhdw]?)\s*$", str(value).lower())
+    if not match:
+        raise ValueError("Invalid age: %r" % value)
+    number, unit = match.groups()
+    return float(number) * _age_units[unit or "d"]
+
+
+def format_age(seconds):
+    """Returns age string of given seconds, see `parse_age()`"""
+    for unit in ("w", "d", "h", "m"):
+        if seconds >= _age_units[unit]:
+            return "%g%s" % (round(seconds / _age_units[unit], 2), unit)
+    return "%gs" % seconds
+
+
+def get_policy():
+    """Returns retention policy that configured by environment variables
+
+    * `$REZUP_CLEAN_AFTER`: Max age of revisions, see `parse_age()`.
+    * `$REZUP_CLEAN_KEEP`: Max count of ready revisions per container.
+
+    Returns:
+        dict: Keyword arguments for `find_garbage()`.
+
+    """
+    keep = os.getenv("REZUP_CLEAN_KEEP")
+    return {
+        "max_age": parse_age(os.getenv("REZUP_CLEAN_AFTER")),
+        "keep": int(keep) if keep else None,
+    }
+
+
+def is_auto_clean_enabled():
+    """Returns True if any retention policy is configured by env vars"""
+    return bool(os.getenv("REZUP_CLEAN_AFTER")
+                or os.getenv("REZUP_CLEAN_KEEP"))
+
+
+def clean_in_background(container):
+    """Run garbage collection on container in a detached process
+
+    Args:
+        container (Container): The local container to clean
+
+    """
+    args = rezup_command("gc", container.name())
+    log_file = container.locks() / "gc.log"
+    pid = spawn_detached(args, log_file=log_file)
+    _log.debug("Background cleaning process started (pid %d), log file: "
+               "%s" % (pid, log_file))
+
+
+def find_garbage(container, max_age=None, keep=None, unreferenced=False):
+    """Find local revisions that violate retention policy
+
+    The latest ready revision, the local counterpart of latest ready remote
+    revision, and revisions that are in use will never be collected.
+
+    Args:
+        container (Container): The local container to look into
+        max_age (float, optional): Revisions that are older than this (in
+            seconds) are collected.
+        keep (int, optional): Ready revisions beyond this count (latest
+            first) are collected.
+        unreferenced (bool, optional): Revisions that do not exist in the
+            remote container are collected. Ignored if container has no
+            remote.
+
+    Returns:
+        list: A list of tuple that contains the revision and the reason of
+            collecting.
+
+    """
+    assert not container.is_remote(), "Only local container can be cleaned."
+
+    revisions = list(container.iter_revision())
+    ready = [r for r in revisions if r.is_ready()]
+    protected = set(r.dirname() for r in ready[:1])
+
+    remote_revs = None
+    remote = Container(container.name(), recipe=container.recipe())
+    if remote.is_remote():
+        remote_revs = list(remote.iter_revision())
+        remote_latest = next((r for r in remote_revs if r.is_ready()), None)
+        if remote_latest is not None:
+            protected.add(remote_latest.dirname())
+        remote_revs = set(r.dirname() for r in remote_revs)
+
+    now = time.time()
+    garbage = []
+    for revision in revisions:
+        if revision.dirname() in protected:
+            continue
+
+        reason = None
+        if max_age is not None \
+                and now - float(revision.dirname()) > max_age:
+            reason = "older than %s" % format_age(max_age)
+        elif keep is not None and revision in ready \
+                and ready.index(revision) >= keep:
+            reason = "beyond %d latest revisions" % keep
+        elif unreferenced and remote_revs is not None \
+                and revision.dirname() not in remote_revs:
+            reason = "not in remote"
+
+        if reason is None:
+            continue
+        if revision.is_in_use():
+            _log.debug("Revision in use, skipped: %s" % revision.path())
+            continue
+
+        garbage.append((revision, reason))
+
+    return garbage
+
+
+def collect(names=None,
+            max_age=None,
+            keep=None,
+            unreferenced=False,
+            dry_run=False):
+    """Remove local revisions that violate retention policy
+
+    Containers that are being cleaned by other process will be skipped.
+
+    Args:
+        names (list, optional): Container names to clean, all containers if
+            not given.
+        max_age (float, optional): See `find_garbage()`.
+        keep (int, optional): See `find_garbage()`.
+        unreferenced (bool, optional): See `find_garbage()`.
+        dry_run (bool, optional): Only report, not removing anything.
+
+    Yields:
+        dict: Result of each collected revision.
+
+    """
+    for container in iter_containers():
+        if container.is_remote():
+            continue
+        if names and container.name() not in names:
+            continue
+        if not container.is_exists():
+            continue
+
+        gc_lock = FileLock(container.locks() / "gc.lock",
+                           description="container %s cleaning"
+                           % container.name())
+        if not dry_run and not gc_lock.acquire(blocking=False):
+            _log.info("Container %r is being cleaned by other process."
+                      % container.name())
+            continue
+
+        try:
+            garbage = find_garbage(container,
+                                   max_age=max_age,
+                                   keep=keep,
+                                   unreferenced=unreferenced)
+            for revision, reason in garbage:
+                result = {
+                    "container": container.name(),
+                    "revision": revision.dirname(),
+                    "path": str(revision.path()),
+                    "reason": reason,
+                    # space that will be freed, hardlinked files that are
+                    #   shared with other revisions are excluded
+                    "size": revision_usage(revision)["unique"],
+                    "removed": False,
+                }
+                if not dry_run:
+                    result["removed"] = _purge(revision)
+                yield result
+        finally:
+            if not dry_run:
+                gc_lock.release()
+
+
+def _purge(revision):
+    # prevent the revision from being re-pulled while removing
+    lock = revision.build_lock()
+    if not lock.acquire(blocking=False):
+        _log.info("Revision is being built, skipped: %s" % revision.path())
+        return False
+    try:
+        # leases are taken under the same lock, see `Revision.spawn_shell()`
+        if revision.active_leases():
+            _log.info("Revision in use, skipped: %s" % revision.path())
+            return False
+        _log.info("Removing revision: %s" % revision.path())
+        revision.purge()
+    finally:
+        lock.release()
+    return True
@@ -1,8 +1,10 @@
 
 import os
 import sys
+import time
 import click
 import logging
+from datetime import datetime
 from . import get_rezup_version, __version__
 from .container import Container, iter_containers
 
@@ -108,16 +110,38 @@ def cli(ctx):
     _disable_rezup_if_entered(ctx)
 
 
+def _reclaim_trash(names=None):
+    """Empty trash that left over by dead emptying process in background
+
+    Args:
+        names (tuple, optional): Container names, all if not given.
+
+    """
+    from ._trash import reclaim
+
+    try:
+        reclaim(set(str(c.root()) for c in iter_containers()
+                    if not names or c.name() in names))
+    except Exception as e:
+        _log.debug("Failed to reclaim trash: %s" % e)  # never get in the way
+
+
 @cli.command(options_metavar="[NAME] [OPTIONS] [-- commands..]")
 @click.argument("name", nargs=1, default=_default_cname, metavar="")
 @click.option("-l", "--local", is_flag=True,
               help="Enforce using local container")
 @click.option("-n", "--no-wait", is_flag=True,
               help="Not waiting '-- {command}' to complete")
+@click.option("-s", "--stale", is_flag=True,
+              help="Use older local revision if latest remote revision is "
+                   "not pulled yet, and pull it in background. "
+                   "($REZUP_USE_STALE)")
+@click.option("-c", "--context", metavar="KEY",
+              help="Enter prewarmed Rez context that listed in recipe")
 @_cli_debug_option
 @click.help_option("-h", "--help")
 @click.pass_context
-def use(ctx, name, local, no_wait):
+def use(ctx, name, local, no_wait, stale, context=None):
     """Step into a container.
 
     This will open a sub-shell which has Rez venv ready to use. Simply
@@ -145,20 +169,52 @@ def use(ctx, name, local, no_wait):
         - not waiting the command process to complete
         $ rezup use foo --no-wait -- {command}
 
+        \b
+        - launch immediately with previous revision if latest one is not
+          pulled yet, latest one will be pulled in background for next use
+        $ rezup use foo --stale
+
+        \b
+        - enter Rez context 'maya' that prewarmed in revision, no solving
+        $ rezup use foo --context maya
+
     \f
     Args:
         ctx (click.Context): click's internal context object
         name (str): container name
         local (bool): ignore remote and use local container
         no_wait (bool): not waiting '-- {command}' to complete
+        stale (bool): use stale local revision while pulling latest one
+        context (str): prewarmed context key
 
     """
     ctx.obj["wait"] = not no_wait
+    stale = stale or bool(os.getenv("REZUP_USE_STALE"))
 
     container = Container(name, force_local=local)
     revision = container.get_latest_revision()
 
-    if revision:
+    if revision and revision.is_remote() and stale:
+        revision = revision.pull(stale=True)
+
+    if revision and context:
+        from .prewarm import get_context
+
+        if revision.is_remote():
+            revision = revision.pull()
+        rxt = get_context(revision, context) if revision else None
+        if rxt is None:
+            _log.error("Prewarmed context %r not available in container "
+                       "'%s'." % (context, container.name()))
+            ctx.exit(1)
+
+        job = ctx.obj["job"]
+        command = ["rez-env", "--input", rxt] + (["--"] + job if job else [])
+        ctx.exit(
+            revision.use(command=command, wait=ctx.obj["wait"] or not job)
+        )
+
+    elif revision:
         ctx.exit(
             revision.use(command=ctx.obj["job"], wait=ctx.obj["wait"])
         )
@@ -236,6 +292,534 @@ def add(ctx, name=_default_cname, remote=False, skip_use=False):
         )
 
 
+@cli.command(options_metavar="[NAME] [OPTIONS]")
+@click.argument("name", nargs=1, default=_default_cname, metavar="")
+@click.option("-r", "--revision", help="Remote revision to pull (timestamp "
+                                       "directory name), default latest.")
+@click.option("-n", "--no-wait", is_flag=True,
+              help="Exit if the revision is being pulled by other process.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+@click.pass_context
+def pull(ctx, name, revision=None, no_wait=False):
+    """Pull remote revision into local.
+
+    Create local revision from remote container revision if not exists,
+    without stepping into it.
+
+    Examples:
+
+        \b
+        - pull latest revision of remote container '.main'
+        $ rezup pull
+
+        \b
+        - pull specific revision of remote container 'foo'
+        $ rezup pull foo --revision 1619780350.58
+
+    \f
+    Args:
+        ctx (click.Context): click's internal context object
+        name (str): container name
+        revision (str): remote revision directory name
+        no_wait (bool): exit if revision is being pulled by other process
+
+    """
+    container = Container(name)
+    if not container.is_remote():
+        _log.error("Container '%s' is not linked to remote." % name)
+        ctx.exit(1)
+
+    if revision:
+        try:
+            timestamp = datetime.fromtimestamp(float(revision))
+        except ValueError:
+            _log.error("Invalid revision: %s" % revision)
+            ctx.exit(1)
+        remote_rev = container.get_revision_by_time(timestamp)
+    else:
+        remote_rev = container.get_latest_revision()
+
+    if remote_rev is None:
+        _log.error("No valid revision in remote container '%s': %s"
+                   % (name, container.path()))
+        ctx.exit(1)
+
+    if remote_rev.pull(blocking=not no_wait) is None:
+        _log.info("Revision %s is being pulled by other process."
+                  % remote_rev.dirname())
+
+
+@cli.command(options_metavar="[NAME...] [OPTIONS]")
+@click.argument("names", nargs=-1, metavar="")
+@click.option("-j", "--jobs", type=int, default=4, show_default=True,
+              help="Max number of revisions being pulled at the same time.")
+@click.option("-b", "--backfill", type=int, default=1, show_default=True,
+              help="Pull K latest ready revisions of each remote container.")
+@click.option("--normal-priority", is_flag=True,
+              help="Not lowering CPU/IO priority of pulling processes.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+@click.pass_context
+def sync(ctx, names, jobs=4, backfill=1, normal_priority=False):
+    """Pull latest remote revisions of all containers into local.
+
+    Find latest ready revision of each remote container and pull into
+    local if not exists, in parallel. Result of each container is printed
+    to stdout as one JSON line, in the order of completion.
+
+    Examples:
+
+        \b
+        - pull latest revisions of all remote containers
+        $ rezup sync
+
+        \b
+        - pull latest 3 revisions of container 'foo' and 'bar'
+        $ rezup sync foo bar --backfill 3
+
+    \f
+    Args:
+        ctx (click.Context): click's internal context object
+        names (tuple): container names, all remote containers if empty
+        jobs (int): max number of revisions being pulled at the same time
+        backfill (int): pull K latest ready revisions of each container
+        normal_priority (bool): not lowering pulling processes' priority
+
+    """
+    import json
+    from .sync import sync as _sync
+
+    failed = False
+    for result in _sync(names=names,
+                        jobs=jobs,
+                        backfill=backfill,
+                        low_priority=not normal_priority):
+        failed = failed or result["status"] != "ok"
+        click.echo(json.dumps(result))
+
+    ctx.exit(1 if failed else 0)
+
+
+@cli.command(options_metavar="[NAME...] [OPTIONS]")
+@click.argument("names", nargs=-1, metavar="")
+@click.option("-j", "--jobs", type=int, default=2, show_default=True,
+              help="Max number of revisions being pulled at the same time.")
+@click.option("--min-interval", type=float, default=5, show_default=True,
+              help="Min seconds between checking remote containers.")
+@click.option("--max-interval", type=float, default=300, show_default=True,
+              help="Max seconds between checking remote containers.")
+@click.option("--max-load", type=float, default=None,
+              help="Defer pulling while 1-minute load average is above this.")
+@click.option("--normal-priority", is_flag=True,
+              help="Not lowering CPU/IO priority of pulling processes.")
+@click.option("--status-file", type=click.Path(), default=None,
+              help="Where the daemon status JSON goes. Default is "
+                   "'daemon.json' in local root of default container.")
+@click.option("-s", "--status", is_flag=True,
+              help="Print status of running daemon and exit.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+@click.pass_context
+def daemon(ctx,
+           names,
+           jobs=2,
+           min_interval=5,
+           max_interval=300,
+           max_load=None,
+           normal_priority=False,
+           status_file=None,
+           status=False):
+    """Keep pulling new remote revisions into local.
+
+    Watch remote containers and pull newly published revisions into local
+    as soon as they are ready, so launching never has to wait for pulling.
+    Stop with Ctrl+C or SIGTERM.
+
+    Examples:
+
+        \b
+        - watch all remote containers
+        $ rezup daemon
+
+        \b
+        - watch container 'foo', pull when machine is not busy
+        $ rezup daemon foo --max-load 8
+
+        \b
+        - print status of running daemon, e.g. the pulling queue
+        $ rezup daemon --status
+
+    \f
+    Args:
+        ctx (click.Context): click's internal context object
+        names (tuple): container names, all remote containers if empty
+        jobs (int): max number of revisions being pulled at the same time
+        min_interval (float): min seconds between checks
+        max_interval (float): max seconds between checks
+        max_load (float): defer pulling while load average is above this
+        normal_priority (bool): not lowering pulling processes' priority
+        status_file (str): where the daemon status JSON goes
+        status (bool): print status of running daemon and exit
+
+    """
+    from .daemon import Daemon, default_status_file
+
+    if status:
+        status_file = status_file or default_status_file()
+        if not os.path.isfile(str(status_file)):
+            _log.error("Daemon status file not found: %s" % status_file)
+            ctx.exit(1)
+        with open(str(status_file), "r") as f:
+            click.echo(f.read())
+        return
+
+    Daemon(names=names,
+           jobs=jobs,
+           min_interval=min_interval,
+           max_interval=max_interval,
+           max_load=max_load,
+           low_priority=not normal_priority,
+           status_file=status_file).run()
+
+
+@cli.command(options_metavar="[NAME...] [OPTIONS]")
+@click.argument("names", nargs=-1, metavar="")
+@click.option("-a", "--max-age",
+              help="Remove revisions older than this, e.g. '30d', '12h'. "
+                   "($REZUP_CLEAN_AFTER)")
+@click.option("-k", "--keep", type=int, default=None,
+              help="Remove ready revisions beyond this count per container. "
+                   "($REZUP_CLEAN_KEEP)")
+@click.option("-u", "--unreferenced", is_flag=True,
+              help="Remove revisions that do not exist in remote container.")
+@click.option("-n", "--dry-run", is_flag=True,
+              help="Only report what would be removed and reclaimable bytes.")
+@click.option("--json", "as_json", is_flag=True,
+              help="Print one JSON object per revision.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+@click.pass_context
+def gc(ctx,
+       names,
+       max_age=None,
+       keep=None,
+       unreferenced=False,
+       dry_run=False,
+       as_json=False):
+    """Remove stale local revisions.
+
+    Remove local revisions that violate any given retention policy. The
+    latest ready revision, the one that matches latest remote revision and
+    revisions that are in use are always kept.
+
+    Policy not given by option is sourced from environment variables, and
+    if any of those env vars is set, this will also be run in background
+    after a local revision is created. Trash that left over by interrupted
+    removal is emptied in background as well.
+
+    Examples:
+
+        \b
+        - see how much space could be reclaimed
+        $ rezup gc --max-age 30d --dry-run
+
+        \b
+        - keep only latest 3 revisions in container 'foo'
+        $ rezup gc foo --keep 3
+
+    \f
+    Args:
+        ctx (click.Context): click's internal context object
+        names (tuple): container names, all local containers if empty
+        max_age (str): remove revisions older than this
+        keep (int): remove ready revisions beyond this count
+        unreferenced (bool): remove revisions that not exist in remote
+        dry_run (bool): only report, not removing anything
+        as_json (bool): print JSON lines instead of text
+
+    """
+    import json
+    from .cleanup import collect, get_policy, parse_age
+    from .usage import format_size
+
+    policy = get_policy()
+    try:
+        if max_age:
+            policy["max_age"] = parse_age(max_age)
+    except ValueError as e:
+        _log.error(str(e))
+        ctx.exit(1)
+    if keep is not None:
+        policy["keep"] = keep
+
+    if not (policy["max_age"] or policy["keep"] is not None or unreferenced):
+        _log.error("No retention policy given.")
+        ctx.exit(1)
+
+    if not dry_run:
+        _reclaim_trash(names)
+
+    total = 0
+    for result in collect(names=names,
+                          unreferenced=unreferenced,
+                          dry_run=dry_run,
+                          **policy):
+        total += result["size"]
+        if as_json:
+            click.echo(json.dumps(result))
+        else:
+            click.echo("%s %s  %s  (%s)%s" % (
+                result["container"],
+                result["revision"],
+                format_size(result["size"]),
+                result["reason"],
+                "" if dry_run or result["removed"] else "  SKIPPED",
+            ))
+
+    if not as_json:
+        click.echo("%s %s" % ("Reclaimable:" if dry_run else "Reclaimed:",
+                              format_size(total)))
+
+
+@cli.command()
+@click.argument("names", nargs=-1)
+@click.option("-j", "--jobs", type=int, default=8, show_default=True,
+              help="Number of threads for scanning files.")
+@click.option("-r", "--refresh", is_flag=True,
+              help="Measure all revisions again, ignore cached results.")
+@click.option("--json", "as_json", is_flag=True,
+              help="Print one JSON object per revision per line.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+def du(names, jobs=8, refresh=False, as_json=False):
+    """Show disk usage of local revisions.
+
+    Files are deduplicated by inode. Unique bytes will be freed once the
+    revision is removed, shared bytes are hardlinked with files outside of
+    the revision. Results are cached, only new or changed revisions will
+    be measured.
+
+    Examples:
+
+        \b
+        - show disk usage of all local containers
+        $ rezup du
+
+        \b
+        - measure revisions of container 'foo' again
+        $ rezup du foo --refresh
+
+    \f
+    Args:
+        names (tuple): container names, all local containers if empty
+        jobs (int): number of threads for scanning files
+        refresh (bool): measure all revisions again
+        as_json (bool): print JSON lines instead of a table
+
+    """
+    import json
+    from multiprocessing.pool import ThreadPool
+    from .usage import usage_of, format_size
+
+    info_line = " {time: <19}|{size: >11} |{unique: >11} |{shared: >11} " \
+                "|{files: >8}"
+
+    pool = ThreadPool(max(1, jobs))
+    try:
+        for container in iter_containers():
+            if container.is_remote() or not container.is_exists():
+                continue
+            if names and container.name() not in names:
+                continue
+
+            revisions = list(container.iter_revision())
+            results = usage_of(revisions, refresh=refresh, pool=pool)
+
+            if not as_json:
+                print("Container: %s (%s)"
+                      % (container.name(), container.path()))
+                print(info_line.format(time="Timestamp", size="Size",
+                                       unique="Unique", shared="Shared",
+                                       files="Files"))
+                print("-" * 69)
+
+            unique = shared = 0
+            for revision, usage in results:
+                unique += usage["unique"]
+                shared += usage["shared"]
+                if as_json:
+                    print(json.dumps({
+                        "container": container.name(),
+                        "revision": revision.dirname(),
+                        "path": str(revision.path()),
+                        "size": usage["size"],
+                        "unique": usage["unique"],
+                        "shared": usage["shared"],
+                        "files": usage["files"],
+                    }))
+                else:
+                    print(info_line.format(
+                        time=revision.dirname(),
+                        size=format_size(usage["size"]),
+                        unique=format_size(usage["unique"]),
+                        shared=format_size(usage["shared"]),
+                        files=usage["files"],
+                    ))
+                sys.stdout.flush()
+
+            if not as_json:
+                print("Total: %s unique, %s shared"
+                      % (format_size(unique), format_size(shared)))
+                print("")
+    finally:
+        pool.close()
+        pool.join()
+
+
+@cli.command(options_metavar="[NAME...] [OPTIONS]")
+@click.argument("names", nargs=-1, metavar="")
+@click.option("-r", "--revision",
+              help="Only verify this revision (timestamp directory name).")
+@click.option("-j", "--jobs", type=int, default=8, show_default=True,
+              help="Number of threads for hashing files.")
+@click.option("--repair", is_flag=True,
+              help="Rebuild venvs that failed verification.")
+@click.option("--json", "as_json", is_flag=True,
+              help="Print one JSON object per revision per line.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+@click.pass_context
+def verify(ctx, names, revision=None, jobs=8, repair=False, as_json=False):
+    """Verify integrity of local revisions.
+
+    Hash every installed file against distribution's RECORD and production
+    scripts against what recorded at build time. Files that have not been
+    modified since last verified are skipped. Exit with code 1 if any
+    revision failed and not repaired.
+
+    Examples:
+
+        \b
+        - verify all local revisions
+        $ rezup verify
+
+        \b
+        - verify revisions of container 'foo' and rebuild broken venvs
+        $ rezup verify foo --repair
+
+    \f
+    Args:
+        ctx (click.Context): click's internal context object
+        names (tuple): container names, all local containers if empty
+        revision (str): only verify this revision
+        jobs (int): number of threads for hashing files
+        repair (bool): rebuild venvs that failed verification
+        as_json (bool): print JSON lines instead of text
+
+    """
+    import json
+    from .verify import verify as _verify
+    from .exceptions import ContainerError
+
+    failed = False
+    results = _verify(names, revision=revision, jobs=jobs, repair=repair)
+    while True:
+        try:
+            result = next(results)
+        except StopIteration:
+            break
+        except ContainerError as e:
+            _log.error(str(e))
+            ctx.exit(1)
+
+        broken = set(f["venv"] for f in result["failures"])
+        if broken - set(result["repaired"]):
+            failed = True
+
+        if as_json:
+            click.echo(json.dumps(result))
+            continue
+
+        click.echo("%s %s  %s  (%d files, %d hashed)" % (
+            result["container"],
+            result["revision"],
+            "FAILED" if result["failures"] else "OK",
+            result["checked"],
+            result["hashed"],
+        ))
+        for failure in result["failures"]:
+            click.echo("    [%s] %s: %s" % (failure["venv"],
+                                            failure["reason"],
+                                            failure["path"]))
+        for venv_name in result["repaired"]:
+            click.echo("    venv %r rebuilt." % venv_name)
+
+    if failed:
+        ctx.exit(1)
+
+
+@cli.command(options_metavar="[NAME...] [OPTIONS]")
+@click.argument("names", nargs=-1, metavar="")
+@click.option("-r", "--revision",
+              help="Only prewarm this revision (timestamp directory name).")
+@click.option("-f", "--force", is_flag=True,
+              help="Prewarm everything even it's up to date.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+def prewarm(names, revision=None, force=False):
+    """Re-bake rez config and re-resolve contexts of local revisions.
+
+    Redo the prewarming that enabled in recipe, if it's outdated since the
+    revision was built. E.g. the rez config files have been modified, or
+    packages have been released.
+
+    Examples:
+
+        \b
+        - re-bake rez config of all local revisions if config changed
+        $ rezup prewarm
+
+        \b
+        - prewarm everything in revisions of container 'foo'
+        $ rezup prewarm foo --force
+
+    \f
+    Args:
+        names (tuple): container names, all local containers if empty
+        revision (str): only prewarm this revision
+        force (bool): prewarm everything even it's up to date
+
+    """
+    from .container import Container, iter_containers
+    from .prewarm import prewarm_revision
+
+    if names:
+        containers = [Container(n, force_local=True) for n in names]
+    else:
+        containers = iter_containers()
+
+    for container in containers:
+        if container.is_remote() or not container.is_exists():
+            continue
+
+        for rev in container.iter_revision():
+            if revision and rev.dirname() != revision:
+                continue
+            if not rev.is_ready():
+                continue
+
+            result = prewarm_revision(rev, force=force)
+            done = []
+            if result["config"]:
+                done.append("config baked")
+            if result["contexts"]:
+                done.append("contexts: " + ", ".join(result["contexts"]))
+            click.echo("%s %s  %s" % (container.name(),
+                                      rev.dirname(),
+                                      "; ".join(done) or "up to date"))
+
+
 @cli.command()
 @click.argument("name", nargs=1)
 @_cli_debug_option
@@ -244,7 +828,8 @@ def drop(name):
     """Remove a container.
 
     Remove entire container from disk. This command isn't ready yet, use
-    with caution.
+    with caution. Container that has revision being built or used by any
+    running process will not be removed.
 
     Examples:
 
@@ -261,11 +846,231 @@ def drop(name):
     container.purge()
 
 
+@cli.command(options_metavar="[NAME] [OPTIONS]")
+@click.argument("name", nargs=1, default=_default_cname, metavar="")
+@click.option("-l", "--local", is_flag=True,
+              help="Enforce listing local container.")
+@click.option("--since",
+              help="Revisions created since, e.g. '7d', '2021-05-01'.")
+@click.option("--until",
+              help="Revisions created before, e.g. '1d', '2021-06-01'.")
+@click.option("--rez", help="Rez version spec, e.g. '>=2.110,<3'.")
+@click.option("--creator", help="Revisions created by this user.")
+@click.option("--hostname", help="Revisions created on this host.")
+@click.option("--recipe", "recipe_hash",
+              help="Recipe content hash, or prefix of it.")
+@click.option("--ready/--not-ready", default=None,
+              help="Filter by readiness.")
+@click.option("-s", "--sort", "sort_by", default="timestamp",
+              show_default=True,
+              type=click.Choice(["timestamp", "rez", "creator", "hostname"]),
+              help="Sort revisions by field.")
+@click.option("-r", "--reverse", is_flag=True,
+              help="Oldest (or smallest) first.")
+@click.option("--json", "as_json", is_flag=True,
+              help="Print one JSON object per revision per line.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+@click.pass_context
+def ls(ctx,
+       name,
+       local=False,
+       since=None,
+       until=None,
+       rez=None,
+       creator=None,
+       hostname=None,
+       recipe_hash=None,
+       ready=None,
+       sort_by="timestamp",
+       reverse=False,
+       as_json=False):
+    """List revisions of a container.
+
+    Revisions are filtered and sorted by their metadata through container's
+    revision manifest, without reading each revision from disk.
+
+    Examples:
+
+        \b
+        - list revisions of default container
+        $ rezup ls
+
+        \b
+        - revisions of 'foo' built with rez >= 2.110 by 'david' in last week
+        $ rezup ls foo --rez ">=2.110" --creator david --since 7d
+
+    \f
+    Args:
+        ctx (click.Context): click's internal context object
+        name (str): container name
+        local (bool): list local container even if remote exists
+        since (str): age string or date, revisions created since
+        until (str): age string or date, revisions created before
+        rez (str): rez version spec
+        creator (str): user name who created the revisions
+        hostname (str): host where the revisions were created
+        recipe_hash (str): recipe content hash or prefix of it
+        ready (bool): filter by readiness if not None
+        sort_by (str): field for sorting revisions
+        reverse (bool): ascending order if True
+        as_json (bool): print JSON lines instead of a table
+
+    """
+    import json
+
+    try:
+        since = _parse_time(since)
+        until = _parse_time(until)
+        revisions = Container(name, force_local=local).query(
+            since=since,
+            until=until,
+            rez=rez,
+            creator=creator,
+            hostname=hostname,
+            recipe_hash=recipe_hash,
+            ready=ready,
+            sort_by=sort_by,
+            latest_first=not reverse,
+        )
+    except ValueError as e:
+        _log.error(str(e))
+        ctx.exit(1)
+
+    info_line = " {time: <19}| {date: <15} |{ready: ^7}|{rez: ^10}| " \
+                "{creator: <10} | {hostname: <16} | {recipe}"
+    if not as_json:
+        print(info_line.format(time="Timestamp", date="Date", ready="Ready",
+                               rez="Rez", creator="Creator",
+                               hostname="Hostname", recipe="Recipe"))
+        print("-" * 100)
+
+    for revision in revisions:
+        metadata = revision.metadata() or {}
+        stat = {
+            "container": name,
+            "timestamp": revision.dirname(),
+            "date": revision.time_str(),
+            "ready": revision.is_ready(),
+            "remote": revision.is_remote(),
+            "path": str(revision.path()),
+            "rez": metadata.get("rez_version"),
+            "creator": metadata.get("creator"),
+            "hostname": metadata.get("hostname"),
+            "recipe_hash": revision.recipe_hash(),
+        }
+        if as_json:
+            print(json.dumps(stat))
+        else:
+            print(info_line.format(
+                time=stat["timestamp"],
+                date=stat["date"],
+                ready="O" if stat["ready"] else "-",
+                rez=stat["rez"] or "?",
+                creator=stat["creator"] or "?",
+                hostname=stat["hostname"] or "?",
+                recipe=stat["recipe_hash"][:12],
+            ))
+
+
+@cli.command("which-revisions", options_metavar="PKG[SPEC] [OPTIONS]")
+@click.argument("requirement", required=False, metavar="")
+@click.option("--rebuild", is_flag=True,
+              help="Rebuild package index from local revisions first.")
+@click.option("--json", "as_json", is_flag=True,
+              help="Print one JSON object per match per line.")
+@_cli_debug_option
+@click.help_option("-h", "--help")
+@click.pass_context
+def which_revisions(ctx, requirement=None, rebuild=False, as_json=False):
+    """Find revisions that have specific package installed.
+
+    Look up local revisions of all containers from the package index of
+    each local root, which is updated when revisions are created or
+    removed. Revisions pulled from remote are marked.
+
+    Examples:
+
+        \b
+        - find revisions that have requests 2.25.1 installed
+        $ rezup which-revisions "requests==2.25.1"
+
+        \b
+        - index revisions that created by older rezup, and look up
+        $ rezup which-revisions "rez>=2.110,<3" --rebuild
+
+    \f
+    Args:
+        ctx (click.Context): click's internal context object
+        requirement (str): package name with optional version spec
+        rebuild (bool): rebuild package index first
+        as_json (bool): print JSON lines instead of a table
+
+    """
+    import json
+    from . import packages
+
+    if rebuild:
+        packages.rebuild()
+    if not requirement:
+        if not rebuild:
+            _log.error("No package given.")
+            ctx.exit(1)
+        return
+
+    try:
+        results = packages.find(requirement)
+    except ValueError as e:
+        _log.error(str(e))
+        ctx.exit(1)
+
+    info_line = " {container: <10} | {time: <19}|{remote: ^8}| {venv: <10} " \
+                "| {package}"
+    if not as_json:
+        print(info_line.format(container="Container", time="Timestamp",
+                               remote="Remote", venv="Venv",
+                               package="Package"))
+        print("-" * 80)
+
+    for result in results:
+        if as_json:
+            print(json.dumps(result))
+        else:
+            print(info_line.format(
+                container=result["container"],
+                time=result["revision"],
+                remote="O" if result["pulled_from"] else "-",
+                venv=result["venv"],
+                package="%s==%s" % (result["name"], result["version"]),
+            ))
+
+
+def _parse_time(value):
+    """Parse age string (e.g. '7d') or date into seconds since epoch"""
+    if not value:
+        return
+    from .cleanup import parse_age
+    try:
+        return time.time() - parse_age(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M"):
+        try:
+            return time.mktime(datetime.strptime(value, fmt).timetuple())
+        except ValueError:
+            continue
+    raise ValueError("Invalid time: %r" % value)
+
+
 @cli.command()
 @click.argument("name", nargs=1, required=False)
+@click.option("-j", "--jobs", type=int, default=8, show_default=True,
+              help="Number of threads for collecting status.")
+@click.option("--json", "as_json", is_flag=True,
+              help="Print one JSON object per line instead of a table.")
 @_cli_debug_option
 @click.help_option("-h", "--help")
-def status(name=None):
+def status(name=None, jobs=8, as_json=False):
     """Show status of containers.
 
     Displaying some useful info about current visible containers..
@@ -280,26 +1085,55 @@ def status(name=None):
         - show detailed info of specific container
         $ rezup status foo
 
+        \b
+        - machine-readable output, one JSON object per line
+        $ rezup status --json
+
     \f
     Args:
         name (str): show status of specific container if name given
+        jobs (int): number of threads for collecting status
+        as_json (bool): print JSON lines instead of a table
 
     """
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(max(1, jobs))
+    try:
+        _status(pool, name, as_json)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _status(pool, name, as_json):
+    import json
+    from .usage import read_cache, get_cached, format_size
+
     if name is None:
         # show overall status
 
-        print("   Name   | Is Remote | Rev Count | Root     ")
-        print("---------------------------------------------")
-        stat_line = "{name: ^10} {remote: ^11} {rev_count: ^11} {root}"
-
-        for con in iter_containers():
-            stat = {
+        def container_stat(con):
+            return {
                 "name": con.name(),
-                "remote": "O" if con.is_remote() else "-",
+                "remote": con.is_remote(),
                 "rev_count": len(list(con.iter_revision())),
-                "root": con.root(),
+                "root": str(con.root()),
             }
-            print(stat_line.format(**stat))
+
+        if not as_json:
+            print("   Name   | Is Remote | Rev Count | Root     ")
+            print("---------------------------------------------")
+        stat_line = "{name: ^10} {remote: ^11} {rev_count: ^11} {root}"
+
+        # rows are printed as soon as they are ready
+        for stat in pool.imap_unordered(container_stat, iter_containers()):
+            if as_json:
+                print(json.dumps(stat))
+            else:
+                stat["remote"] = "O" if stat["remote"] else "-"
+                print(stat_line.format(**stat))
+            sys.stdout.flush()
 
     else:
         # show specific container info
@@ -312,18 +1146,26 @@ def status(name=None):
             local_con = con
             remote_con = None
 
-        print("Container: %s" % name)
-
         if remote_con is None and not local_con.is_exists():
-            print("NOT EXISTS.")
+            if as_json:
+                print(json.dumps({"container": name, "exists": False}))
+            else:
+                print("Container: %s" % name)
+                print("NOT EXISTS.")
             return
 
-        print("    Local: %s" % local_con.path())
-        print("   Remote: %s" % (remote_con.path() if remote_con else "-"))
-        print("")
-        print(" Local | Remote |   Rez   |       Date      | Timestamp    ")
-        print("-----------------------------------------------------------")
-        info_line = "{l: ^7}|{r: ^8}|{rez: ^9}| {date} | {time}"
+        if not as_json:
+            print("Container: %s" % name)
+            print("    Local: %s" % local_con.path())
+            print("   Remote: %s"
+                  % (remote_con.path() if remote_con else "-"))
+            print("")
+            print(" Local | Remote |   Rez   | Users |    Size    |"
+                  "       Date      | Timestamp    ")
+            print("-------------------------------------------------------"
+                  "--------------------------")
+        info_line = "{l: ^7}|{r: ^8}|{rez: ^9}|{users: ^7}|{size: >11} " \
+                    "| {date} | {time}"
 
         # sort and paring revisions
         # https://gist.github.com/davidlatwe/a729e06c54b712db72516d17fdbcbe98
@@ -344,23 +1186,50 @@ def status(name=None):
                     paired_revs["R"].append(None)
                     paired_revs["L"].append(rev)
 
-        # print out
-        for i, local in enumerate(paired_revs["L"]):
-            remote = paired_revs["R"][i]
-
-            if local is None and remote is None:
-                continue  # not likely to happen
+        # cached only, run `rezup du` to measure
+        usage_cache = read_cache(local_con)
 
+        def revision_stat(pair):
+            local, remote = pair
             data = local or remote
-            info = {
-                "l": "O" if local else "-",
-                "r": "O" if remote else "-",
-                "rez": (local.get_rez_version() or "?") if local else "-",
+            usage = get_cached(local, usage_cache) if local else None
+            return {
+                "container": name,
+                "local": str(local.path()) if local else None,
+                "remote": str(remote.path()) if remote else None,
+                "rez": local.get_rez_version() if local else None,
+                "users": len(local.active_leases()) if local else 0,
+                "size": usage["size"] if usage else None,
                 "date": data.time_str(),
-                "time": data.dirname(),
+                "timestamp": data.dirname(),
+                "ready": data.is_ready(),
             }
-            print(info_line.format(**info))
-        print("")
+
+        pairs = [
+            (local, paired_revs["R"][i])
+            for i, local in enumerate(paired_revs["L"])
+            if local is not None or paired_revs["R"][i] is not None
+        ]
+
+        # print out, in order, as soon as they are ready
+        for stat in pool.imap(revision_stat, pairs):
+            if as_json:
+                print(json.dumps(stat))
+            else:
+                print(info_line.format(**{
+                    "l": "O" if stat["local"] else "-",
+                    "r": "O" if stat["remote"] else "-",
+                    "rez": (stat["rez"] or "?") if stat["local"] else "-",
+                    "users": stat["users"] if stat["local"] else "-",
+                    "size": "-" if not stat["local"] else format_size(
+                        stat["size"]) if stat["size"] is not None else "?",
+                    "date": stat["date"],
+                    "time": stat["timestamp"],
+                }))
+            sys.stdout.flush()
+
+        if not as_json:
+            print("")
 
 
 def fetch_latest_version_from_pypi():
@@ -1,7 +1,11 @@
 
 import os
+import re
+import ast
 import sys
+import glob
 import json
+import hashlib
 import time
 import shutil
 import socket
@@ -11,6 +15,7 @@ import logging
 import platform
 import warnings
 import functools
+import tempfile
 import subprocess
 import virtualenv
 from datetime import datetime
@@ -27,6 +32,13 @@ try:
 except ImportError:
     from pathlib2 import Path  # noqa, py2
 
+try:
+    from urllib.parse import urlparse  # noqa, py3
+    from urllib.request import url2pathname  # noqa, py3
+except ImportError:
+    from urlparse import urlparse  # noqa, py2
+    from urllib import url2pathname  # noqa, py2
+
 try:
     from configparser import ConfigParser  # noqa, py3
 except ImportError:
@@ -39,6 +51,9 @@ except ImportError:
 
 from . import __version__
 from .launch import shell
+from ._lock import FileLock, pid_exists
+from ._trash import remove as remove_to_trash
+from ._background import rezup_command, spawn_detached
 from .recipe import ContainerRecipe, RevisionRecipe, DEFAULT_CONTAINER_NAME
 from .exceptions import ContainerError
 
@@ -51,7 +66,7 @@ _log = logging.getLogger("rezup")
 #   implement/document these env vars
 #   - [x] REZUP_ROOT_REMOTE
 #   - [x] REZUP_ROOT_LOCAL
-#   - [ ] REZUP_CLEAN_AFTER
+#   - [x] REZUP_CLEAN_AFTER
 
 
 if _PY2:
@@ -59,6 +74,12 @@ if _PY2:
 else:
     string_types = str,
 
+# seconds, leases from other hosts older than this are considered as expired
+LEASE_EXPIRY = 60 * 60 * 24 * 7
+# seconds, changes made within this can't be told by mtime on some (network)
+#   file systems, see also `rezup.recipe.REGISTRY_MTIME_RESOLUTION`
+MTIME_RESOLUTION = 2
+
 
 def makedirs(path):
     path = str(path)
@@ -71,10 +92,346 @@ def rmtree(path):
     shutil.rmtree(path)
 
 
+def write_json(path, data):
+    """Write data into JSON file atomically
+
+    Content is written into a temporary file next to the destination first,
+    then renamed over, so readers never see a half written file.
+
+    """
+    path = str(path)
+    tmp = "%s.%s-%d.tmp" % (path, socket.gethostname(), os.getpid())
+    with open(tmp, "w") as f:
+        f.write(json.dumps(data, indent=4))
+    replace_file(tmp, path)
+
+
+def replace_file(src, dst):
+    """Rename file over the destination, atomically if possible"""
+    replace = getattr(os, "replace", None)  # py3
+    if replace is None:
+        if sys.platform == "win32" and os.path.isfile(dst):
+            os.remove(dst)
+        replace = os.rename
+    replace(src, dst)
+
+
+def release_lease(popen):
+    """Remove the lease of a finished process that spawned by revision"""
+    path = getattr(popen, "rezup_lease", None)
+    if path is not None:
+        try:
+            os.remove(str(path))
+        except OSError:
+            pass  # already reclaimed
+
+
+def _recipe_hash(data):
+    """Returns a hash of recipe content, for telling identical recipes"""
+    content = json.dumps(data, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(content).hexdigest()
+
+
+def version_key(version):
+    """Returns a sort key of version string, e.g. '2.110.0' -> (2, 110, 0)
+    """
+    parts = re.split(r"[.\-+]", str(version))
+    return tuple((0, int(p), "") if p.isdigit() else (1, 0, p) for p in parts)
+
+
+def match_version(version, spec):
+    """Returns True if version matches the spec
+
+    Spec is a comma separated list of version comparisons, e.g.
+    `>=2.110,<3`. A version without operator matches itself and versions
+    that start with it, e.g. `2.110` matches `2.110.1`.
+
+    """
+    if version is None:
+        return False
+    for condition in spec.split(","):
+        match = re.match(r"^\s*(==|!=|>=|<=|>|<)?\s*(\S+)\s*$", condition)
+        if not match:
+            raise ValueError("Invalid version spec: %r" % spec)
+        op, target = match.groups()
+        a, b = version_key(version), version_key(target)
+        if op is None:
+            ok = a[:len(b)] == b
+        else:
+            ok = {
+                "==": a == b, "!=": a != b,
+                ">=": a >= b, "<=": a <= b,
+                ">": a > b, "<": a < b,
+            }[op]
+        if not ok:
+            return False
+    return True
+
+
 def norm_path(path):
     return os.path.expanduser(path)
 
 
+def find_site_packages(venv_path):
+    """Find purelib site-packages of a venv without creating venv session
+
+    Args:
+        venv_path (str or path-like): Venv root directory
+
+    Returns:
+        `pathlib.Path` or None if not found.
+
+    """
+    venv_path = str(venv_path)
+    for pattern in ("Lib/site-packages",  # windows
+                    "lib/python*/site-packages",
+                    "lib/pypy*/site-packages",
+                    "lib/site-packages"):  # pypy windows
+        for path in sorted(glob.glob(os.path.join(venv_path, pattern))):
+            if os.path.isdir(path):
+                return Path(path)
+
+
+def find_dist_info(site_packages, name):
+    """Find the `.dist-info` directory of a distribution
+
+    Args:
+        site_packages (str or path-like): Where the distribution installed
+        name (str): Distribution name
+
+    Returns:
+        `pathlib.Path` or None if not found.
+
+    """
+    normalized = re.sub(r"[-_.]+", "_", name).lower()
+    try:
+        entries = os.listdir(str(site_packages))
+    except OSError:
+        return
+
+    for entry in entries:
+        if not entry.endswith(".dist-info"):
+            continue
+        dist_name = entry[:-len(".dist-info")].split("-", 1)[0]
+        if re.sub(r"[-_.]+", "_", dist_name).lower() == normalized:
+            return Path(site_packages) / entry
+
+
+def read_dist_version(dist_info):
+    """Returns distribution version from `.dist-info/METADATA`"""
+    try:
+        with open(str(Path(dist_info) / "METADATA"), "r") as f:
+            for line in f:
+                if line.startswith("Version:"):
+                    return line.split(":", 1)[1].strip()
+                if not line.strip():
+                    break  # end of headers
+    except (OSError, IOError):
+        pass
+
+
+def locate_dist_package(site_packages, name, package=None):
+    """Locate where the package of an installed distribution is
+
+    This looks into distribution's `.dist-info` and supports regular
+    install, PEP-660 editable install (`__editable__` finders or path
+    file) and legacy editable install (`.egg-link`), without importing
+    anything.
+
+    Args:
+        site_packages (str or path-like): Where the distribution installed
+        name (str): Distribution name
+        package (str, optional): Top-level package name, same as `name`
+            if not given.
+
+    Returns:
+        `pathlib.Path`: The directory that contains the package, or None
+            if not found.
+
+    """
+    package = package or name
+    site_packages = Path(site_packages)
+
+    # legacy editable install
+    egg_link = site_packages / ("%s.egg-link" % name)
+    if egg_link.is_file():
+        with open(str(egg_link), "r") as f:
+            location = f.readline().strip()
+        if os.path.isdir(os.path.join(location, package)):
+            return Path(location)
+
+    # regular install
+    if (site_packages / package / "__init__.py").is_file():
+        return site_packages
+
+    dist_info = find_dist_info(site_packages, name)
+    if dist_info is None:
+        return
+
+    # PEP-660 editable install, setuptools finder
+    normalized = re.sub(r"[-_.]+", "_", name).lower()
+    for entry in os.listdir(str(site_packages)):
+        if not (entry.startswith("__editable___%s_" % normalized)
+                and entry.endswith("_finder.py")):
+            continue
+        with open(str(site_packages / entry), "r") as f:
+            match = re.search(r"^MAPPING\s*(?::[^=]*)?=\s*(\{.*?\})\s*$",
+                              f.read(), re.MULTILINE | re.DOTALL)
+        if match:
+            mapping = ast.literal_eval(match.group(1))
+            if package in mapping:
+                return Path(mapping[package]).parent
+
+    # PEP-660 editable install, path file
+    for entry in os.listdir(str(site_packages)):
+        if not (entry.startswith("__editable__.")
+                and entry.endswith(".pth")):
+            continue
+        dist_name = entry[len("__editable__."):].rsplit("-", 1)[0]
+        if re.sub(r"[-_.]+", "_", dist_name).lower() != normalized:
+            continue
+        with open(str(site_packages / entry), "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith(("#", "import")) \
+                        and os.path.isdir(os.path.join(line, package)):
+                    return Path(line)
+
+    # PEP-610 direct url, for other editable backends
+    direct_url = dist_info / "direct_url.json"
+    if direct_url.is_file():
+        with open(str(direct_url), "r") as f:
+            data = json.load(f)
+        url = data.get("url", "")
+        if data.get("dir_info", {}).get("editable") \
+                and url.startswith("file://"):
+            location = url2pathname(urlparse(url).path)
+            for path in (os.path.join(location, "src"), location):
+                if os.path.isdir(os.path.join(path, package)):
+                    return Path(path)
+
+
+def list_distributions(site_packages):
+    """List distributions that installed in site-packages
+
+    Distributions are read from `.dist-info` and `.egg-info` metadata
+    headers, including the ones that installed in legacy editable mode
+    (`.egg-link`), without importing anything.
+
+    Args:
+        site_packages (str or path-like): Where the distributions installed
+
+    Returns:
+        list: A list of dict that has keys `name`, `version` and `location`,
+            the location is the source directory if installed in editable
+            mode.
+
+    """
+    site_packages = str(site_packages)
+    try:
+        entries = sorted(os.listdir(site_packages))
+    except OSError:
+        return []
+
+    metadata_files = []
+    for entry in entries:
+        path = os.path.join(site_packages, entry)
+        if entry.endswith(".dist-info"):
+            metadata_files.append((os.path.join(path, "METADATA"),
+                                   site_packages))
+        elif entry.endswith(".egg-info"):
+            if os.path.isdir(path):
+                path = os.path.join(path, "PKG-INFO")
+            metadata_files.append((path, site_packages))
+        elif entry.endswith(".egg-link"):
+            try:
+                with open(path, "r") as f:
+                    location = f.readline().strip()
+            except (OSError, IOError) as e:
+                _log.warning("Skipped unreadable egg-link %s: %s"
+                             % (path, e))
+                continue
+            for egg_info in glob.glob(os.path.join(location, "*.egg-info")):
+                metadata_files.append((os.path.join(egg_info, "PKG-INFO"),
+                                       location))
+
+    distributions = []
+    for metadata_file, location in metadata_files:
+        headers = dict()
+        try:
+            with open(metadata_file, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        break  # end of headers
+                    key, _, value = line.partition(":")
+                    if key in ("Name", "Version"):
+                        headers[key] = value.strip()
+        except (OSError, IOError):
+            continue
+        if "Name" not in headers:
+            continue
+
+        # PEP-610 direct url, editable install
+        direct_url = os.path.join(os.path.dirname(metadata_file),
+                                  "direct_url.json")
+        if os.path.isfile(direct_url):
+            try:
+                with open(direct_url, "r") as f:
+                    data = json.load(f)
+            except (OSError, IOError, ValueError) as e:
+                _log.warning("Skipped %s, unreadable direct_url.json: %s"
+                             % (headers["Name"], e))
+                continue
+            url = data.get("url", "")
+            if data.get("dir_info", {}).get("editable") \
+                    and url.startswith("file://"):
+                location = url2pathname(urlparse(url).path)
+
+        distributions.append({
+            "name": headers["Name"],
+            "version": headers.get("Version"),
+            "location": location,
+        })
+
+    return distributions
+
+
+def pinned_requirements(distributions, venv_path, tools):
+    """Returns requirements that pin distributions installed in venv
+
+    Distributions that were not installed into the venv (editable) or
+    were installed from a path or URL by given tools could not be pinned
+    to a version, so they are left out.
+
+    Args:
+        distributions (list): Installed distributions, see
+            `list_distributions()`.
+        venv_path (str or path-like): The venv that distributions were
+            installed into.
+        tools (list): `Tool` instances that got installed in the venv
+
+    Returns:
+        list: Requirement strings like `name==version`
+
+    """
+    venv_path = os.path.normpath(str(venv_path)) + os.sep
+    unpinned = set(
+        normalize(t.name) for t in tools
+        if t.edit or not re.match(r"^[\w.\-\[\], ]+([<>=!~;].*)?$", t.url)
+    )
+    return sorted(
+        "%s==%s" % (d["name"], d["version"]) for d in distributions
+        if d.get("version")
+        and os.path.normpath(d["location"] or "").startswith(venv_path)
+        and normalize(d["name"]) not in unpinned
+    )
+
+
+def normalize(name):
+    """Returns PEP-503 normalized distribution name"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
 def iter_containers():
     """Iterate containers by recipes (`~/rezup[.{name}].toml`)
 
@@ -163,6 +520,7 @@ class Container:
 
     """
     DEFAULT_NAME = DEFAULT_CONTAINER_NAME  #: `rezup.recipe.DEFAULT_CONTAINER_NAME`
+    MANIFEST_SCHEMA = "rezup-manifest:1.0"
 
     def __init__(self, name=None, recipe=None, force_local=False):
         name = name or self.DEFAULT_NAME
@@ -249,6 +607,20 @@ class Container:
         """
         return self._path / "revisions"
 
+    def locks(self):
+        """
+        Returns:
+            `pathlib.Path`: Path to this container's lock files.
+        """
+        return self._path / ".locks"
+
+    def manifest(self):
+        """
+        Returns:
+            `pathlib.Path`: Path to this container's revision manifest file.
+        """
+        return self._path / "manifest.json"
+
     def is_exists(self):
         """
         Returns:
@@ -271,18 +643,31 @@ class Container:
         return self._remote
 
     def purge(self):
+        """Remove this container from disk
+
+        Raises:
+            ContainerError: If any revision is being built or used.
+
+        """
         if self.is_exists():
-            revision = self.get_latest_revision(only_ready=False)
-            if not revision:
-                # TODO: don't remove it immediately, mark as purged and
-                #   remove it when $REZUP_CLEAN_AFTER meet
-                rmtree(self._path)
-            else:
-                # TODO: should have better exception type
-                # TODO: need to check revision is in use
-                raise Exception("Revision is creating.")
+            for revision in self.iter_revision(validate=False):
+                if revision.is_building():
+                    raise ContainerError("Revision is creating: %s"
+                                         % revision.path())
+                leases = revision.active_leases()
+                if leases:
+                    raise ContainerError(
+                        "Revision is used by %d process(es): %s"
+                        % (len(leases), revision.path()))
+
+            # instant, the actual deletion is done in background
+            remove_to_trash(self._path, self.root())
+            if not self._remote:
+                from .packages import remove_container
+                remove_container(self)
 
         # keep tidy, try remove the root of containers if it's now empty
+        #   (the trash emptying process also does this when it's done)
         root = self.root()
         if root.is_dir() and not next(root.iterdir(), None):
             rmtree(root)
@@ -312,6 +697,19 @@ class Container:
             _log.debug("Revision root is not a directory: %s" % revisions_root)
             return
 
+        manifest = self.read_manifest() if self._remote else None
+        if manifest is not None:
+            _log.debug("Iterating revisions from manifest.")
+            entries = sorted(manifest["revisions"],
+                             key=lambda e: e["dirname"],
+                             reverse=latest_first)
+            for entry in entries:
+                revision = Revision(container=self, dirname=entry["dirname"])
+                revision._preload(entry)
+                _log.debug("... %s" % revision)
+                yield revision
+            return
+
         revisions_root = str(revisions_root)
         for entry in sorted(os.listdir(revisions_root), reverse=latest_first):
             revision = Revision(container=self, dirname=entry)
@@ -319,6 +717,216 @@ class Container:
             if not validate or revision.is_valid():
                 yield revision
 
+    def read_manifest(self, check_stale=True):
+        """Read revision manifest of this container
+
+        The manifest lists every revision with its timestamp, readiness,
+        metadata and recipe content, so the entire container could be
+        sourced with one file read. It's maintained when adding or purging
+        revisions, and also serves as the index for `Container.query()`.
+
+        The manifest is considered stale if `revisions` directory has been
+        modified after the manifest was written, e.g. a revision is being
+        created right now, or written by an older rezup. A manifest that
+        was written within `MTIME_RESOLUTION` seconds is also considered
+        stale, since the order of changes can't be told by mtime yet.
+
+        Args:
+            check_stale (bool): Default `True`. Returns `None` if manifest
+                is stale.
+
+        Returns:
+            dict: Manifest content, or `None` if not exists, unreadable or
+                being stale.
+
+        """
+        path = str(self.manifest())
+        try:
+            if check_stale:
+                manifest_mtime = os.stat(path).st_mtime
+                revisions_mtime = os.stat(str(self.revisions())).st_mtime
+                # order of changes made within the resolution can't be
+                #   told, e.g. same mtime on coarse file systems
+                if (revisions_mtime >= manifest_mtime
+                        or time.time() - manifest_mtime < MTIME_RESOLUTION):
+                    _log.debug("Manifest is stale: %s" % path)
+                    return
+
+            with open(path, "r") as f:
+                manifest = json.load(f)
+
+        except (OSError, IOError, ValueError):
+            return
+
+        if manifest.get("schema") != self.MANIFEST_SCHEMA:
+            _log.debug("Unknown manifest schema: %s" % path)
+            return
+
+        return manifest
+
+    def update_manifest(self, refresh=None):
+        """Write out revision manifest of this container
+
+        Entries of ready revisions are reused from previous manifest since
+        they are not going to change, only others get sourced from disk.
+
+        Args:
+            refresh (list, optional): Directory names of revisions that
+                should be sourced from disk even if they are ready, e.g.
+                a venv has been rebuilt.
+
+        Returns:
+            dict: Manifest content, or `None` if container has no revision.
+
+        """
+        revisions_root = self.revisions()
+        if not revisions_root.is_dir():
+            return
+
+        # serialize read-modify-write of manifest between processes
+        lock = FileLock(self.locks() / "manifest.lock",
+                        timeout=60,
+                        description="manifest update")
+        try:
+            locked = lock.acquire()
+        except (OSError, IOError, ContainerError) as e:
+            _log.debug("Manifest will not be written: %s" % e)  # read-only
+            locked = False
+
+        try:
+            return self._update_manifest(refresh, write=locked)
+        finally:
+            lock.release()
+
+    def _update_manifest(self, refresh, write):
+        revisions_root = self.revisions()
+        previous = self.read_manifest(check_stale=False) or {}
+        ready_entries = {
+            e["dirname"]: e for e in previous.get("revisions", [])
+            if e["ready"] and e["dirname"] not in (refresh or [])
+        }
+
+        entries = []
+        for dirname in sorted(os.listdir(str(revisions_root))):
+            if dirname in ready_entries:
+                entries.append(ready_entries[dirname])
+                continue
+
+            revision = Revision(container=self, dirname=dirname)
+            if not revision.is_valid():
+                continue
+
+            recipe = revision.recipe().data()
+            entries.append({
+                "dirname": dirname,
+                "timestamp": float(dirname),
+                "ready": revision.is_ready(),
+                "metadata": revision.metadata(),
+                "recipe": recipe,
+                "recipe_hash": _recipe_hash(recipe),
+            })
+
+        manifest = {
+            "schema": self.MANIFEST_SCHEMA,
+            "rezup_version": __version__,
+            "revisions": entries,
+        }
+        if not write:
+            return manifest
+        try:
+            write_json(self.manifest(), manifest)
+        except (OSError, IOError) as e:
+            _log.debug("Failed to write manifest: %s" % e)  # e.g. read-only
+        else:
+            _log.debug("Manifest updated: %s" % self.manifest())
+
+        return manifest
+
+    def query(self,
+              since=None,
+              until=None,
+              rez=None,
+              creator=None,
+              hostname=None,
+              recipe_hash=None,
+              ready=None,
+              sort_by="timestamp",
+              latest_first=True):
+        """Find revisions by metadata through revision manifest
+
+        The manifest serves as the index of revisions, it's brought up to
+        date incrementally if stale, so only new revisions get read from
+        disk. Returned revisions are preloaded with manifest content, no
+        more file reading needed for accessing their metadata and recipe.
+
+        Args:
+            since (float, optional): Revisions created at or after this
+                time (seconds since epoch).
+            until (float, optional): Revisions created before this time.
+            rez (str, optional): Rez version spec, e.g. `>=2.110,<3`. See
+                `match_version()`.
+            creator (str, optional): User name who created the revision.
+            hostname (str, optional): Host where the revision was created.
+            recipe_hash (str, optional): Recipe content hash, or prefix of it.
+            ready (bool, optional): Filter by readiness if given.
+            sort_by (str): One of `timestamp`, `rez`, `creator`, `hostname`.
+            latest_first (bool): Sorting order, descending if `True`.
+
+        Returns:
+            list: Matched `Revision` instances.
+
+        """
+        if not self.is_exists():
+            return []
+
+        manifest = self.read_manifest() or self.update_manifest()
+        if manifest is None:
+            return []
+
+        def field(entry, name):
+            if name == "timestamp":
+                return entry["timestamp"]
+            if name == "recipe_hash":
+                return entry.get("recipe_hash") \
+                    or _recipe_hash(entry["recipe"])  # older manifest
+            metadata = entry["metadata"] or {}
+            return metadata.get({"rez": "rez_version"}.get(name, name))
+
+        matched = []
+        for entry in manifest["revisions"]:
+            if since is not None and entry["timestamp"] < since:
+                continue
+            if until is not None and entry["timestamp"] >= until:
+                continue
+            if ready is not None and entry["ready"] != ready:
+                continue
+            if rez and not match_version(field(entry, "rez"), rez):
+                continue
+            if creator and field(entry, "creator") != creator:
+                continue
+            if hostname and field(entry, "hostname") != hostname:
+                continue
+            if recipe_hash and not field(entry, "recipe_hash").startswith(
+                    recipe_hash):
+                continue
+            matched.append(entry)
+
+        if sort_by == "rez":
+            def sort_key(e):
+                return version_key(field(e, "rez") or "")
+        else:
+            def sort_key(e):
+                return field(e, sort_by) or ""
+        matched.sort(key=lambda e: (sort_key(e), e["timestamp"]),
+                     reverse=latest_first)
+
+        revisions = []
+        for entry in matched:
+            revision = Revision(container=self, dirname=entry["dirname"])
+            revision._preload(entry)
+            revisions.append(revision)
+        return revisions
+
     def get_latest_revision(self, only_ready=True):
         """Get latest revision from this container.
 
@@ -387,6 +995,9 @@ class Revision:
         self._recipe = RevisionRecipe(self)
         self._metadata_path = self._path / "revision.json"
         self._is_pulled = False
+        self._is_stale = False
+        self._is_ready = None
+        self._recipe_hash = None
 
     def __repr__(self):
         return "%s(valid=%d, ready=%d, remote=%d, time=%s, path=%r)" % (
@@ -411,10 +1022,22 @@ class Revision:
             path /= dirname
         return path
 
+    def _preload(self, entry):
+        """Apply revision state from container manifest entry
+        """
+        self._is_valid = True
+        self._timestamp = datetime.fromtimestamp(float(entry["dirname"]))
+        self._recipe._load(data=entry["recipe"])
+        self._recipe_hash = entry.get("recipe_hash")
+        if entry["ready"]:
+            self._is_ready = True
+            self._metadata = entry["metadata"]
+
     @classmethod
     def create(cls, container):
         revision = cls(container=container)
         revision._write()
+        revision._prewarm()
         return revision
 
     def _write(self, pulling=None):
@@ -449,23 +1072,64 @@ class Revision:
         _log.debug(" Extension: " + ", ".join([e.name for e in extensions]))
         _log.debug("Shared-lib: %s" % shared_lib)
 
+        from .verify import hash_scripts
+
         # install, if at local
+        installer = None
         if not self._container.is_remote():
-            self._install(rez_, extensions, shared_lib)
+            installer = self._install(rez_, extensions, shared_lib)
+            makedirs(self.leases())
 
         # save metadata, mark revision as ready
+        metadata = {
+            "rezup_version": __version__,
+            "creator": getpass.getuser(),
+            "hostname": socket.gethostname(),
+            "revision_path": str(self._path),
+            "venvs": ["rez"] + [t.name for t in extensions if t.isolation],
+        }
+        if installer is not None:
+            metadata["rez_version"] = installer.installed_rez_version()
+            metadata["rez_location"] = str(installer.installed_rez_location())
+            metadata["packages"] = installer.installed_packages()
+            metadata["scripts"] = hash_scripts(self, metadata["venvs"])
+        if pulling is not None:
+            metadata["pulled_from"] = str(pulling.path())
+
         with open(str(self._metadata_path), "w") as f:
-            # metadata
-            f.write(json.dumps({
-                "rezup_version": __version__,
-                "creator": getpass.getuser(),
-                "hostname": socket.gethostname(),
-                "revision_path": str(self._path),
-                "venvs": ["rez"] + [t.name for t in extensions if t.isolation],
-            }, indent=4))
+            f.write(json.dumps(metadata, indent=4))
+
+        self._container.update_manifest()
 
         _log.info("Revision created: %s" % self)
 
+        if not self._container.is_remote():
+            from .packages import add_revision
+            add_revision(self)
+
+            from .usage import revision_usage
+            try:
+                revision_usage(self, refresh=True)
+            except Exception as e:
+                _log.debug("Failed to measure disk usage: %s" % e)
+
+            from .cleanup import is_auto_clean_enabled, clean_in_background
+            if is_auto_clean_enabled():
+                clean_in_background(self._container)
+
+    def _prewarm(self):
+        """Prewarm newly built local revision in background if enabled
+
+        Which is done after the build lock released and in a detached
+        process, so the solves won't keep others waiting for the revision.
+
+        """
+        if self._container.is_remote():
+            return
+        from .prewarm import is_enabled, prewarm_in_background
+        if is_enabled(self):
+            prewarm_in_background(self)
+
     def _install(self, rez_, extensions=None, shared_lib=None):
         """Construct Rez virtual environment by recipe
         """
@@ -492,6 +1156,8 @@ class Revision:
         for ext in extensions:
             installer.install_extension(ext)
 
+        return installer
+
     def validate(self):
         is_valid = True
         seconds = float(self._dirname)
@@ -513,11 +1179,111 @@ class Revision:
         return self._is_valid
 
     def is_ready(self):
+        if self._is_ready:
+            return True  # sourced from manifest
         return self._metadata_path.is_file()
 
     def is_remote(self):
         return self._container.is_remote()
 
+    def is_building(self):
+        """Returns True if this revision is being built by other process"""
+        return self.build_lock().is_locked()
+
+    def is_in_use(self):
+        """Returns True if this revision is being built or used"""
+        return self.is_building() or bool(self.active_leases())
+
+    def leases(self):
+        """
+        Returns:
+            `pathlib.Path`: Path to this revision's lease files.
+        """
+        return self._path / "leases"
+
+    def active_leases(self):
+        """Returns leases of processes that are using this revision
+
+        Each lease is an empty file named `<hostname>.<pid>`, which is created
+        when a shell is spawned from this revision. Leases of dead processes
+        on this host are reclaimed (removed) here. Leases from other hosts
+        can not be checked, so they are considered active until they are
+        older than `LEASE_EXPIRY` seconds.
+
+        Returns:
+            list: A list of dict that has keys `hostname`, `pid` and `since`.
+
+        """
+        try:
+            names = os.listdir(str(self.leases()))
+        except OSError:
+            return []
+
+        hostname = socket.gethostname()
+        now = time.time()
+        leases = []
+        for name in names:
+            host, _, pid = name.rpartition(".")
+            if not host or not pid.isdigit():
+                continue
+            path = os.path.join(str(self.leases()), name)
+            try:
+                since = os.stat(path).st_mtime
+            except OSError:
+                continue  # released
+
+            if host == hostname:
+                expired = not pid_exists(int(pid))
+            else:
+                expired = now - since > LEASE_EXPIRY
+            if expired:
+                _log.debug("Reclaiming lease: %s" % path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+
+            leases.append({"hostname": host, "pid": int(pid), "since": since})
+
+        return leases
+
+    def _check_exists(self):
+        if not self._path.is_dir():
+            raise ContainerError("Revision has been removed: %s" % self._path)
+
+    def _acquire_lease(self, pid):
+        # one empty file per launch, and launching never fails because of it
+        path = self.leases() / ("%s.%d" % (socket.gethostname(), pid))
+        try:
+            open(str(path), "w").close()
+        except (OSError, IOError):
+            try:
+                makedirs(self.leases())  # revision made by older version
+                open(str(path), "w").close()
+            except (OSError, IOError) as e:
+                _log.debug("Failed to create lease %s: %s" % (path, e))
+                return
+        return path
+
+    def build_lock(self, timeout=None):
+        """Returns a lock for building this revision exclusively
+
+        Args:
+            timeout (float, optional): Seconds to wait for the lock. Use
+                `$REZUP_BUILD_TIMEOUT` or wait for 1 hour if not given.
+
+        Returns:
+            `rezup._lock.FileLock`
+
+        """
+        if timeout is None:
+            timeout = float(os.getenv("REZUP_BUILD_TIMEOUT") or 3600)
+        path = self._container.locks() / (self._dirname + ".lock")
+        return FileLock(path,
+                        timeout=timeout,
+                        description="revision %s build" % self._dirname)
+
     def dirname(self):
         return self._dirname
 
@@ -545,16 +1311,18 @@ class Revision:
         if self.is_valid():
             return self._recipe
 
-    def recipe_env(self):
+    def recipe_hash(self):
+        """Returns the hash of revision recipe content"""
+        if self._recipe_hash is None and self.is_valid():
+            self._recipe_hash = _recipe_hash(self._recipe.data())
+        return self._recipe_hash
+
+    def dotenv_files(self):
+        """Returns dotenv file paths that listed in recipe, in loading order
+        """
         _platform = platform.system().lower()
         recipe = self.recipe() or {}
-        env = {}
-
-        def load_env(**kwargs):
-            return {
-                k: v for k, v in dotenv_values(**kwargs).items()
-                if v is not None  # exclude config section line
-            }
+        env_files = []
 
         def file_loader(d):
             return [d[k] for k in sorted([
@@ -568,8 +1336,27 @@ class Revision:
                 # platform specific dotenv
                 env_files += file_loader(dot_env[_platform])
 
-            for file in env_files:
-                env.update(load_env(dotenv_path=file))
+        return env_files
+
+    def recipe_env(self, baked=True):
+        """Returns environment variables that defined in recipe
+
+        Args:
+            baked (bool): Point `REZ_CONFIG_FILE` to the config that baked
+                in revision if it's up to date, see `rezup.prewarm`.
+
+        """
+        recipe = self.recipe() or {}
+        env = {}
+
+        def load_env(**kwargs):
+            return {
+                k: v for k, v in dotenv_values(**kwargs).items()
+                if v is not None  # exclude config section line
+            }
+
+        for file in self.dotenv_files():
+            env.update(load_env(dotenv_path=file))
 
         recipe_env = recipe.get("env")
         if recipe_env:
@@ -583,18 +1370,123 @@ class Revision:
             stream.seek(0)  # must reset buffer
             env.update(load_env(stream=stream))
 
+        if baked and env.get("REZ_CONFIG_FILE"):
+            from .prewarm import baked_config
+            env["REZ_CONFIG_FILE"] = \
+                baked_config(self, env) or env["REZ_CONFIG_FILE"]
+
         env.update({
             "REZUP_CONTAINER": self._container.name(),
             "REZUP_USING_REMOTE": "yes" if self._is_pulled else "",
+            "REZUP_USING_STALE": "yes" if self._is_stale else "",
         })
 
         return env
 
     def purge(self):
         if self.is_valid():
-            # TODO: don't remove it immediately, mark as purged and
-            #   remove it when $REZUP_CLEAN_AFTER meet
-            rmtree(self._path)
+            # note: deferred removal is done by `rezup.cleanup` with
+            #   retention policy, e.g. $REZUP_CLEAN_AFTER
+            remove_to_trash(self._path, self._container.root())
+            self._container.update_manifest()
+            if not self.is_remote():
+                from .packages import remove_revision
+                remove_revision(self)
+
+    def rebuild_venv(self, venv_name):
+        """Rebuild one venv of this local revision from revision recipe
+
+        Other venvs in this revision are left untouched. If the venv is the
+        default one (`rez`), extensions that are not isolated will be
+        installed again as well.
+
+        Args:
+            venv_name (str): Name of the venv to rebuild
+
+        Distributions are reinstalled with the versions recorded in revision
+        metadata, see `pinned_requirements()`.
+
+        Raises:
+            ContainerError: If the revision is remote, being used, has no
+                such venv, or recorded versions could not be reinstalled.
+
+        """
+        if self.is_remote():
+            raise ContainerError("Cannot rebuild venv of remote revision.")
+        metadata = self.metadata()
+        if not metadata or venv_name not in metadata.get("venvs", []):
+            raise ContainerError("No venv %r in revision: %s"
+                                 % (venv_name, self._path))
+        if self.active_leases():
+            raise ContainerError("Revision is being used, cannot rebuild "
+                                 "venv: %s" % self._path)
+        if venv_name not in metadata.get("packages", {}):
+            raise ContainerError("No installed packages recorded for venv "
+                                 "%r, cannot rebuild: %s"
+                                 % (venv_name, self._path))
+
+        from .verify import hash_scripts
+        from .packages import add_revision
+
+        with self.build_lock():
+            recipe = self._recipe
+            rez_ = Tool(recipe["rez"])
+            extensions = [Tool(d) for d in recipe.get("extension", []) if d]
+            venv_path = self._path / "venv" / venv_name
+
+            pinned = pinned_requirements(metadata["packages"][venv_name],
+                                         venv_path,
+                                         [rez_] + extensions)
+            fd, constraints = tempfile.mkstemp(prefix="rezup-", suffix=".txt")
+            with os.fdopen(fd, "w") as f:
+                f.write("\n".join(pinned) + "\n")
+
+            pip_entry = recipe.get("pip")
+            installer = Installer(
+                self,
+                pip_opt=pip_entry.get("options"),
+                pip_env=pip_entry.get("env"),
+                constraints={venv_name: constraints},
+            )
+            try:
+                if venv_path.is_dir():
+                    remove_to_trash(venv_path, self._container.root())
+
+                if venv_name == "rez":
+                    installer.install_rez(rez_)
+                    for ext in extensions:
+                        if not ext.isolation:
+                            installer.install_extension(ext)
+                    shared_lib = recipe.get("shared")
+                    if shared_lib:
+                        installer.create_shared_lib(
+                            name=shared_lib["name"],
+                            requires=shared_lib["requires"])
+                    metadata["rez_version"] = installer.installed_rez_version()
+                    metadata["rez_location"] = \
+                        str(installer.installed_rez_location())
+                else:
+                    # rez is installed into isolated venv as lib
+                    installer.use_rez_as_libs(rez_)
+                    for ext in extensions:
+                        if ext.isolation and ext.name == venv_name:
+                            installer.install_extension(ext)
+            except subprocess.CalledProcessError as e:
+                raise ContainerError("Failed to reinstall venv %r with "
+                                     "recorded versions: %s" % (venv_name, e))
+            finally:
+                os.remove(constraints)
+
+            metadata["packages"].update(installer.installed_packages())
+            scripts = metadata.setdefault("scripts", dict())
+            scripts.update(hash_scripts(self, [venv_name]))
+
+            write_json(self._metadata_path, metadata)
+            self._metadata = metadata
+
+        self._container.update_manifest(refresh=[self._dirname])
+        add_revision(self)
+        _log.info("Venv %r rebuilt: %s" % (venv_name, venv_path))
 
     def iter_backward(self):
         for revision in self._container.iter_revision(latest_first=True):
@@ -606,7 +1498,8 @@ class Revision:
             if revision.timestamp() > self._timestamp:
                 yield revision
 
-    def pull(self, check_out=True, fallback=False):
+    def pull(self, check_out=True, fallback=False, stale=False,
+             blocking=True):
         """Return corresponding local side revision
 
         If the revision is from remote container, calling this method will
@@ -620,6 +1513,13 @@ class Revision:
                 create one if True or just return None at the end.
                 Default is True.
             fallback (bool, optional)
+            stale (bool, optional): When no matched local revision, return
+                the newest ready local revision that was pulled from the same
+                remote container, and pull this one in background. Only if
+                no such revision, pull as usual.
+            blocking (bool, optional): When the revision is being pulled by
+                other process, wait for it if True, or return None at once.
+                Default is True.
 
         Returns:
             Revision or None
@@ -628,6 +1528,20 @@ class Revision:
         if not self.is_remote():
             return self
 
+        if stale:
+            rev = self.pull(check_out=False)
+            if rev is not None:
+                return rev
+
+            rev = self.get_stale()
+            if rev is not None:
+                _log.info("Using stale revision %s, pulling %s in background."
+                          % (rev.dirname(), self._dirname))
+                self.pull_in_background()
+                rev._is_pulled = True
+                rev._is_stale = True
+                return rev
+
         # get local
         _con_name = self._container.name()
         _con_recipe = self._container.recipe()  # careful, this affect's root
@@ -641,9 +1555,29 @@ class Revision:
         _did_fallback = rev.timestamp() != self._timestamp if rev else False
 
         if not fallback and _allow_create:
-            _log.info("Pulling from remote container: %s" % self._container)
             rev = Revision(container=local, dirname=self._dirname)
-            rev._write(pulling=self)
+            pulled = False
+            lock = rev.build_lock()
+            if not lock.acquire(blocking=blocking):
+                return None
+            try:
+                # may have been built by other process while we waiting
+                if rev.is_ready() and rev.is_valid():
+                    _log.info("Revision pulled by other process: %s" % rev)
+                else:
+                    if rev.path().is_dir():
+                        _log.info("Removing incomplete revision: %s"
+                                  % rev.path())
+                        remove_to_trash(rev.path(), local.root())
+                        rev._is_valid = None
+                    _log.info("Pulling from remote container: %s"
+                              % self._container)
+                    rev._write(pulling=self)
+                    pulled = True
+            finally:
+                lock.release()
+            if pulled:
+                rev._prewarm()
 
         if fallback and _did_fallback:
             _log.warning(
@@ -656,6 +1590,55 @@ class Revision:
 
         return rev
 
+    def get_stale(self):
+        """Returns the newest ready local revision that is older than this
+
+        Only local revisions that have their counterpart in this revision's
+        (remote) container will be considered, so the revisions that were
+        added locally will not be picked.
+
+        Returns:
+            Revision or None
+
+        """
+        if not self.is_remote():
+            return
+
+        remote_revs = set(r.dirname() for r in self._container.iter_revision())
+        local = Container(self._container.name(),
+                          recipe=self._container.recipe(),
+                          force_local=True)
+        for revision in local.iter_revision():
+            if revision.dirname() in remote_revs \
+                    and revision.timestamp() < self._timestamp \
+                    and revision.is_ready():
+                return revision
+
+    def pull_in_background(self):
+        """Pull this remote revision into local in a detached process
+
+        Returns:
+            bool: False if the revision is being pulled by other process,
+                True if the background process has started.
+
+        """
+        local = Container(self._container.name(),
+                          recipe=self._container.recipe(),
+                          force_local=True)
+        rev = Revision(container=local, dirname=self._dirname)
+        if rev.is_building():
+            _log.debug("Revision %s is being pulled by other process."
+                       % self._dirname)
+            return False
+
+        args = rezup_command("pull", self._container.name(),
+                             "--revision", self._dirname, "--no-wait")
+        log_file = local.locks() / (self._dirname + ".log")
+        pid = spawn_detached(args, log_file=log_file)
+        _log.debug("Background pulling process started (pid %d), log file: "
+                   "%s" % (pid, log_file))
+        return True
+
     def spawn_shell(self, command=None):
         """Spawn a sub-shell
 
@@ -669,6 +1652,42 @@ class Revision:
         Raises:
             ContainerError
 
+        """
+        revision, cmd, environment = self._launch_args(command)
+
+        # leased under build lock, so it won't be purged in between
+        with revision.build_lock():
+            revision._check_exists()
+            popen = subprocess.Popen(cmd, env=environment)
+            popen.rezup_lease = revision._acquire_lease(popen.pid)
+
+        return popen
+
+    def spawn_async(self, command=None, **kwargs):
+        """Spawn a sub-shell in asyncio event loop, Python 3.7+ only
+
+        Same as `spawn_shell()` but returns a coroutine, see
+        `rezup.util_async.spawn_async()`.
+
+        """
+        from .util_async import spawn_async
+        return spawn_async(self, command=command, **kwargs)
+
+    def pull_async(self, check_out=True, fallback=False, stale=False):
+        """Pull revision in asyncio event loop, Python 3.7+ only
+
+        Same as `pull()` but returns a coroutine, see
+        `rezup.util_async.pull_async()`.
+
+        """
+        from .util_async import pull_async
+        return pull_async(self,
+                          check_out=check_out,
+                          fallback=fallback,
+                          stale=stale)
+
+    def _launch_args(self, command=None):
+        """Returns local revision, command and environment for spawning
         """
         if not self.is_valid():
             raise ContainerError("Cannot use invalid revision.")
@@ -683,41 +1702,37 @@ class Revision:
             if not revision.is_ready():
                 raise ContainerError("Revision is not ready to be used.")
 
-            return revision.spawn_shell(command=command)
+            return revision._launch_args(command=command)
 
-        else:
-            # Launch subprocess
-            environment = self._compose_env()
-            shell_name, shell_exec = self._get_shell()
-
-            if command:
-                # run command and exit
-                if command[0] == ".":
-                    cmd = command
-                else:
-                    exe = command[0]
-                    exe = shell.which(exe, env=environment) or exe
-                    cmd = [exe] + command[1:]
+        environment = self._compose_env()
+        shell_name, shell_exec = self._get_shell()
 
+        if command:
+            # run command and exit
+            if command[0] == ".":
+                cmd = command
             else:
-                # interactive shell
-                _con_name = self._container.name()
-                _con_from = "remote" if self._is_pulled else "local"
-                prompt = "rezup (%s/%s) " % (_con_name, _con_from)
-                prompt = shell.format_prompt_code(prompt, shell_name)
-                environment.update({
-                    "REZUP_PROMPT": os.getenv("REZUP_PROMPT", prompt),
-                })
-
-                cmd = shell.get_launch_cmd(
-                    shell_name,
-                    shell_exec,
-                    interactive=True,
-                )
+                exe = command[0]
+                exe = shell.which(exe, env=environment) or exe
+                cmd = [exe] + command[1:]
 
-            popen = subprocess.Popen(cmd, env=environment)
+        else:
+            # interactive shell
+            _con_name = self._container.name()
+            _con_from = "remote" if self._is_pulled else "local"
+            prompt = "rezup (%s/%s) " % (_con_name, _con_from)
+            prompt = shell.format_prompt_code(prompt, shell_name)
+            environment.update({
+                "REZUP_PROMPT": os.getenv("REZUP_PROMPT", prompt),
+            })
+
+            cmd = shell.get_launch_cmd(
+                shell_name,
+                shell_exec,
+                interactive=True,
+            )
 
-            return popen
+        return self, cmd, environment
 
     def use(self, command=None, wait=True):
         """Run a sub-shell
@@ -738,6 +1753,7 @@ class Revision:
 
         if block or wait:
             stdout, stderr = popen.communicate()
+            release_lease(popen)
             return popen.returncode
         else:
             return 0
@@ -789,23 +1805,33 @@ class Revision:
     def locate_rez_lib(self, venv_session=None):
         """Returns rez module location in this revision
 
+        The location is read from revision metadata if possible, or looked
+        up from rez distribution's `.dist-info` in venv.
+
         Returns:
             pathlib.Path or None if not found.
 
         """
         if venv_session is None:
+            metadata = self.metadata() or {}
+            location = metadata.get("rez_location")
+            if location and os.path.isdir(location):
+                return Path(location)
+
             venv_path = self.path() / "venv" / "rez"
-            venv_session = virtualenv.session_via_cli(args=[str(venv_path)])
-        venv_lib = venv_session.creator.purelib
+            venv_lib = find_site_packages(venv_path)
+            if venv_lib is None:
+                venv_session = virtualenv.session_via_cli(
+                    args=[str(venv_path)])
+                venv_lib = venv_session.creator.purelib
+        else:
+            venv_lib = venv_session.creator.purelib
 
-        # rez may get installed in edit mode, try short route first
-        egg_link = venv_lib / "rez.egg-link"
-        if egg_link.is_file():
-            with open(str(egg_link), "r") as f:
-                package_location = f.readline().strip()
-            if os.path.isdir(package_location):
-                return Path(package_location)
+        location = locate_dist_package(venv_lib, "rez")
+        if location is not None:
+            return location
 
+        # not installed by pip, e.g. rezup-1.x styled revision
         for importer, modname, pkg in pkgutil.walk_packages([str(venv_lib)]):
             if pkg and modname == "rez":
                 loader = importer.find_module(modname)
@@ -820,10 +1846,37 @@ class Revision:
     def get_rez_version(self, venv_session=None):
         """Returns rez version installed in this revision
 
+        The version is read from revision metadata or the production install
+        marker file if possible, then rez distribution's `.dist-info` in
+        venv. Only look into rez module if all above not available.
+
         Returns:
             str or None if not found.
 
         """
+        if venv_session is None:
+            metadata = self.metadata() or {}
+            if metadata.get("rez_version"):
+                return metadata["rez_version"]
+
+            validator = self.production_bin_dir("rez") \
+                / ".rez_production_install"
+            if validator.is_file():
+                with open(str(validator), "r") as f:
+                    rez_version = f.read().strip()
+                if rez_version:
+                    return rez_version
+
+            venv_lib = find_site_packages(self.path() / "venv" / "rez")
+        else:
+            venv_lib = venv_session.creator.purelib
+
+        dist_info = find_dist_info(venv_lib, "rez") if venv_lib else None
+        if dist_info is not None:
+            rez_version = read_dist_version(dist_info)
+            if rez_version:
+                return rez_version
+
         rez_location = self.locate_rez_lib(venv_session)
         if rez_location is None:
             return
@@ -889,29 +1942,54 @@ class Tool:
 
 class Installer:
 
-    def __init__(self, revision, pip_opt=None, pip_env=None):
+    def __init__(self, revision, pip_opt=None, pip_env=None,
+                 constraints=None):
         self._container = revision.container()
         self._revision = revision
         self._pip_opt = pip_opt or []
         self._pip_env = pip_env or dict()
+        self._constraints = constraints or dict()  # file path by venv name
         self._default_venv = None
         self._rez_as_libs = None
         self._rez_version = None
+        self._rez_location = None
         self._rez_in_edit = None
+        self._venvs = dict()
 
     def installed_rez_version(self):
         return self._rez_version
 
+    def installed_rez_location(self):
+        return self._rez_location
+
+    def installed_packages(self):
+        """Returns distributions installed in each venv, by venv name"""
+        return {
+            name: list_distributions(session.creator.purelib)
+            for name, session in self._venvs.items()
+        }
+
     def install_rez(self, tool):
         assert tool.name == "rez"
 
         venv_session = self.create_venv(tool)
         self._default_venv = venv_session
-        self._rez_as_libs = tool
-        self._rez_in_edit = tool.edit
+        self.use_rez_as_libs(tool)
 
         self.install_package(tool, venv_session, patch_scripts=True)
 
+    def use_rez_as_libs(self, tool):
+        """Set the rez tool that gets installed into isolated venvs as lib
+
+        This is done by `install_rez()`, but needs to be called directly
+        if isolated extensions are installed without the rez venv, e.g.
+        when rebuilding one single venv.
+
+        """
+        assert tool.name == "rez"
+        self._rez_as_libs = tool
+        self._rez_in_edit = tool.edit
+
     def install_extension(self, tool):
         if tool.isolation:
             venv_session = self.create_venv(tool)
@@ -939,6 +2017,7 @@ class Installer:
             str(dst)
         ]
         session = virtualenv.cli_run(args)
+        self._venvs[tool.name] = session
 
         # remove handlers of virtualenv
         _root = logging.getLogger()
@@ -950,12 +2029,18 @@ class Installer:
     def install_package(self, tool, venv_session, patch_scripts=False):
         python_exec = str(venv_session.creator.exe)
         cmd = [python_exec, "-m", "pip", "install"]
+        pins = [
+            arg for name, session in self._venvs.items()
+            if session is venv_session and name in self._constraints
+            for arg in ("--constraint", self._constraints[name])
+        ]
 
         if tool.edit:
             cmd += ["--editable", tool.url]
         else:
             cmd.append(tool.url)
 
+        cmd += pins
         cmd += self._pip_opt
 
         env = os.environ.copy()
@@ -974,6 +2059,7 @@ class Installer:
         if tool.lib:
             cmd = [python_exec, "-m", "pip", "install"]
             cmd += tool.lib
+            cmd += pins
             cmd += self._pip_opt
             _log.info("Installing lib for %r.." % tool.name)
             _log.debug("  full command: %s" % " ".join(cmd))
@@ -986,10 +2072,13 @@ class Installer:
         validator = rez_bin / ".rez_production_install"
         rez_version = self._revision.get_rez_version(venv_session)
         assert rez_version is not None, "Rez version not obtain."
+        rez_location = self._revision.locate_rez_lib(venv_session)
+        assert rez_location is not None, "Rez location not obtain."
 
         with open(str(validator), "w") as f:
             f.write(rez_version)
         self._rez_version = rez_version
+        self._rez_location = rez_location
 
     def create_production_scripts(self, tool, venv_session):
         """Create Rez production used binary scripts
@@ -1003,21 +2092,23 @@ class Installer:
         site_packages = venv_session.creator.purelib
         bin_path = venv_session.creator.bin_dir
 
+        path = [str(site_packages)]
         if tool.edit:
             egg_link = site_packages / ("%s.egg-link" % tool.name)
-            if not egg_link.is_file():
+            if egg_link.is_file():
+                # legacy editable install, metadata is in source
+                with open(str(egg_link), "r") as f:
+                    package_location = f.readline().strip()
+                path = [str(package_location)]
+
+            elif find_dist_info(site_packages, tool.name) is None:
+                # PEP-660 editable install has dist-info in site-packages
                 _log.error("Tool %r installed in edit mode, but unable "
-                           "to find egg-link for generating production "
-                           "scripts from source. File not exists: %s" %
-                           (tool.name, egg_link))
+                           "to find egg-link or dist-info for generating "
+                           "production scripts from source. Not found in: "
+                           "%s" % (tool.name, site_packages))
                 return
 
-            with open(str(egg_link), "r") as f:
-                package_location = f.readline().strip()
-            path = [str(package_location)]
-        else:
-            path = [str(site_packages)]
-
         dists = Distribution.discover(name=tool.name, path=path)
         specifications = {
             ep.name: "{ep.name} = {ep.value}".format(ep=ep)
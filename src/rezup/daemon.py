@@ -0,0 +1,399 @@
+
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from .recipe import ContainerRecipe
+from .container import get_container_root, write_json
+from .sync import iter_remote_containers, find_missing_revisions, pull_revision
+
+
+_log = logging.getLogger("rezup")
+
+
+def default_status_file():
+    """Returns default daemon status file path
+
+    Which is `daemon.json` in the local root of default container.
+
+    Returns:
+        `pathlib.Path`
+
+    """
+    return get_container_root(ContainerRecipe(), remote=False) / "daemon.json"
+
+
+class Inotify(object):
+    """Minimal Linux inotify binding for waking up on directory changes
+
+    Note that inotify only sees changes that made from this host, changes
+    made by other NFS clients will not be noticed.
+
+    Raises:
+        OSError: When inotify is not available.
+
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux.")
+
+        import ctypes
+        import ctypes.util
+
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._watched = set()
+
+    def watch(self, path):
+        path = str(path)
+        if path in self._watched or not os.path.isdir(path):
+            return
+        wd = self._libc.inotify_add_watch(
+            self._fd, path.encode("utf-8"), self.MASK)
+        if wd >= 0:
+            self._watched.add(path)
+
+    def wait(self, timeout):
+        """Wait for any event, returns True if got any before timeout"""
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+        except (OSError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                return False
+            raise
+
+        if not readable:
+            return False
+        try:
+            while os.read(self._fd, 65536):
+                pass  # drain events, we only care about being woken up
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        return True
+
+    def close(self):
+        os.close(self._fd)
+
+
+class Daemon(object):
+    """Pull new remote revisions into local as soon as they are ready
+
+    Remote containers are checked by cheap `stat` calls on their manifest
+    and `revisions` directory, in an interval that starts from
+    `min_interval` and doubles whenever nothing has changed, up to
+    `max_interval`. On Linux, inotify is used to wake up earlier for the
+    changes that made from this host.
+
+    Missing revisions are pulled by at most `jobs` low priority processes,
+    and no new pulling will be started while system load average is above
+    `max_load` (if given). The daemon state, including the pulling queue,
+    is written into a JSON status file for monitoring.
+
+    A revision that is not ready in local after pulling, either failed or
+    skipped because other process is pulling it, is queued again with
+    exponential backoff. Failed one is given up after `MAX_RETRIES`, until
+    the remote container changes again.
+
+    Args:
+        names (list, optional): Containers to watch, all remote containers
+            if not given.
+        jobs (int): Max number of revisions being pulled at the same time.
+        min_interval (float): Min seconds between checks.
+        max_interval (float): Max seconds between checks.
+        max_load (float, optional): Not to start pulling when 1-minute load
+            average is above this value.
+        low_priority (bool): Run pulling processes with lowered priority.
+        status_file (str or path-like, optional): Where the daemon status
+            JSON goes, use `default_status_file()` if not given.
+
+    """
+    HISTORY_SIZE = 20
+    MAX_RETRIES = 5
+
+    def __init__(self,
+                 names=None,
+                 jobs=2,
+                 min_interval=5,
+                 max_interval=300,
+                 max_load=None,
+                 low_priority=True,
+                 status_file=None):
+        self._names = names
+        self._jobs = max(1, jobs)
+        self._min_interval = min_interval
+        self._max_interval = max(min_interval, max_interval)
+        self._max_load = max_load
+        self._low_priority = low_priority
+        self._status_file = status_file or default_status_file()
+
+        self._interval = min_interval
+        self._containers = dict()
+        self._signatures = dict()
+        self._queue = []  # (revision, queued time, not before)
+        self._building = dict()
+        self._retries = dict()
+        self._history = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._watcher = None
+        self._started = time.time()
+
+    def stop(self, *args):
+        self._stop.set()
+        self._wakeup.set()
+
+    def run(self):
+        try:
+            self._watcher = Inotify()
+        except (OSError, AttributeError) as e:
+            _log.info("inotify not available, polling only. (%s)" % e)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        pool = ThreadPool(self._jobs)
+        _log.info("Daemon started, status file: %s" % self._status_file)
+
+        last_scan = 0
+        next_check = 0
+        try:
+            while not self._stop.is_set():
+                if time.time() - last_scan > self._max_interval:
+                    self._scan_containers()
+                    last_scan = time.time()
+
+                if time.time() >= next_check:
+                    changed = self._check_containers()
+                    if changed:
+                        self._interval = self._min_interval
+                    else:
+                        self._interval = min(self._interval * 2,
+                                             self._max_interval)
+                    next_check = time.time() + self._interval
+
+                self._dispatch(pool)
+                self._write_status()
+                if self._wait(min(next_check, self._next_retry())
+                              - time.time()):
+                    next_check = 0
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            _log.info("Daemon stopping, waiting for pulling processes..")
+            with self._lock:
+                self._queue = []
+            pool.close()
+            pool.join()
+            if self._watcher is not None:
+                self._watcher.close()
+            self._write_status(running=False)
+
+    def _wait(self, timeout):
+        """Wait until timeout, or pulling finished, or stopped
+
+        Returns:
+            bool: True if woken up by changes that watcher noticed.
+
+        """
+        deadline = time.time() + timeout
+        while not self._stop.is_set():
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                return False  # dispatch the queue
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            # wake up periodically for checking flags
+            if self._watcher is None:
+                self._wakeup.wait(min(remaining, 1.0))
+            elif self._watcher.wait(min(remaining, 1.0)):
+                self._interval = self._min_interval
+                return True
+        return False
+
+    def _next_retry(self):
+        """Returns the earliest time that a queued revision could be pulled
+        """
+        with self._lock:
+            return min([t for _, _, t in self._queue] or [float("inf")])
+
+    def _scan_containers(self):
+        containers = dict()
+        for container in iter_remote_containers(self._names):
+            containers[container.name()] = container
+            if self._watcher is not None:
+                self._watcher.watch(container.path())
+                self._watcher.watch(container.revisions())
+
+        self._containers = containers
+
+    def _check_containers(self):
+        changed = False
+
+        for name, container in self._containers.items():
+            signature = []
+            for path in (container.manifest(), container.revisions()):
+                try:
+                    signature.append(os.stat(str(path)).st_mtime)
+                except OSError:
+                    signature.append(None)
+
+            if signature == self._signatures.get(name):
+                continue
+
+            try:
+                missing, _ = find_missing_revisions(container)
+            except Exception as e:
+                _log.error("Failed to check container %r: %s" % (name, e))
+                continue  # check again next time
+
+            self._signatures[name] = signature
+            changed = True
+
+            with self._lock:
+                queued = set(_key(r) for r, _, _ in self._queue)
+                for revision in missing:
+                    key = _key(revision)
+                    if key in self._building or key in queued:
+                        continue
+                    _log.info("New revision found: %s %s" % key)
+                    self._queue.append((revision, time.time(), 0))
+                    self._retries.pop(key, None)
+
+        return changed
+
+    def _dispatch(self, pool):
+        if self._max_load is not None and hasattr(os, "getloadavg"):
+            load = os.getloadavg()[0]
+            if load > self._max_load:
+                _log.debug("Load average %.2f above %.2f, pulling deferred."
+                           % (load, self._max_load))
+                return
+
+        now = time.time()
+        with self._lock:
+            for entry in list(self._queue):
+                if len(self._building) >= self._jobs:
+                    break
+                revision, _, not_before = entry
+                if not_before > now:
+                    continue  # backing off
+                self._queue.remove(entry)
+                self._building[_key(revision)] = time.time()
+                pool.apply_async(self._pull, (revision,))
+
+    def _pull(self, revision):
+        key = _key(revision)
+        name = key[0]
+        start = time.time()
+        _log.info("Pulling %s %s.." % key)
+        try:
+            returncode, output = pull_revision(
+                revision, self._low_priority, no_wait=True)
+        except Exception as e:
+            returncode, output = -1, str(e)
+
+        if returncode:
+            result = "failed"
+            _log.error("Failed to pull %s %s:\n%s" % (name, key[1], output))
+        elif _is_pulled(revision):
+            result = "pulled"
+            _log.info("Pulled %s %s." % key)
+        else:
+            result = "skipped"
+            _log.info("Skipped %s %s, being pulled by other process." % key)
+
+        with self._lock:
+            self._building.pop(key, None)
+            retries = self._retries.pop(key, 0) + 1
+            if result == "failed" and retries > self.MAX_RETRIES:
+                # will be retried when the remote container changed again
+                _log.error("Gave up pulling %s %s after %d retries."
+                           % (name, key[1], self.MAX_RETRIES))
+            elif result != "pulled" and not self._stop.is_set():
+                self._retries[key] = retries
+                delay = min(self._min_interval * 2 ** retries,
+                            self._max_interval)
+                self._queue.append((revision, time.time(),
+                                    time.time() + delay))
+
+            self._history.append({
+                "container": name,
+                "revision": key[1],
+                "result": result,
+                "returncode": returncode,
+                "started": start,
+                "elapsed": round(time.time() - start, 2),
+            })
+            self._history = self._history[-self.HISTORY_SIZE:]
+
+        self._write_status()
+        self._wakeup.set()
+
+    def _write_status(self, running=True):
+        with self._lock:
+            status = {
+                "running": running,
+                "pid": os.getpid(),
+                "hostname": socket.gethostname(),
+                "started": self._started,
+                "updated": time.time(),
+                "watcher": "polling" if self._watcher is None else "inotify",
+                "interval": self._interval,
+                "containers": {
+                    name: str(con.path())
+                    for name, con in self._containers.items()
+                },
+                "queue": [
+                    {"container": _key(r)[0], "revision": _key(r)[1],
+                     "queued": t, "not_before": n,
+                     "retries": self._retries.get(_key(r), 0)}
+                    for r, t, n in self._queue
+                ],
+                "building": [
+                    {"container": k[0], "revision": k[1], "started": t}
+                    for k, t in self._building.items()
+                ],
+                "history": list(self._history),
+            }
+            try:
+                dirname = os.path.dirname(str(self._status_file))
+                if not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+                write_json(self._status_file, status)
+            except (OSError, IOError) as e:
+                _log.error("Failed to write status file: %s" % e)
+
+
+def _key(revision):
+    return revision.container().name(), revision.dirname()
+
+
+def _is_pulled(revision):
+    """Returns True if the remote revision is ready in local"""
+    try:
+        return revision.pull(check_out=False) is not None
+    except Exception as e:
+        _log.debug("Failed to look up local revision: %s" % e)
+        return False
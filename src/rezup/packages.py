@@ -0,0 +1,216 @@
+
+import os
+import re
+import json
+import logging
+
+from .container import (
+    iter_containers,
+    find_site_packages,
+    list_distributions,
+    match_version,
+    normalize,
+    write_json,
+)
+from ._lock import FileLock
+
+
+_log = logging.getLogger("rezup")
+
+INDEX_SCHEMA = "rezup-packages:1.0"
+
+
+def parse_requirement(requirement):
+    """Parse requirement string into name and version spec
+
+    Example:
+        >>> parse_requirement("Foo_Bar>=1.2,<2")
+        ('foo-bar', '>=1.2,<2')
+
+    Raises:
+        ValueError: If the requirement is not valid.
+
+    """
+    match = re.match(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*"
+                     r"(?:\[[^\]]*\])?\s*(.*?)\s*$", requirement)
+    if not match:
+        raise ValueError("Invalid requirement: %r" % requirement)
+    name, spec = match.groups()
+    return normalize(name), spec or None
+
+
+def index_file(root):
+    """Returns the package index file path of a local containers root"""
+    return os.path.join(str(root), "packages.json")
+
+
+def local_roots():
+    """Returns local roots of all containers"""
+    return sorted(set(
+        str(c.root()) for c in iter_containers() if not c.is_remote()
+    ))
+
+
+def read_index(root):
+    """Returns the package index of root, or an empty one if not exists
+    """
+    try:
+        with open(index_file(root), "r") as f:
+            index = json.load(f)
+    except (OSError, IOError, ValueError):
+        index = None
+
+    if index is None or index.get("schema") != INDEX_SCHEMA:
+        index = {"schema": INDEX_SCHEMA, "revisions": {}, "packages": {}}
+    return index
+
+
+def revision_packages(revision):
+    """Returns distributions installed in each venv of a local revision
+
+    Sourced from revision metadata, or venvs if not recorded (revision
+    created by older rezup).
+
+    """
+    metadata = revision.metadata() or {}
+    if "packages" in metadata:
+        return metadata["packages"]
+
+    packages = dict()
+    for venv_name in metadata.get("venvs", ["rez"]):
+        site_packages = find_site_packages(
+            revision.path() / "venv" / venv_name)
+        if site_packages is not None:
+            packages[venv_name] = list_distributions(site_packages)
+    return packages
+
+
+def _key(revision):
+    return "%s/%s" % (revision.container().name(), revision.dirname())
+
+
+def _record(revision):
+    metadata = revision.metadata() or {}
+    return {
+        "container": revision.container().name(),
+        "revision": revision.dirname(),
+        "path": str(revision.path()),
+        "pulled_from": metadata.get("pulled_from"),
+        "packages": revision_packages(revision),
+    }
+
+
+def _update(root, add=None, remove=None, reset=False):
+    """Add/remove revisions into/from the index of root, never raises"""
+    lock = FileLock(os.path.join(str(root), ".packages.lock"),
+                    timeout=60,
+                    description="package index update")
+    try:
+        with lock:
+            index = read_index(root)
+            records = dict() if reset else index["revisions"]
+            for key in remove or []:
+                records.pop(key, None)
+            for revision in add or []:
+                records[_key(revision)] = _record(revision)
+
+            inverted = dict()
+            for key, record in records.items():
+                for venv_name, dists in record["packages"].items():
+                    for dist in dists:
+                        entries = inverted.setdefault(
+                            normalize(dist["name"]), [])
+                        entries.append([key, venv_name,
+                                        dist["version"], dist["location"]])
+
+            write_json(index_file(root), {
+                "schema": INDEX_SCHEMA,
+                "revisions": records,
+                "packages": inverted,
+            })
+    except Exception as e:
+        _log.warning("Failed to update package index %s: %s"
+                     % (index_file(root), e))
+
+
+def add_revision(revision):
+    """Index packages of a local revision"""
+    _update(revision.container().root(), add=[revision])
+
+
+def remove_revision(revision):
+    """Remove a local revision from package index"""
+    _update(revision.container().root(), remove=[_key(revision)])
+
+
+def remove_container(container):
+    """Remove all revisions of a local container from package index"""
+    root = container.root()
+    prefix = container.name() + "/"
+    keys = [k for k in read_index(root)["revisions"] if k.startswith(prefix)]
+    if keys:
+        _update(root, remove=keys)
+
+
+def rebuild(roots=None):
+    """Rebuild package index of local roots from ready revisions
+
+    Args:
+        roots (list, optional): Local roots to rebuild, all if not given.
+
+    """
+    roots = [str(r) for r in roots or local_roots()]
+    revisions = {root: [] for root in roots}
+    for container in iter_containers():
+        root = str(container.root())
+        if container.is_remote() or root not in revisions:
+            continue
+        revisions[root] += [
+            r for r in container.iter_revision() if r.is_ready()
+        ]
+
+    for root, revs in revisions.items():
+        _log.info("Indexing %d revisions in %s.." % (len(revs), root))
+        _update(root, add=revs, reset=True)
+
+
+def find(requirement, roots=None):
+    """Find local revisions that have the required package installed
+
+    Args:
+        requirement (str): Distribution name with optional version spec,
+            e.g. `requests`, `requests==2.25.1`, `requests>=2,<3`.
+        roots (list, optional): Local roots to look into, all if not given.
+
+    Returns:
+        list: A list of dict for each matched package in revision venv.
+
+    Raises:
+        ValueError: If the requirement is not valid.
+
+    """
+    name, spec = parse_requirement(requirement)
+    results = []
+    for root in roots or local_roots():
+        index = read_index(root)
+        for key, venv_name, version, location in \
+                index["packages"].get(name, []):
+            if spec and not match_version(version, spec):
+                continue
+            record = index["revisions"][key]
+            if not os.path.isdir(record["path"]):
+                continue  # removed without updating index
+            results.append({
+                "container": record["container"],
+                "revision": record["revision"],
+                "path": record["path"],
+                "pulled_from": record["pulled_from"],
+                "venv": venv_name,
+                "name": name,
+                "version": version,
+                "location": location,
+            })
+
+    results.sort(key=lambda r: (r["container"], r["revision"]),
+                 reverse=True)
+    return results
@@ -0,0 +1,351 @@
+
+import os
+import json
+import time
+import socket
+import logging
+
+from .container import write_json, replace_file, makedirs, MTIME_RESOLUTION
+from ._lock import FileLock
+from ._background import rezup_command, spawn_detached
+
+
+_log = logging.getLogger("rezup")
+
+CONTEXTS_DIRNAME = "contexts"
+INDEX_FILE = "index.json"
+CONFIG_DIRNAME = "config"
+CONFIG_FILE = "rezconfig.py"
+SOURCES_FILE = "sources.json"
+
+
+def prewarm_revision(revision, force=False):
+    """Prewarm what is enabled in recipe but outdated or not done yet
+
+    Args:
+        revision (`rezup.Revision`): A ready local revision
+        force (bool): Prewarm everything, no matter outdated or not.
+
+    Returns:
+        dict: Baked config file path (None if not baked) and keys of
+            contexts that saved.
+
+    """
+    result = {"config": None, "contexts": []}
+    if is_config_enabled(revision):
+        if force or baked_config(revision,
+                                 revision.recipe_env(baked=False)) is None:
+            result["config"] = bake_config(revision)
+
+    keys = [k for k in sorted(recipe_contexts(revision))
+            if force or _is_stale(revision, k)]
+    if keys:
+        result["contexts"] = prewarm(revision, keys)
+    return result
+
+
+def is_enabled(revision):
+    """Returns True if anything is enabled to prewarm in revision recipe"""
+    return is_config_enabled(revision) or bool(recipe_contexts(revision))
+
+
+def prewarm_in_background(revision):
+    """Prewarm everything of local revision in a detached process
+
+    Args:
+        revision (`rezup.Revision`): A ready local revision
+
+    """
+    container = revision.container()
+    args = rezup_command("prewarm", container.name(),
+                         "--revision", revision.dirname(), "--force")
+    log_file = container.locks() / (revision.dirname() + ".prewarm.log")
+    makedirs(container.locks())
+    pid = spawn_detached(args, log_file=log_file)
+    _log.debug("Background prewarming process started (pid %d), log file: "
+               "%s" % (pid, log_file))
+
+
+def _tmp_suffix():
+    return ".%s-%d.tmp" % (socket.gethostname(), os.getpid())
+
+
+def recipe_contexts(revision):
+    """Returns package requests to prewarm that listed in revision recipe
+
+    ```toml
+    [prewarm.contexts]
+    maya = "maya-2022 pymel"
+    nuke = ["nuke-13", "ocio_config"]
+    ```
+
+    Returns:
+        dict: Space separated package requests, by context key.
+
+    """
+    recipe = revision.recipe() or {}
+    contexts = (recipe.get("prewarm") or {}).get("contexts") or {}
+    return {
+        key: " ".join(value) if isinstance(value, list) else str(value)
+        for key, value in contexts.items()
+    }
+
+
+def contexts_dir(revision):
+    """Returns the directory that saves prewarmed contexts in revision"""
+    return os.path.join(str(revision.path()), CONTEXTS_DIRNAME)
+
+
+def read_index(revision):
+    """Returns prewarmed context entries, by context key"""
+    try:
+        with open(os.path.join(contexts_dir(revision), INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, IOError, ValueError):
+        return dict()
+
+
+def prewarm(revision, keys=None):
+    """Resolve contexts that listed in recipe and save them into revision
+
+    Never raises, failed ones are logged.
+
+    Args:
+        revision (`rezup.Revision`): A ready local revision
+        keys (list, optional): Context keys to resolve, all if not given.
+
+    Returns:
+        list: Keys of contexts that saved.
+
+    """
+    from . import util
+    from .resolve_cache import fingerprint
+
+    contexts = recipe_contexts(revision)
+    keys = [k for k in (keys or sorted(contexts)) if k in contexts]
+    if not keys:
+        return []
+
+    dirpath = contexts_dir(revision)
+    items = [[contexts[k], os.path.join(dirpath, k + ".rxt" + _tmp_suffix())]
+             for k in keys]
+    # taken before resolving, so releases made while solving are caught
+    started = time.time() - MTIME_RESOLUTION
+    try:
+        makedirs(dirpath)
+        env = os.environ.copy()
+        env.update(revision.recipe_env() or {})
+        args = util._rez_python_args(revision)
+        _log.info("Prewarming contexts: %s" % ", ".join(keys))
+        responses = util._run_action(args, env, "resolve_many", items)
+    except Exception as e:
+        _log.warning("Failed to prewarm contexts in %s: %s"
+                     % (revision.path(), e))
+        return []
+
+    saved = dict()
+    for key, (requests, tmp), response in zip(keys, items, responses):
+        if not response["ok"]:
+            _log.warning("Failed to prewarm context %r: %s"
+                         % (key, response["error"]))
+        elif os.path.isfile(tmp):
+            prints = fingerprint(requests, response["result"])
+            if any(m is not None and m >= started for _, m in prints):
+                _log.warning("Packages changed while prewarming context "
+                             "%r, not saved." % key)
+                os.remove(tmp)
+                continue
+            replace_file(tmp, os.path.join(dirpath, key + ".rxt"))
+            saved[key] = {
+                "requests": requests,
+                "created": time.time(),
+                "fingerprint": prints,
+            }
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+
+    if saved:
+        _update_index(revision, saved)
+    return sorted(saved)
+
+
+def _update_index(revision, entries):
+    dirpath = contexts_dir(revision)
+    lock = FileLock(os.path.join(dirpath, ".lock"),
+                    timeout=60,
+                    description="prewarmed contexts update")
+    try:
+        with lock:
+            index = read_index(revision)
+            index.update(entries)
+            write_json(os.path.join(dirpath, INDEX_FILE), index)
+    except Exception as e:
+        _log.warning("Failed to update prewarmed contexts in %s: %s"
+                     % (dirpath, e))
+
+
+def match(revision, requests):
+    """Returns the key of prewarmed context that has the same requests"""
+    requests = requests.split()
+    for key, entry in read_index(revision).items():
+        if entry["requests"].split() == requests:
+            return key
+
+
+def get_context(revision, key, refresh=True):
+    """Returns the file path of prewarmed context
+
+    Context that has any involved package repository changed since it was
+    resolved is stale, which will be re-resolved if `refresh` is True.
+
+    Args:
+        revision (`rezup.Revision`): A ready local revision
+        key (str): Context key
+        refresh (bool): Re-resolve stale context and save it into revision.
+            Default True.
+
+    Returns:
+        str: The `.rxt` file path, or None if not available.
+
+    """
+    path = os.path.join(contexts_dir(revision), key + ".rxt")
+    if _is_stale(revision, key):
+        if not refresh or key not in recipe_contexts(revision):
+            return
+        _log.debug("Prewarmed context %r is stale, re-resolving.." % key)
+        if key not in prewarm(revision, [key]):
+            return
+
+    return path
+
+
+def _is_stale(revision, key):
+    entry = read_index(revision).get(key)
+    path = os.path.join(contexts_dir(revision), key + ".rxt")
+    return entry is None or not os.path.isfile(path) or any(
+        _mtime(p) != m for p, m in entry["fingerprint"]
+    )
+
+
+def is_config_enabled(revision):
+    """Returns True if baking rez config is enabled in revision recipe
+
+    ```toml
+    [prewarm]
+    config = true
+    ```
+
+    """
+    recipe = revision.recipe() or {}
+    return bool((recipe.get("prewarm") or {}).get("config"))
+
+
+def config_dir(revision):
+    """Returns the directory that saves baked rez config in revision"""
+    return os.path.join(str(revision.path()), CONFIG_DIRNAME)
+
+
+def config_sources(config_file):
+    """Returns file paths that rez may load config from
+
+    Rez looks for the `.py` file first, then the path as-is for YAML.
+
+    Args:
+        config_file (str): The value of `$REZ_CONFIG_FILE`
+
+    """
+    paths = []
+    for path in config_file.split(os.pathsep):
+        if path:
+            for candidate in (os.path.splitext(path)[0] + ".py", path):
+                if candidate not in paths:
+                    paths.append(candidate)
+    return paths
+
+
+def bake_config(revision):
+    """Merge rez config files of recipe env into one file in revision
+
+    Rez config files that listed in `REZ_CONFIG_FILE` of recipe env are
+    loaded and merged with rez's root config by rez-python, and written
+    into revision as one Python file. Never raises, failure is logged.
+
+    Args:
+        revision (`rezup.Revision`): A ready local revision
+
+    Returns:
+        str: Baked config file path, or None if not baked.
+
+    """
+    from . import util
+
+    env = revision.recipe_env(baked=False) or {}
+    config_file = env.get("REZ_CONFIG_FILE")
+    if not config_file:
+        _log.debug("No REZ_CONFIG_FILE in recipe env, nothing to bake.")
+        return
+
+    dirpath = config_dir(revision)
+    path = os.path.join(dirpath, CONFIG_FILE)
+    tmp = path + _tmp_suffix()
+    # taken before reading, so changes made while baking are caught later
+    fingerprint = [[p, _mtime(p)] for p in config_sources(config_file)]
+    try:
+        makedirs(dirpath)
+        process_env = os.environ.copy()
+        process_env.update(env)
+        args = util._rez_python_args(revision)
+        _log.info("Baking rez config..")
+        util._run_action(args, process_env, "bake_config", tmp)
+        replace_file(tmp, path)
+        write_json(os.path.join(dirpath, SOURCES_FILE), {
+            "config_file": config_file,
+            "created": time.time(),
+            "fingerprint": fingerprint,
+        })
+    except Exception as e:
+        _log.warning("Failed to bake rez config in %s: %s"
+                     % (revision.path(), getattr(e, "output", None) or e))
+        return
+    finally:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+
+    return path
+
+
+def baked_config(revision, env):
+    """Returns baked config file path if it's up to date with the sources
+
+    Args:
+        revision (`rezup.Revision`): The revision that may have baked config
+        env (dict): Recipe env that is not baked, see `Revision.recipe_env()`
+
+    Returns:
+        str: Baked config file path, or None if not baked or outdated.
+
+    """
+    config_file = env.get("REZ_CONFIG_FILE")
+    if not config_file:
+        return
+
+    dirpath = config_dir(revision)
+    try:
+        with open(os.path.join(dirpath, SOURCES_FILE)) as f:
+            sources = json.load(f)
+    except (OSError, IOError, ValueError):
+        return
+
+    if sources["config_file"] != config_file or any(
+            _mtime(p) != m for p, m in sources["fingerprint"]):
+        _log.debug("Baked rez config is outdated, using sources.")
+        return
+
+    return os.path.join(dirpath, CONFIG_FILE)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
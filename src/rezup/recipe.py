@@ -1,6 +1,9 @@
 
+import os
 import re
 import sys
+import json
+import time
 from copy import deepcopy
 from contextlib import contextmanager
 
@@ -19,6 +22,8 @@ from ._vendor import toml
 
 DEFAULT_CONTAINER_NAME = ".main"  #: default container name: `.main`
 DEFAULT_CONTAINER_RECIPES = Path.home()  #: user home directory
+REGISTRY_FILE = ".rezup_recipes.json"  #: recipe registry file name
+REGISTRY_MTIME_RESOLUTION = 2  # seconds
 
 
 class BaseRecipe(DictMixin, object):
@@ -37,11 +42,12 @@ class BaseRecipe(DictMixin, object):
             self._load()
         return self.__data
 
-    def _load(self):
-        data = toml.load(str(self.DEFAULT_RECIPE))
-        path = self.path()
-        if path.is_file():
-            deep_update(data, toml.load(str(path)))
+    def _load(self, data=None):
+        if data is None:
+            data = toml.load(str(self.DEFAULT_RECIPE))
+            path = self.path()
+            if path.is_file():
+                deep_update(data, toml.load(str(path)))
         self.__data = data
 
     def __repr__(self):
@@ -140,17 +146,90 @@ class ContainerRecipe(BaseRecipe):
     @classmethod
     def iter_recipes(cls):
         """Iter all recipe files found in `ContainerRecipe.RECIPES_DIR`
+
+        Recipe file names are looked up from the registry file in
+        `RECIPES_DIR` when it is valid, which costs one `stat` and one small
+        read, instead of visiting every entry in the directory (usually the
+        home directory). See `ContainerRecipe.registry()`.
+
         Yields:
             `ContainerRecipe`
         """
-        for item in cls.RECIPES_DIR.iterdir():
-            if not item.is_file():
-                continue
-            match = cls.REGEX.search(item.name)
+        for filename in cls._registered_files():
+            match = cls.REGEX.search(filename)
             if match:
                 name = match.group(1)
                 yield cls(name)
 
+    @classmethod
+    def registry(cls):
+        """Returns the path of recipe registry file
+
+        The registry records recipe file names in `RECIPES_DIR` along with
+        the directory's modification time. It's valid as long as that time
+        doesn't change, i.e. no file has been added, removed or renamed in
+        that directory since.
+
+        Any change, including `create()` a new recipe, makes it stale and
+        the next listing rescans the directory. The rescan result is only
+        recorded once the directory's modification time is older than
+        `REGISTRY_MTIME_RESOLUTION`, since changes made within that can't
+        be told on some file systems.
+
+        Returns:
+            pathlib.Path: The registry file path
+        """
+        return cls.RECIPES_DIR / REGISTRY_FILE
+
+    @classmethod
+    def _read_registry(cls, mtime):
+        try:
+            with open(str(cls.registry()), "r") as f:
+                registry = json.load(f)
+        except (OSError, IOError, ValueError):
+            return
+        if registry.get("mtime") == mtime:
+            return registry["files"]
+
+    @classmethod
+    def _write_registry(cls, files, mtime):
+        # written in place, so the directory mtime stays unchanged
+        try:
+            with open(str(cls.registry()), "w") as f:
+                json.dump({"mtime": mtime, "files": sorted(files)}, f)
+        except (OSError, IOError):
+            pass  # e.g. read-only home, just scan next time
+
+    @classmethod
+    def _registered_files(cls):
+        recipes_dir = str(cls.RECIPES_DIR)
+        try:
+            mtime = os.stat(recipes_dir).st_mtime
+        except OSError:
+            return []
+
+        files = cls._read_registry(mtime)
+        if files is not None:
+            return files
+
+        # full scan
+        if not cls.registry().is_file():
+            # create it first, writing it changes the directory mtime
+            cls._write_registry([], None)
+            mtime = os.stat(recipes_dir).st_mtime
+
+        files = [
+            name for name in os.listdir(recipes_dir)
+            if cls.REGEX.search(name)
+            and os.path.isfile(os.path.join(recipes_dir, name))
+        ]
+        # changes made within coarse mtime resolution (e.g. one second on
+        #   some network file systems) can't be told, not to trust it yet
+        if time.time() - mtime > REGISTRY_MTIME_RESOLUTION:
+            cls._write_registry(files, mtime)
+
+        return files
+
     def path(self):
         """Returns the file path of this recipe
         Returns:
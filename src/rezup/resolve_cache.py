@@ -0,0 +1,261 @@
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+
+from .container import get_container_root, write_json
+from .cleanup import parse_age
+
+
+_log = logging.getLogger("rezup")
+
+CACHE_DIRNAME = ".resolves"
+DEFAULT_TTL = "1d"
+DEFAULT_SIZE = 500
+
+_family_regex = re.compile(r"^[~!]?([A-Za-z_0-9]+)")
+
+
+def get_mode(cache=None):
+    """Returns cache mode, `env`, `rxt` or None (disabled)
+
+    Args:
+        cache (bool or str, optional): `True` or `"env"` for returning cached
+            environment directly, `"rxt"` for re-evaluating the cached context
+            file, `False` for disabling. Follows `$REZUP_RESOLVE_CACHE` if not
+            given.
+
+    """
+    if cache is None:
+        cache = os.getenv("REZUP_RESOLVE_CACHE") or False
+    if cache is True:
+        cache = "env"
+    if cache and cache not in ("env", "rxt"):
+        raise ValueError("Unknown resolve cache mode: %r" % cache)
+    return cache or None
+
+
+def get_ttl():
+    """Returns seconds that cached resolve lives, `$REZUP_RESOLVE_CACHE_TTL`
+    """
+    return parse_age(os.getenv("REZUP_RESOLVE_CACHE_TTL") or DEFAULT_TTL)
+
+
+def get_size():
+    """Returns max count of cached resolves, `$REZUP_RESOLVE_CACHE_SIZE`"""
+    return int(os.getenv("REZUP_RESOLVE_CACHE_SIZE") or DEFAULT_SIZE)
+
+
+def cache_dir(revision):
+    """Returns resolve cache dir, which is in the local root of container
+    """
+    recipe = revision.container().recipe()
+    return os.path.join(str(get_container_root(recipe, remote=False)),
+                        CACHE_DIRNAME)
+
+
+def make_key(revision, requests, env):
+    """Returns cache key of resolving requests in revision with environment
+
+    Args:
+        revision (`rezup.Revision`): The revision that resolves
+        requests (str): Space separated package requests
+        env (dict): The environment that resolves in, only `REZ_*` and
+            recipe env are taken.
+
+    """
+    recipe_env = revision.recipe_env() or {}
+    data = [
+        str(revision.path()),
+        revision.dirname(),  # timestamp
+        requests.split(),
+        recipe_env,
+        {k: v for k, v in env.items()
+         if k.startswith("REZ_") or k in recipe_env},
+    ]
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def fingerprint(requests, resolved_env):
+    """Returns modification time of package repositories that involved
+
+    Which are repository roots, package family directories of requests and
+    resolved packages, and the version directories of resolved packages.
+    Releasing a package changes at least one of them.
+
+    Returns:
+        list: A list of path and modification time (None if not exists).
+
+    """
+    repos = [p for p in resolved_env.get(
+        "REZ_USED_PACKAGES_PATH", "").split(os.pathsep) if p]
+
+    families = set()
+    versions = set()
+    for request in requests.split():
+        match = _family_regex.match(request)
+        if match:
+            families.add(match.group(1))
+    for package in resolved_env.get("REZ_RESOLVE", "").split():
+        if package.startswith("~") or package.startswith("."):
+            continue  # weak or ephemeral
+        name, _, version = package.split("[")[0].partition("-")
+        families.add(name)
+        if version:
+            versions.add((name, version))
+
+    paths = list(repos)
+    for repo in repos:
+        paths += [os.path.join(repo, f) for f in sorted(families)]
+        paths += [os.path.join(repo, f, v) for f, v in sorted(versions)]
+
+    return [[path, _mtime(path)] for path in paths]
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def lookup(revision, key):
+    """Returns cached resolve entry if it's still valid
+
+    Entry that has expired or any involved package repository changed will
+    be removed. Hit entry is touched for LRU.
+
+    Returns:
+        dict: Cache entry that has `env` and `rxt` file path, or None.
+
+    """
+    path = os.path.join(cache_dir(revision), key + ".json")
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (OSError, IOError, ValueError):
+        return
+
+    reason = None
+    if time.time() - entry["created"] > get_ttl():
+        reason = "expired"
+    elif any(_mtime(p) != m for p, m in entry["fingerprint"]):
+        reason = "package repository changed"
+    elif not os.path.isfile(entry["rxt"]):
+        reason = "context file missing"
+
+    if reason is not None:
+        _log.debug("Resolve cache %s outdated: %s" % (key, reason))
+        _remove(path)
+        return
+
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return entry
+
+
+def rxt_file(revision, key):
+    """Returns the path for saving resolved context of the key"""
+    return os.path.join(cache_dir(revision), key + ".rxt")
+
+
+def store(revision, key, requests, resolved_env, rxt):
+    """Save resolved environment into cache, and evict LRU entries
+
+    Args:
+        revision (`rezup.Revision`): The revision that resolved
+        key (str): Cache key, see `make_key()`
+        requests (str): Space separated package requests
+        resolved_env (dict): Resolved context environment
+        rxt (str): Saved context file path, see `rxt_file()`
+
+    """
+    entry = {
+        "revision": str(revision.path()),
+        "requests": requests,
+        "created": time.time(),
+        "fingerprint": fingerprint(requests, resolved_env),
+        "rxt": rxt,
+        "env": resolved_env,
+    }
+    try:
+        write_json(os.path.join(cache_dir(revision), key + ".json"), entry)
+    except (OSError, IOError) as e:
+        _log.debug("Failed to write resolve cache: %s" % e)
+        return
+    evict(cache_dir(revision), get_size())
+
+
+def evict(dirpath, size):
+    """Remove least recently used entries beyond size"""
+    entries = []
+    for name in os.listdir(dirpath):
+        if name.endswith(".json"):
+            path = os.path.join(dirpath, name)
+            mtime = _mtime(path)
+            if mtime is not None:
+                entries.append((mtime, path))
+
+    entries.sort(reverse=True)
+    for _, path in entries[size:]:
+        _remove(path)
+
+
+def invalidate(revision=None, roots=None):
+    """Remove cached resolves
+
+    Args:
+        revision (`rezup.Revision`, optional): Only remove resolves of this
+            revision.
+        roots (list, optional): Local containers roots that have the cache,
+            the local root of `revision` container, or all local roots if
+            not given.
+
+    Returns:
+        int: Count of removed entries.
+
+    """
+    if roots:
+        dirs = [os.path.join(str(r), CACHE_DIRNAME) for r in roots]
+    elif revision is not None:
+        dirs = [cache_dir(revision)]
+    else:
+        from .packages import local_roots
+        dirs = [os.path.join(r, CACHE_DIRNAME) for r in local_roots()]
+
+    count = 0
+    for dirpath in dirs:
+        try:
+            names = os.listdir(dirpath)
+        except OSError:
+            continue
+
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(dirpath, name)
+            if revision is not None:
+                try:
+                    with open(path, "r") as f:
+                        if json.load(f)["revision"] != str(revision.path()):
+                            continue
+                except (OSError, IOError, ValueError, KeyError):
+                    pass
+            _remove(path)
+            count += 1
+    return count
+
+
+def _remove(entry_path):
+    for path in (entry_path, entry_path[:-len(".json")] + ".rxt"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
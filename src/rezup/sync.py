@@ -0,0 +1,191 @@
+
+import time
+import logging
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+from .container import Container, iter_containers
+from ._background import rezup_command, run_low_priority
+
+
+_log = logging.getLogger("rezup")
+
+
+def iter_remote_containers(names=None):
+    """Iterate containers that are linked to remote
+
+    Args:
+        names (list, optional): Container names to look for, all containers
+            if not given.
+
+    Yields:
+        Container
+
+    """
+    for container in iter_containers():
+        if not container.is_remote():
+            continue
+        if names and container.name() not in names:
+            continue
+        yield container
+
+
+def find_missing_revisions(container, backfill=1):
+    """Find remote ready revisions that are not in local yet
+
+    Args:
+        container (Container): A remote container
+        backfill (int): How many latest ready remote revisions to check,
+            default 1 (only the latest one).
+
+    Returns:
+        tuple: List of missing remote revisions and list of the ones that
+            exist in local, both in latest first order.
+
+    """
+    local = Container(container.name(),
+                      recipe=container.recipe(),
+                      force_local=True)
+    local_revs = set(
+        r.dirname() for r in local.iter_revision() if r.is_ready()
+    )
+
+    missing = []
+    existing = []
+    for revision in container.iter_revision():
+        if len(missing) + len(existing) >= max(1, backfill):
+            break
+        if not revision.is_ready():
+            continue
+        if revision.dirname() in local_revs:
+            existing.append(revision)
+        else:
+            missing.append(revision)
+
+    return missing, existing
+
+
+def pull_revision(revision, low_priority=True, no_wait=False):
+    """Pull remote revision into local in a subprocess
+
+    Args:
+        revision (Revision): The remote revision to pull
+        low_priority (bool): Default True, run the pulling process with
+            lowered CPU and IO priority.
+        no_wait (bool): Default False, skip pulling if the revision is
+            being pulled by other process.
+
+    Returns:
+        tuple: Return code and the output of the pulling process
+
+    """
+    args = rezup_command("pull", revision.container().name(),
+                         "--revision", revision.dirname())
+    if no_wait:
+        args.append("--no-wait")
+
+    if low_priority:
+        return run_low_priority(args)
+
+    popen = subprocess.Popen(args,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT,
+                             universal_newlines=True)
+    output, _ = popen.communicate()
+    return popen.returncode, output
+
+
+def sync(names=None, jobs=4, backfill=1, low_priority=True):
+    """Pull missing remote revisions of containers into local in parallel
+
+    Args:
+        names (list, optional): Container names to sync, all remote
+            containers if not given.
+        jobs (int): Max number of revisions being pulled at the same time.
+        backfill (int): How many latest ready remote revisions to pull for
+            each container, default 1 (only the latest one).
+        low_priority (bool): Default True, run pulling processes with
+            lowered CPU and IO priority.
+
+    Yields:
+        dict: Sync result of each container, in the order of completion.
+
+    """
+    results = dict()
+    pending = dict()
+    tasks = []
+
+    for container in iter_remote_containers(names):
+        name = container.name()
+        result = results[name] = {
+            "container": name,
+            "remote": str(container.path()),
+            "latest": None,
+            "existing": [],
+            "pulled": [],
+            "failed": [],
+            "status": "ok",
+            "elapsed": 0.0,
+        }
+        try:
+            missing, existing = find_missing_revisions(container, backfill)
+        except Exception as e:
+            _log.error("Failed to sync container %r: %s" % (name, e))
+            result["status"] = "error"
+            result["error"] = str(e)
+            yield result
+            continue
+
+        revisions = missing + existing
+        revisions.sort(key=lambda r: r.dirname(), reverse=True)
+        result["latest"] = revisions[0].dirname() if revisions else None
+        result["existing"] = [r.dirname() for r in existing]
+
+        if not missing:
+            yield result
+            continue
+
+        pending[name] = len(missing)
+        tasks += missing
+
+    if not tasks:
+        return
+
+    def _pull(revision):
+        start = time.time()
+        _log.info("Pulling %s %s.." % (revision.container().name(),
+                                       revision.dirname()))
+        try:
+            returncode, output = pull_revision(revision, low_priority)
+        except Exception as e:
+            # report as failed instead of aborting other pulls
+            returncode, output = -1, str(e)
+        return revision, returncode, output, time.time() - start
+
+    pool = ThreadPool(max(1, jobs))
+    try:
+        for revision, returncode, output, elapsed in \
+                pool.imap_unordered(_pull, tasks):
+            name = revision.container().name()
+            result = results[name]
+            result["elapsed"] += elapsed
+
+            if returncode == 0:
+                result["pulled"].append(revision.dirname())
+            else:
+                _log.error("Failed to pull %s %s:\n%s"
+                           % (name, revision.dirname(), output))
+                result["status"] = "failed"
+                result["failed"].append({
+                    "revision": revision.dirname(),
+                    "returncode": returncode,
+                    "output": output[-2000:],
+                })
+
+            pending[name] -= 1
+            if not pending[name]:
+                result["elapsed"] = round(result["elapsed"], 2)
+                yield result
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,264 @@
+
+import os
+import json
+import stat
+import time
+import logging
+from multiprocessing.pool import ThreadPool
+
+from .container import write_json
+from .exceptions import ContainerError
+from ._lock import FileLock
+
+
+_log = logging.getLogger("rezup")
+
+try:
+    _scandir = os.scandir  # py3
+except AttributeError:
+    try:
+        from scandir import scandir as _scandir  # noqa, py2 backport
+    except ImportError:
+        _scandir = None
+
+
+def format_size(num):
+    """Returns human readable file size"""
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(num) < 1024.0 or unit == "TB":
+            return "%.1f %s" % (num, unit) if unit != "B" else "%d B" % num
+        num /= 1024.0
+
+
+def measure(path, jobs=8, pool=None):
+    """Measure disk usage of a directory tree
+
+    Directories are scanned level by level in parallel, which is a lot
+    faster than `du` on network file systems where each call is a round
+    trip. Files are counted by allocated size and deduplicated by inode.
+
+    A file is *unique* to the tree if all of its hardlinks are inside the
+    tree, so the space will be freed once the tree is removed. Otherwise
+    it's *shared* with something else, e.g. other revisions.
+
+    Args:
+        path (str or path-like): Directory to measure
+        jobs (int): Number of threads, if `pool` is not given.
+        pool (`multiprocessing.pool.ThreadPool`, optional): Threads to work
+            with.
+
+    Returns:
+        dict: With keys `size`, `unique`, `shared` (in bytes) and `files`.
+
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = ThreadPool(max(1, jobs))
+
+    inodes = dict()  # (dev, ino): [size, nlink, links seen]
+    files = 0
+    level = [str(path)]
+    try:
+        while level:
+            subdirs = []
+            for dirs, entries in pool.imap_unordered(_scan, level):
+                subdirs += dirs
+                for key, size, nlink in entries:
+                    files += 1
+                    record = inodes.get(key)
+                    if record is None:
+                        inodes[key] = [size, nlink, 1]
+                    else:
+                        record[2] += 1
+            level = subdirs
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+    size = unique = 0
+    for file_size, nlink, seen in inodes.values():
+        size += file_size
+        if seen >= nlink:
+            unique += file_size
+
+    return {
+        "size": size,
+        "unique": unique,
+        "shared": size - unique,
+        "files": files,
+    }
+
+
+def _scan(dirpath):
+    """Stat entries in directory, returns sub-directories and file records
+    """
+    subdirs = []
+    entries = []
+    try:
+        if _scandir is not None:
+            for entry in _scandir(dirpath):
+                st = entry.stat(follow_symlinks=False)
+                if not st.st_ino:
+                    st = os.lstat(entry.path)  # Windows, scandir has no inode
+                _record(entry.path, st, subdirs, entries)
+        else:
+            for name in os.listdir(dirpath):
+                path = os.path.join(dirpath, name)
+                _record(path, os.lstat(path), subdirs, entries)
+    except OSError as e:
+        _log.debug("Failed to scan %s: %s" % (dirpath, e))
+    return subdirs, entries
+
+
+def _record(path, st, subdirs, entries):
+    if stat.S_ISDIR(st.st_mode):
+        subdirs.append(path)
+        nlink = 1  # directory link count is about its sub-directories
+    else:
+        nlink = st.st_nlink
+    blocks = getattr(st, "st_blocks", None)
+    size = blocks * 512 if blocks is not None else st.st_size
+    entries.append(((st.st_dev, st.st_ino), size, nlink))
+
+
+def cache_file(container):
+    """Returns disk usage cache file path of container"""
+    return container.path() / "usage.json"
+
+
+def read_cache(container):
+    """Returns cached disk usage of revisions in container, by dirname"""
+    try:
+        with open(str(cache_file(container)), "r") as f:
+            return json.load(f)["revisions"]
+    except (OSError, IOError, ValueError, KeyError):
+        return dict()
+
+
+def _update_cache(container, entries):
+    """Merge measured entries into cache, and drop the purged ones
+
+    The cache is re-read under a lock, so concurrent updates (e.g. from
+    parallel syncs) don't drop each other's entries.
+
+    """
+    lock = FileLock(container.locks() / "usage.lock",
+                    timeout=60,
+                    description="disk usage cache update")
+    revisions_root = str(container.revisions())
+    try:
+        with lock:
+            cache = read_cache(container)
+            cache.update(entries)
+            for dirname in list(cache):
+                if not os.path.isdir(os.path.join(revisions_root, dirname)):
+                    del cache[dirname]  # purged
+            write_json(cache_file(container), {"revisions": cache})
+    except (OSError, IOError, ContainerError) as e:
+        _log.debug("Failed to write usage cache: %s" % e)
+
+
+def signature(revision):
+    """Returns a cheap signature for telling if revision content changed
+
+    Which is the modification time of revision directory and its direct
+    children, e.g. venvs. Costs a few `stat` calls. Leases are excluded,
+    they change without touching the venvs.
+
+    """
+    path = str(revision.path())
+    excluded = (revision.leases().name,)
+    mtimes = [os.stat(path).st_mtime]
+    for name in sorted(os.listdir(path)):
+        if name in excluded:
+            continue
+        mtimes.append(os.stat(os.path.join(path, name)).st_mtime)
+    return mtimes
+
+
+def get_cached(revision, cache=None):
+    """Returns cached disk usage of revision without measuring
+
+    Args:
+        revision (`rezup.Revision`): A local revision
+        cache (dict, optional): Pre-read cache, see `read_cache()`.
+
+    Returns:
+        dict: Disk usage, or None if not cached or outdated.
+
+    """
+    if cache is None:
+        cache = read_cache(revision.container())
+    entry = cache.get(revision.dirname())
+    if entry is None:
+        return
+    try:
+        if entry["signature"] != signature(revision):
+            return
+    except OSError:
+        return
+    return entry
+
+
+def revision_usage(revision, refresh=False, pool=None):
+    """Returns disk usage of revision, measure and cache it if needed
+
+    Args:
+        revision (`rezup.Revision`): A local revision
+        refresh (bool): Measure even if cached.
+        pool (`multiprocessing.pool.ThreadPool`, optional): Threads to work
+            with.
+
+    Returns:
+        dict: See `measure()`, plus the `signature` and `measured` time.
+
+    """
+    return usage_of([revision], refresh=refresh, pool=pool)[0][1]
+
+
+def usage_of(revisions, refresh=False, jobs=8, pool=None):
+    """Returns disk usage of local revisions from same container
+
+    Only revisions that are not cached, or changed since cached, will be
+    measured. Cache entries of revisions that no longer exist are dropped.
+
+    Args:
+        revisions (list): Local revisions of one container
+        refresh (bool): Measure all revisions even if cached.
+        jobs (int): Number of threads, if `pool` is not given.
+        pool (`multiprocessing.pool.ThreadPool`, optional): Threads to work
+            with.
+
+    Returns:
+        list: A list of tuple that contains revision and its disk usage.
+
+    """
+    if not revisions:
+        return []
+
+    container = revisions[0].container()
+    assert not container.is_remote(), "Only local revision has disk usage."
+
+    cache = read_cache(container)
+    results = []
+    measured = dict()
+    for revision in revisions:
+        usage = None if refresh else get_cached(revision, cache)
+        if usage is None:
+            _log.debug("Measuring disk usage: %s" % revision.path())
+            sig = signature(revision)
+            usage = measure(revision.path(), jobs=jobs, pool=pool)
+            usage.update({"signature": sig, "measured": time.time()})
+            measured[revision.dirname()] = usage
+        results.append((revision, usage))
+
+    revisions_root = str(container.revisions())
+    purged = [
+        dirname for dirname in cache
+        if not os.path.isdir(os.path.join(revisions_root, dirname))
+    ]
+    if measured or purged:
+        _update_cache(container, measured)
+
+    return results
@@ -1,32 +1,58 @@
 
 import os
-import re
 import sys
 import json
+import time
+import atexit
+import hashlib
+import socket
 import logging
+import tempfile
+import threading
 import subprocess
+from multiprocessing.pool import ThreadPool
 
 try:
     from pathlib import Path  # noqa, py3
 except ImportError:
     from pathlib2 import Path  # noqa, py2
 
-from . import Revision, Container, ContainerError
+from . import Revision, Container, ContainerRecipe, ContainerError
+from .container import makedirs, replace_file
 
 
 _log = logging.getLogger("rezup.util")
 
 
-def resolve_environ(revision, requests_or_rxt):
+def resolve_environ(revision, requests_or_rxt, cache=None, in_process=None):
     """Resolve package requests with Rez from container
 
-    Open a subprocess and call rez-python that is located from container to
-    resolve the request and returns the context environment.
+    Call rez-python that is located from container to resolve the request
+    and returns the context environment.
+
+    Each call resolves in a new rez-python subprocess by default. If
+    `$REZUP_WORKER_IDLE` is set to a positive number, the rez-python process
+    is kept alive as a worker and reused by later calls on the same revision,
+    so Rez only gets imported once, and it will be stopped after being idle
+    for that many seconds. Note that rez global states (e.g. memcache
+    clients, package caches) are kept in worker between resolves.
+
+    Resolved environment and context could be cached on disk, and be reused
+    until expired or the package repositories that involved changed. See
+    `rezup.resolve_cache`.
 
     Args:
         revision: A revision instance that is ready to use
         requests_or_rxt: List of strings or list of PackageRequest objects,
             or, a resolved context RXT file.
+        cache (bool or str, optional): Resolve cache mode, `True` or `"env"`
+            for returning cached environment, `"rxt"` for re-evaluating the
+            cached context without solving, `False` for no cache. Follows
+            `$REZUP_RESOLVE_CACHE` if not given.
+        in_process (bool, optional): Import rez from revision and resolve
+            in current process if current interpreter is compatible with
+            revision's rez venv, or fallback to rez-python. Follows
+            `$REZUP_RESOLVE_IN_PROCESS` if not given.
 
     Returns:
         dict: The environment dict generated by the resolved context.
@@ -36,12 +62,216 @@ def resolve_environ(revision, requests_or_rxt):
         subprocess.CalledProcessError
 
     """
+    resolved_env, error = resolve_environ_many(
+        revision, [requests_or_rxt], cache=cache, in_process=in_process)[0]
+    if error is not None:
+        _log.error(error.output)
+        raise error
+    return resolved_env
+
+
+def resolve_environ_many(revision,
+                         requests_list,
+                         jobs=1,
+                         cache=None,
+                         in_process=None):
+    """Resolve multiple sets of package requests with Rez from container
+
+    All request sets are resolved in one rez-python process, or spread
+    across `jobs` processes for CPU-bound solves. Failed request set will
+    not fail the others.
+
+    Args:
+        revision: A revision instance that is ready to use
+        requests_list: A list of `requests_or_rxt`, see `resolve_environ()`.
+        jobs (int): Max number of rez-python processes to resolve with.
+        cache (bool or str, optional): See `resolve_environ()`.
+        in_process (bool, optional): See `resolve_environ()`, `jobs` is
+            ignored if resolved in current process.
+
+    Returns:
+        list: A list of tuple that contains resolved environment (None if
+            failed) and `subprocess.CalledProcessError` (None if succeed),
+            in the order of `requests_list`.
+
+    Raises:
+        ContainerError: when no valid revision to use.
+
+    """
+    args, env, results, pending = _prepare_resolves(
+        revision, requests_list, cache)
+    if not pending:
+        return results
+
+    if in_process is None:
+        in_process = bool(os.getenv("REZUP_RESOLVE_IN_PROCESS"))
+    if in_process:
+        responses = _resolve_in_process(revision, env, pending)
+        if responses is not None:
+            _collect_resolves(revision, args, results, pending, responses)
+            return results
+
+    def resolve_chunk(slot_chunk):
+        slot, chunk = slot_chunk
+        items = _resolve_items(revision, chunk)
+        try:
+            responses = _attach_output(*_run_action(
+                args, env, "resolve_many", items, slot, diagnostics=True))
+        except subprocess.CalledProcessError as e:
+            responses = [{"ok": False, "error": e.output}] * len(chunk)
+        return chunk, responses
+
+    jobs = max(1, min(jobs, len(pending)))
+    chunks = [(slot, pending[slot::jobs]) for slot in range(jobs)]
+    pool = ThreadPool(jobs) if jobs > 1 else None
+    try:
+        mapped = pool.imap_unordered(resolve_chunk, chunks) if pool \
+            else map(resolve_chunk, chunks)
+        for chunk, responses in mapped:
+            _collect_resolves(revision, args, results, chunk, responses)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return results
+
+
+def _prepare_resolves(revision, requests_list, cache):
+    """Look up resolve cache, returns what needs to be resolved
+
+    Returns:
+        tuple: rez-python command, process environment, results that have
+            cached ones filled, and a list of pending index, requests and
+            cache key (None if not caching).
+
+    """
+    from . import resolve_cache, prewarm
+
     if not revision.is_ready():
         raise ContainerError("Revision is not ready to be used.")
 
     env = os.environ.copy()
     env.update(revision.recipe_env() or {})
+    args = _rez_python_args(revision)
+    prewarmed = prewarm.read_index(revision)
+
+    mode = resolve_cache.get_mode(cache)
+    results = [None] * len(requests_list)
+    pending = []
+
+    for index, requests_or_rxt in enumerate(requests_list):
+        if isinstance(requests_or_rxt, list):
+            requests_or_rxt = " ".join([str(r) for r in requests_or_rxt])
+        requests_or_rxt = str(requests_or_rxt)
+
+        if prewarmed and not os.path.isfile(requests_or_rxt):
+            key = prewarm.match(revision, requests_or_rxt)
+            # stale one is not re-resolved here, just solve as usual
+            rxt = key and prewarm.get_context(revision, key, refresh=False)
+            if rxt:
+                _log.debug("Using prewarmed context: %s" % key)
+                requests_or_rxt = rxt
+
+        if mode is None or os.path.isfile(requests_or_rxt):
+            pending.append((index, requests_or_rxt, None))
+            continue
+
+        key = resolve_cache.make_key(revision, requests_or_rxt, env)
+        entry = resolve_cache.lookup(revision, key)
+        if entry is None:
+            pending.append((index, requests_or_rxt, key))
+        elif mode == "rxt":
+            _log.debug("Resolve cache hit: %s" % key)
+            pending.append((index, entry["rxt"], None))
+        else:
+            _log.debug("Resolve cache hit: %s" % key)
+            results[index] = (entry["env"], None)
+
+    if any(key for _, _, key in pending):
+        try:
+            makedirs(resolve_cache.cache_dir(revision))
+        except OSError as e:
+            _log.debug("Resolve cache disabled: %s" % e)
+            pending = [(i, r, None) for i, r, _ in pending]
+
+    return args, env, results, pending
+
+
+def _tmp_rxt(revision, index, key):
+    from . import resolve_cache
+    if key is not None:
+        return "%s.%s-%d-%d.tmp" % (resolve_cache.rxt_file(revision, key),
+                                    socket.gethostname(),
+                                    os.getpid(),
+                                    index)
+
+
+def _resolve_items(revision, chunk):
+    """Returns `_actions.py` resolve_many argument of pending resolves"""
+    return [[requests, _tmp_rxt(revision, index, key)]
+            for index, requests, key in chunk]
 
+
+def _attach_output(responses, output):
+    """Prepend diagnostic output onto errors of failed resolve_many items"""
+    return [
+        r if r["ok"] else dict(r, error=output + r["error"])
+        for r in responses
+    ]
+
+
+def _collect_resolves(revision, args, results, chunk, responses):
+    """Fill results with resolve_many responses, and save into cache"""
+    from . import resolve_cache
+
+    for (index, requests, key), response in zip(chunk, responses):
+        tmp = _tmp_rxt(revision, index, key)
+        if not response["ok"]:
+            error = subprocess.CalledProcessError(
+                1, args + ["-", "action_resolve_many"], response["error"])
+            results[index] = (None, error)
+        else:
+            results[index] = (response["result"], None)
+            if tmp is not None and os.path.isfile(tmp):
+                rxt = resolve_cache.rxt_file(revision, key)
+                replace_file(tmp, rxt)
+                resolve_cache.store(revision, key, requests,
+                                    response["result"], rxt)
+        if tmp is not None and os.path.isfile(tmp):
+            os.remove(tmp)
+
+
+def _resolve_in_process(revision, env, pending):
+    """Resolve with rez imported from revision in current process
+
+    Returns:
+        list: Responses same as `_actions.py` action `resolve_many`, or None
+            if current interpreter can not import rez from revision.
+
+    """
+    from . import _inprocess
+
+    if not _inprocess.is_compatible(revision):
+        _log.debug("Python %s is not compatible with %s, resolve in "
+                   "rez-python." % (sys.version.split()[0],
+                                    _inprocess.venv_python(revision)))
+        return
+
+    location = revision.locate_rez_lib()
+    if location is None:
+        _log.debug("Rez not found in %s" % revision.path())
+        return
+
+    key = _worker_key([str(revision.path())], env)
+    items = _resolve_items(revision, pending)
+    try:
+        return _inprocess.resolve_many(key, str(location), env, items)
+    except ImportError as e:
+        _log.debug("Failed to import rez from %s: %s" % (location, e))
+
+
+def _rez_python_args(revision):
     ext = ".exe" if sys.platform == "win32" else ""
     rez_python = None
 
@@ -55,41 +285,306 @@ def resolve_environ(revision, requests_or_rxt):
         raise ContainerError("rez-python not found in revision: %s"
                              % revision.path())
 
-    if isinstance(requests_or_rxt, list):
-        requests_or_rxt = " ".join([str(r) for r in requests_or_rxt])
-
     action_py = os.path.join(os.path.dirname(__file__), "_actions.py")
 
-    args = [
+    return [
         rez_python,
         "-B",  # just to be safe, no .pyc ('bad magic number in .pyc' error)
         action_py,
-        _message_wrap,
-        "action_resolve",  # resolve and return serialized context env
-        str(requests_or_rxt),
+    ]
+
+
+def _run_action(args, env, action, argument, slot=0, diagnostics=False):
+    """Run action in rez-python worker, or subprocess if worker disabled
+
+    Args:
+        args (list): rez-python command for running `_actions.py`
+        env (dict): Process environment
+        action (str): Action name, without the `action_` prefix
+        argument: JSON serializable argument of the action
+        slot (int): Use different slot for running in parallel workers
+        diagnostics (bool): Also return what the action printed, i.e.
+            stderr of worker, or stdout and stderr of subprocess.
+
+    Returns:
+        Decoded action result, or a tuple of result and printed output if
+            `diagnostics` is True.
+
+    Raises:
+        subprocess.CalledProcessError
+
+    """
+    if _worker_idle() > 0:
+        try:
+            worker = _get_worker(args, env, slot)
+            response = worker.request(action, argument)
+        except ContainerError as e:
+            _log.debug(str(e))  # fallback to subprocess
+        else:
+            if not response["ok"]:
+                raise subprocess.CalledProcessError(
+                    1, args + ["-", "action_serve"],
+                    response["stderr"] + response["error"])
+            if diagnostics:
+                return response["result"], response["stderr"]
+            return response["result"]
+
+    result_file = _result_file()
+    args = args + [
+        result_file,  # action result goes here
+        "action_" + action,
+        json.dumps(argument),
     ]
     try:
-        out = subprocess.check_output(
+        # output is diagnostics only, for reporting error
+        popen = subprocess.Popen(
             args,
             env=env,
+            stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             universal_newlines=True,
         )
-    except subprocess.CalledProcessError as e:
-        _log.error(e.output)
-        raise
+        out, _ = popen.communicate()
+        result = _read_result(result_file, args, popen.returncode, out)
+        return (result, out) if diagnostics else result
+    finally:
+        os.remove(result_file)
+
+
+def _result_file():
+    fd, path = tempfile.mkstemp(prefix="rezup-", suffix=".json")
+    os.close(fd)
+    return path
+
+
+def _read_result(result_file, args, returncode, output):
+    """Decode action result from file, raise if action failed"""
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args, output)
+    try:
+        with open(result_file, "r") as f:
+            return json.load(f)
+    except ValueError:
+        # action exited without writing result
+        raise subprocess.CalledProcessError(returncode, args, output)
+
+
+def stop_workers():
+    """Stop all rez-python workers that started by `resolve_environ()`
+
+    Called on exit, or could be called anytime for releasing resources.
+    Workers will be started again on demand.
+
+    """
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+    for worker in workers:
+        worker.stop()
+
+
+class _Worker(object):
+    """A long-lived rez-python process that runs `_actions.action_serve`
+    """
+
+    def __init__(self, args, env):
+        self.args = args
+        self.env = env
+        self.popen = None
+        self.log_file = None
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def start(self):
+        # diagnostics from worker, for attaching to errors
+        self.log_file = _worker_log()
+        with open(self.log_file, "ab") as stderr:
+            self.popen = subprocess.Popen(
+                self.args + ["-", "action_serve"],
+                env=self.env,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                universal_newlines=True,
+            )
+        try:
+            pong = self._call("ping")  # health check
+        except (OSError, IOError, ValueError) as e:
+            stderr = _read_log(self.log_file)
+            self.stop()
+            raise ContainerError("Failed to start rez-python worker: %s\n%s"
+                                 % (e, stderr))
+        _log.debug("rez-python worker started (pid %s): %s"
+                   % (pong["result"]["pid"], self.args[0]))
+
+    def is_alive(self):
+        return self.popen is not None and self.popen.poll() is None
+
+    def request(self, action, *args):
+        """Send request to worker, restart worker once if it's crashed"""
+        with self.lock:
+            self.last_used = time.time()
+            for retry in (True, False):
+                if not self.is_alive():
+                    self.start()
+                offset = _log_size(self.log_file)
+                try:
+                    response = self._call(action, *args)
+                except (OSError, IOError, ValueError) as e:
+                    stderr = _read_log(self.log_file, offset)
+                    self.stop()
+                    if not retry:
+                        raise ContainerError(
+                            "rez-python worker crashed: %s\n%s" % (e, stderr))
+                    _log.debug("rez-python worker crashed, restarting..")
+                else:
+                    response["stderr"] = _read_log(self.log_file, offset)
+                    return response
+                finally:
+                    self.last_used = time.time()
+
+    def _call(self, action, *args):
+        request = json.dumps({"action": action, "args": list(args)})
+        self.popen.stdin.write(request + "\n")
+        self.popen.stdin.flush()
+        line = self.popen.stdout.readline()
+        if not line:
+            raise IOError("Worker exited with code %s" % self.popen.wait())
+        return json.loads(line)
+
+    def stop(self):
+        if self.popen is None:
+            return
+        popen, self.popen = self.popen, None
+        try:
+            popen.stdin.close()  # worker exits on EOF
+        except (OSError, IOError):
+            pass
+        for _ in range(20):
+            if popen.poll() is not None:
+                break
+            time.sleep(0.05)
+        else:
+            popen.kill()
+            popen.wait()
+        popen.stdout.close()
+        _remove_log(self.log_file)
+        self.log_file = None
 
-    return json.loads(polish(out))
 
+_workers = dict()
+_workers_lock = threading.Lock()
+_reaper = []
 
-def get_revision(container=None, create=False, fallback=True):
+
+def _worker_idle():
+    return float(os.getenv("REZUP_WORKER_IDLE", 0))
+
+
+def _worker_log():
+    """Returns a new file path for worker to write stderr into
+
+    Worker should open it in append mode, so it always writes to the end
+    no matter where the file is being read.
+
+    """
+    fd, path = tempfile.mkstemp(prefix="rezup-worker-", suffix=".log")
+    os.close(fd)
+    return path
+
+
+def _log_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def _read_log(path, offset=0):
+    """Returns worker stderr that written after offset"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read().decode("utf-8", "replace")
+    except (OSError, IOError, TypeError):
+        return ""
+
+
+def _remove_log(path):
+    try:
+        os.remove(path)
+    except (OSError, TypeError):
+        pass
+
+
+def _worker_key(args, env, slot=0):
+    return hashlib.sha1(
+        json.dumps([args, env, slot], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _get_worker(args, env, slot=0):
+    digest = _worker_key(args, env, slot)
+
+    with _workers_lock:
+        worker = _workers.get(digest)
+        if worker is None:
+            worker = _Worker(args, env)
+            worker.start()
+            _workers[digest] = worker
+
+        if not _reaper or not _reaper[0].is_alive():
+            thread = threading.Thread(target=_reap_idle_workers)
+            thread.daemon = True
+            thread.start()
+            _reaper[:] = [thread]
+
+    return worker
+
+
+def _reap_idle_workers():
+    while True:
+        idle = _worker_idle()
+        time.sleep(max(0.1, min(idle, 10)))
+
+        with _workers_lock:
+            if not _workers:
+                return
+            now = time.time()
+            expired = [
+                key for key, worker in _workers.items()
+                if not worker.lock.locked() and now - worker.last_used > idle
+            ]
+            workers = [_workers.pop(key) for key in expired]
+
+        for worker in workers:
+            _log.debug("Stopping idle rez-python worker: %s" % worker.args[0])
+            worker.stop()
+
+
+atexit.register(stop_workers)
+
+
+def get_revision(container=None, create=False, fallback=True, cached=True):
     """Returns a revision instance from container
 
+    Revision is memoized in current process, and will be looked up again
+    only if the revision manifest (or `revisions` directory, if manifest not
+    exists) of the container has been modified. So repeated calls cost only
+    one `stat`. Call `refresh()` to drop memoized revisions, e.g. after the
+    recipe has changed.
+
+    Changes are told by the manifest's mtime, size and inode, so a new
+    revision made within the file system's mtime resolution (e.g. 2 sec
+    on FAT, or coarse network storage) may go unnoticed if the rewritten
+    manifest happened to be identical in all three.
+
     Args:
         container: Container name, use default container if name not given.
         create: Create local revision if not exists, default False.
         fallback: If True, accept earlier revision when no timestamp matched
             found in local.
+        cached: If False, always look up revision from filesystem.
 
     Returns:
         Revision: An instance of Revision
@@ -99,8 +594,28 @@ def get_revision(container=None, create=False, fallback=True):
 
     """
     name = container or Container.DEFAULT_NAME
+    key = (
+        name,
+        str(ContainerRecipe.RECIPES_DIR),
+        os.getenv("REZUP_ROOT_LOCAL"),
+        os.getenv("REZUP_ROOT_REMOTE"),
+        create,
+        fallback,
+    )
+    if cached:
+        with _revisions_lock:
+            memo = _revisions.get(key)
+        if memo is not None:
+            revision, watched, stamp = memo
+            if _stamp(watched) == stamp:
+                return revision
+
     container = Container(name)
-    revision = container.get_latest_revision()
+    watched = _watched_path(container)
+    stamp = _stamp(watched)  # taken before lookup, so no change is missed
+
+    latest = container.get_latest_revision()
+    revision = latest
 
     if revision is None:
         if container.is_remote() or not create:
@@ -113,14 +628,44 @@ def get_revision(container=None, create=False, fallback=True):
     if revision is None:
         raise ContainerError("No matched revision in local container.")
 
+    if latest is not None and revision.dirname() == latest.dirname():
+        # earlier revision that fallback to is not memoized, the latest
+        #   may be pulled by other process anytime
+        with _revisions_lock:
+            _revisions[key] = (revision, watched, stamp)
+
     return revision
 
 
-_message_wrap = "::rezup.msg.start::%s::rezup.msg.end::"
-_polish_regex = re.compile(_message_wrap % "(.*)")
+def refresh(container=None):
+    """Drop revisions that memoized by `get_revision()`
+
+    Args:
+        container (str, optional): Container name, drop all if not given.
 
+    """
+    with _revisions_lock:
+        for key in list(_revisions):
+            if container is None or key[0] == container:
+                del _revisions[key]
 
-def polish(message):
-    match = _polish_regex.search(message)
-    if match:
-        return match.group(1)
+
+_revisions = dict()
+_revisions_lock = threading.Lock()
+
+
+def _watched_path(container):
+    """Returns the path that changes when latest revision may have changed
+    """
+    manifest = str(container.manifest())
+    if os.path.isfile(manifest):
+        return manifest
+    return str(container.revisions())
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size, st.st_ino
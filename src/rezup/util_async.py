@@ -0,0 +1,372 @@
+"""asyncio counterparts of `rezup.util` and revision actions
+
+Example:
+    ```python
+    import asyncio
+    from rezup import util_async
+
+    async def main():
+        revision = await util_async.get_revision_async()
+        env = await util_async.resolve_environ_async(revision, ["pkg_a"])
+
+    asyncio.run(main())
+    ```
+
+Blocking filesystem work, e.g. scanning revisions and building venvs, run
+in the default executor of event loop. Rez resolves run in rez-python
+processes that are driven by asyncio subprocess, concurrent resolves share
+one worker process per revision if worker is enabled by `$REZUP_WORKER_IDLE`
+(see `rezup.util.resolve_environ()`), or each runs in a new subprocess.
+
+Cancellation is cooperative. Cancelling a resolve kills its subprocess, or
+just discards the response if it's sent to a shared worker. Cancelling a
+pull stops waiting, but the pull keeps running in executor until done, so
+the revision won't be left half built.
+
+
+!!! important "However, Python 3.7+ Required"
+    This module is based on `asyncio.get_running_loop()` and other APIs that
+    require **Python 3.7+** to work.
+
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import functools
+import subprocess
+import collections
+import weakref
+
+from . import util
+from .exceptions import ContainerError
+
+if sys.version_info < (3, 7):
+    raise ImportError("This asyncio API needs Python 3.7+.")
+
+
+_log = logging.getLogger("rezup.util")
+
+_STREAM_LIMIT = 2 ** 28  # resolved environment could be large
+
+
+async def _in_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(func, *args, **kwargs))
+
+
+async def get_revision_async(container=None, create=False, fallback=True):
+    """Returns a revision instance from container
+
+    See `rezup.util.get_revision()`.
+
+    """
+    return await _in_executor(util.get_revision,
+                              container=container,
+                              create=create,
+                              fallback=fallback)
+
+
+async def pull_async(revision, check_out=True, fallback=False, stale=False):
+    """Pull revision into local
+
+    See `rezup.Revision.pull()`.
+
+    """
+    return await _in_executor(revision.pull,
+                              check_out=check_out,
+                              fallback=fallback,
+                              stale=stale)
+
+
+async def spawn_async(revision, command=None, **kwargs):
+    """Spawn a sub-shell with asyncio subprocess
+
+    The revision holds a lease for the process, call
+    `rezup.container.release_lease(process)` after the process is done.
+
+    Args:
+        revision (`rezup.Revision`): The revision to use
+        command (list, optional): See `rezup.Revision.spawn_shell()`.
+        **kwargs: Passed to `asyncio.create_subprocess_exec()`, e.g. `stdout`.
+
+    Returns:
+        asyncio.subprocess.Process
+
+    """
+    local, cmd, env = await _in_executor(revision._launch_args, command)
+
+    # leased under build lock, see `rezup.Revision.spawn_shell()`
+    lock = local.build_lock()
+    await _in_executor(lock.acquire)
+    try:
+        await _in_executor(local._check_exists)
+        process = await asyncio.create_subprocess_exec(*cmd, env=env,
+                                                       **kwargs)
+        process.rezup_lease = await _in_executor(local._acquire_lease,
+                                                 process.pid)
+    finally:
+        await _in_executor(lock.release)
+    return process
+
+
+async def resolve_environ_async(revision, requests_or_rxt, cache=None):
+    """Resolve package requests with Rez from container
+
+    See `rezup.util.resolve_environ()`.
+
+    """
+    resolved_env, error = (await resolve_environ_many_async(
+        revision, [requests_or_rxt], cache=cache))[0]
+    if error is not None:
+        _log.error(error.output)
+        raise error
+    return resolved_env
+
+
+async def resolve_environ_many_async(revision, requests_list, cache=None):
+    """Resolve multiple sets of package requests with Rez from container
+
+    See `rezup.util.resolve_environ_many()`. For resolving in parallel,
+    gather multiple calls of this or `resolve_environ_async()`.
+
+    """
+    args, env, results, pending = await _in_executor(
+        util._prepare_resolves, revision, requests_list, cache)
+    if not pending:
+        return results
+
+    items = util._resolve_items(revision, pending)
+    try:
+        responses = util._attach_output(*await _run_action(
+            args, env, "resolve_many", items, diagnostics=True))
+    except subprocess.CalledProcessError as e:
+        responses = [{"ok": False, "error": e.output}] * len(pending)
+
+    await _in_executor(util._collect_resolves,
+                       revision, args, results, pending, responses)
+    return results
+
+
+async def _run_action(args, env, action, argument, diagnostics=False):
+    if util._worker_idle() > 0:
+        try:
+            worker = await _get_worker(args, env)
+            response = await worker.request(action, argument)
+        except ContainerError as e:
+            _log.debug(str(e))  # fallback to subprocess
+        else:
+            if not response["ok"]:
+                raise subprocess.CalledProcessError(
+                    1, args + ["-", "action_serve"],
+                    response["stderr"] + response["error"])
+            if diagnostics:
+                return response["result"], response["stderr"]
+            return response["result"]
+
+    result_file = util._result_file()
+    args = args + [result_file, "action_" + action, json.dumps(argument)]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        try:
+            out, _ = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+
+        out = out.decode("utf-8", "replace")
+        result = await _in_executor(util._read_result,
+                                    result_file, args, process.returncode, out)
+        return (result, out) if diagnostics else result
+    finally:
+        os.remove(result_file)
+
+
+async def stop_workers_async():
+    """Stop rez-python workers that started in running event loop"""
+    workers = _workers.pop(asyncio.get_running_loop(), {})
+    for worker in workers.values():
+        await worker.stop()
+
+
+class _AsyncWorker(object):
+    """A rez-python worker that driven by asyncio
+
+    Requests are written to worker without waiting for previous ones, and
+    responses are read in order by a reader task. So concurrent requests
+    share one worker process.
+
+    """
+
+    def __init__(self, args, env):
+        self.args = args
+        self.env = env
+        self.process = None
+        self.log_file = None
+        self.reader = None
+        self.starting = None
+        self.broken = False
+        self.waiting = collections.deque()
+        self.idle_timer = None
+        self.count = 0
+
+    async def start(self):
+        # diagnostics from worker, for attaching to errors. Requests are
+        #   concurrent, so stderr of others may be included.
+        self.log_file = util._worker_log()
+        with open(self.log_file, "ab") as stderr:
+            self.process = await asyncio.create_subprocess_exec(
+                *(self.args + ["-", "action_serve"]),
+                env=self.env,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=stderr,
+                limit=_STREAM_LIMIT,
+            )
+        self.reader = asyncio.ensure_future(self._read())
+        try:
+            pong = await self.request("ping")  # health check
+        except ContainerError as e:
+            await self.stop()
+            raise ContainerError("Failed to start rez-python worker: %s" % e)
+        _log.debug("rez-python worker started (pid %s): %s"
+                   % (pong["result"]["pid"], self.args[0]))
+
+    def is_dead(self):
+        return self.starting.done() and (
+            self.starting.cancelled()
+            or self.starting.exception() is not None
+            or self.broken
+            or self.process is None
+        )
+
+    async def request(self, action, *args):
+        if self.broken or self.process is None:
+            raise ContainerError("rez-python worker is not running.")
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+        self.count += 1
+        request_id = self.count
+        request = json.dumps({"id": request_id,
+                              "action": action,
+                              "args": list(args)})
+        future = asyncio.get_running_loop().create_future()
+        offset = util._log_size(self.log_file)
+        self.waiting.append((request_id, future))
+        try:
+            self.process.stdin.write(request.encode("utf-8") + b"\n")
+            await self.process.stdin.drain()
+        except (OSError, IOError) as e:
+            future.cancel()  # reader will skip it, if it's still reading
+            raise ContainerError("rez-python worker crashed: %s" % e)
+
+        # shielded, so the response of cancelled request is still taken by
+        #   reader, which schedules the idle stop once all responses taken
+        try:
+            response = await asyncio.shield(future)
+        except ContainerError as e:
+            raise ContainerError("%s\n%s"
+                                 % (e, util._read_log(self.log_file, offset)))
+        response["stderr"] = util._read_log(self.log_file, offset)
+        return response
+
+    async def _read(self):
+        process = self.process
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                request_id, future = self.waiting.popleft()
+                response = json.loads(line.decode("utf-8"))
+                if response.get("id") != request_id:
+                    raise ValueError("Worker response out of order.")
+                if not future.done():
+                    future.set_result(response)
+                if not self.waiting:
+                    self._schedule_idle_stop()
+            error = "Worker exited with code %s" % await process.wait()
+        except Exception as e:
+            error = str(e)
+            if process.returncode is None:
+                process.kill()
+
+        self.broken = True
+        while self.waiting:
+            _, future = self.waiting.popleft()
+            if not future.done():
+                future.set_exception(
+                    ContainerError("rez-python worker crashed: %s" % error))
+
+    def _schedule_idle_stop(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        self.idle_timer = asyncio.get_running_loop().call_later(
+            util._worker_idle(),
+            lambda: asyncio.ensure_future(self._idle_stop()))
+
+    async def _idle_stop(self):
+        if self.waiting or self.process is None:
+            return
+        workers = _workers.get(asyncio.get_running_loop(), {})
+        key = util._worker_key(self.args, self.env)
+        if workers.get(key) is self:
+            del workers[key]
+        _log.debug("Stopping idle rez-python worker: %s" % self.args[0])
+        await self.stop()
+
+    async def stop(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        if self.process is None:
+            return
+
+        process, self.process = self.process, None
+        if process.returncode is None:
+            process.stdin.close()  # worker exits on EOF
+            try:
+                await asyncio.wait_for(process.wait(), 1)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        if self.reader is not None:
+            await self.reader
+        util._remove_log(self.log_file)
+        self.log_file = None
+
+
+_workers = weakref.WeakKeyDictionary()  # by event loop
+
+
+async def _get_worker(args, env):
+    key = util._worker_key(args, env)
+    workers = _workers.setdefault(asyncio.get_running_loop(), {})
+
+    worker = workers.get(key)
+    if worker is None or worker.is_dead():
+        if worker is not None:
+            _log.debug("rez-python worker crashed, restarting..")
+            await worker.stop()
+        worker = _AsyncWorker(args, env)
+        worker.starting = asyncio.ensure_future(worker.start())
+        workers[key] = worker
+
+    try:
+        await asyncio.shield(worker.starting)
+    except ContainerError:
+        if workers.get(key) is worker:
+            del workers[key]
+        raise
+
+    return worker
@@ -19,6 +19,11 @@ os.environ.update(get_revision(".main").recipe_env())
 
 Which makes linter unhappy.
 
+The environ is cached in module after first access. For making the import
+cheap in every new process, set `$REZUP_ENV_SNAPSHOT` to save it on disk as
+a snapshot, which costs a few `stat` to validate instead of looking up the
+revision.
+
 
 !!! important "However, Python 3.7+ Required"
     The feature this module provides is based on
@@ -28,48 +33,182 @@ Which makes linter unhappy.
 """
 import os
 import sys
-from . import util
-from .container import iter_containers
+import json
+import logging
+from . import util, prewarm
+from .container import Container, write_json, makedirs
+from .exceptions import ContainerError
+from ._lock import FileLock
+from .recipe import ContainerRecipe
 
 if sys.version_info < (3, 7):
     raise ImportError("This container environ injector needs Python 3.7+ "
                       "(PEP-562).")
 
 
+_log = logging.getLogger("rezup")
+
+SNAPSHOT_DIR = ".rezup_env"  # in recipes dir
+SNAPSHOT_FILE = "snapshot.json"
+
+_envs = dict()  # container environ, by name
+
+
 def __dir__():
     """Listing all container as valid importable attribute name
 
+    Container names are read from recipe registry, see
+    `rezup.ContainerRecipe.registry()`.
+
     Example:
         >>> from rezup import util_env
         >>> dir(util_env)
         ['dev', 'dot_main']
 
     """
-    return [
+    return sorted(set(
         "dot_main" if name == ".main" else name
-        for name in [con.name() for con in iter_containers()]
-    ]
+        for name in [r.name() for r in ContainerRecipe.iter_recipes()]
+    ))
 
 
 def __getattr__(name):
     """Returns a dict of environ that given from specified container
 
+    The environ is cached in module after first access. If
+    `$REZUP_ENV_SNAPSHOT` is set, it's also saved as a snapshot on disk for
+    other processes, which stays valid until the recipe, dotenv files or the
+    revision manifest of the container changed.
+
     Example:
         >>> from rezup import util_env
         >>> util_env.dot_main  # the env also been applied onto os.environ
-        {'REZUP_CONTAINER': '.main', 'REZUP_USING_REMOTE': ''}
+        {'REZUP_CONTAINER': '.main', 'REZUP_USING_REMOTE': '', ...}
 
     """
     if name[:2] == name[-2:] == "__":
-        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
 
     if name == "dot_main":
         con_name = ".main"
     else:
         con_name = name
 
-    revision = util.get_revision(container=con_name)
-    env = revision.recipe_env()
+    env = _envs.get(con_name)
+    if env is None:
+        env, is_latest = _load_env(con_name)
+        if is_latest:
+            _envs[con_name] = env
+
     os.environ.update(env)
 
     return env
+
+
+def refresh():
+    """Drop cached container environ, memoized revisions and snapshot file
+    """
+    _envs.clear()
+    util.refresh()
+    try:
+        os.remove(_snapshot_file())
+    except OSError:
+        pass
+
+
+def _load_env(con_name):
+    """Returns container environ, and whether it's from the latest revision
+
+    Environ of an earlier revision that fallback to is neither cached nor
+    snapshotted, because the latest one may be pulled by other process
+    anytime, which changes nothing that the snapshot watches.
+
+    """
+    use_snapshot = bool(os.getenv("REZUP_ENV_SNAPSHOT"))
+    if use_snapshot:
+        env = _read_snapshot(con_name)
+        if env is not None:
+            return env, True
+
+    # stamped before lookup, so no change is missed
+    container = Container(con_name)
+    watched = [
+        str(ContainerRecipe(con_name).path()),
+        util._watched_path(container),
+    ]
+    stamps = [_stamp(path) for path in watched]
+
+    revision = util.get_revision(container=con_name)
+    latest = container.get_latest_revision()
+    if latest is None or latest.dirname() != revision.dirname():
+        return revision.recipe_env(), False
+
+    for path in revision.dotenv_files():
+        watched.append(str(path))
+        stamps.append(_stamp(path))
+    if prewarm.is_config_enabled(revision):
+        # baked rez config is used only when it's up to date with sources
+        config_file = revision.recipe_env(baked=False).get("REZ_CONFIG_FILE")
+        for path in prewarm.config_sources(config_file or "") + [
+                os.path.join(prewarm.config_dir(revision),
+                             prewarm.SOURCES_FILE)]:
+            watched.append(path)
+            stamps.append(_stamp(path))
+    env = revision.recipe_env()
+
+    if use_snapshot:
+        _write_snapshot(con_name, {
+            "roots": _roots(),
+            "watched": [[p, s] for p, s in zip(watched, stamps)],
+            "env": env,
+        })
+
+    return env, True
+
+
+def _snapshot_file():
+    # in sub-directory, so writing it won't change the mtime of recipes dir
+    #   and the recipe registry remains valid
+    return str(ContainerRecipe.RECIPES_DIR / SNAPSHOT_DIR / SNAPSHOT_FILE)
+
+
+def _roots():
+    return [os.getenv("REZUP_ROOT_LOCAL"), os.getenv("REZUP_ROOT_REMOTE")]
+
+
+def _stamp(path):
+    stamp = util._stamp(path)
+    return list(stamp) if stamp else None
+
+
+def _read_all():
+    try:
+        with open(_snapshot_file(), "r") as f:
+            return json.load(f)
+    except (OSError, IOError, ValueError):
+        return dict()
+
+
+def _read_snapshot(con_name):
+    entry = _read_all().get(con_name)
+    if entry is None or entry["roots"] != _roots():
+        return
+    for path, stamp in entry["watched"]:
+        if _stamp(path) != stamp:
+            return
+    return entry["env"]
+
+
+def _write_snapshot(con_name, entry):
+    path = _snapshot_file()
+    try:
+        makedirs(os.path.dirname(path))
+        with FileLock(path + ".lock",
+                      timeout=10,
+                      description="container environ snapshot"):
+            snapshot = _read_all()
+            snapshot[con_name] = entry
+            write_json(path, snapshot)
+    except (OSError, IOError, ContainerError) as e:
+        _log.debug("Failed to write environ snapshot: %s" % e)  # e.g. r/o
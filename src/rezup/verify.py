@@ -0,0 +1,271 @@
+
+import os
+import csv
+import json
+import base64
+import hashlib
+import logging
+from multiprocessing.pool import ThreadPool
+
+from .container import iter_containers, find_site_packages, write_json
+
+
+_log = logging.getLogger("rezup")
+
+CACHE_FILE = "verify.json"
+
+
+def hash_file(path, algorithm="sha256"):
+    """Returns file hash in the form of `RECORD` file, e.g. `sha256=...`
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    encoded = base64.urlsafe_b64encode(digest.digest()).rstrip(b"=")
+    return "%s=%s" % (algorithm, encoded.decode("ascii"))
+
+
+def hash_scripts(revision, venvs=None):
+    """Returns hashes of production scripts in each venv of local revision
+
+    Production scripts are generated by rezup, so they are not listed in
+    any distribution's `RECORD`. Their hashes are recorded in revision
+    metadata when the revision is created.
+
+    Args:
+        revision (`rezup.Revision`): A local revision
+        venvs (list, optional): Venv names, from revision metadata if not
+            given.
+
+    Returns:
+        dict: Script file name and hash pairs, by venv name.
+
+    """
+    if venvs is None:
+        venvs = (revision.metadata() or {}).get("venvs", ["rez"])
+    scripts = dict()
+    for venv_name in venvs:
+        bin_dir = str(revision.production_bin_dir(venv_name))
+        if not os.path.isdir(bin_dir):
+            continue
+        scripts[venv_name] = {
+            name: hash_file(os.path.join(bin_dir, name))
+            for name in sorted(os.listdir(bin_dir))
+            if os.path.isfile(os.path.join(bin_dir, name))
+        }
+    return scripts
+
+
+def read_record(dist_info):
+    """Returns hashed entries in distribution's `RECORD` file
+
+    Returns:
+        list: A list of tuple that contains file path (relative to
+            site-packages), hash and size.
+
+    """
+    entries = []
+    path = os.path.join(str(dist_info), "RECORD")
+    try:
+        with open(path, "r") as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or not row[1]:
+                    continue  # RECORD itself, or files like *.pyc
+                size = int(row[2]) if row[2] else None
+                entries.append((row[0], row[1], size))
+    except (OSError, IOError) as e:
+        _log.debug("Failed to read %s: %s" % (path, e))
+    return entries
+
+
+def collect_files(revision):
+    """Collect files to verify in local revision
+
+    Returns:
+        list: A list of tuple that contains venv name, absolute file path,
+            expected hash, expected size (or None) and whether the file
+            could be missing.
+
+    """
+    metadata = revision.metadata() or {}
+    files = []
+
+    for venv_name in metadata.get("venvs", ["rez"]):
+        venv_path = revision.path() / "venv" / venv_name
+        site_packages = find_site_packages(venv_path)
+        if site_packages is None:
+            files.append((venv_name, str(venv_path), None, None, False))
+            continue
+
+        site_packages = str(site_packages)
+        for entry in sorted(os.listdir(site_packages)):
+            if not entry.endswith(".dist-info"):
+                continue
+            for rel_path, hash_, size in read_record(
+                    os.path.join(site_packages, entry)):
+                if rel_path.endswith(".pyc"):
+                    continue  # could be re-compiled by interpreter
+                path = os.path.normpath(os.path.join(site_packages, rel_path))
+                # console scripts in venv are replaced by production scripts
+                optional = not path.startswith(site_packages + os.sep)
+                files.append((venv_name, path, hash_, size, optional))
+
+    bin_dirs = {
+        venv_name: str(revision.production_bin_dir(venv_name))
+        for venv_name in metadata.get("venvs", ["rez"])
+    }
+    for venv_name, scripts in (metadata.get("scripts") or {}).items():
+        for name, hash_ in scripts.items():
+            path = os.path.join(bin_dirs[venv_name], name)
+            files.append((venv_name, path, hash_, None, False))
+
+    return files
+
+
+def cache_file(container):
+    """Returns verify cache file path of container
+
+    It's kept out of revision directories, so writing it doesn't change
+    their modification time, see `rezup.usage.signature()`.
+
+    """
+    return container.path() / CACHE_FILE
+
+
+def read_cache(container):
+    """Returns stats of verified files in container, by revision dirname"""
+    try:
+        with open(str(cache_file(container)), "r") as f:
+            return json.load(f)["revisions"]
+    except (OSError, IOError, ValueError, KeyError):
+        return dict()
+
+
+def _check(task):
+    """Verify one file, returns (task, stat, failure reason or None)"""
+    venv_name, path, hash_, size, optional, cached = task
+    if hash_ is None:
+        return task, None, "missing venv"
+    try:
+        st = os.stat(path)
+    except OSError:
+        return task, None, None if optional else "missing"
+    if optional and not os.path.isfile(path):
+        return task, None, None  # e.g. replaced by production scripts dir
+
+    stat = [st.st_mtime, st.st_size, hash_]
+    if cached == stat:
+        return task, stat, None  # unchanged since verified
+    if size is not None and st.st_size != size:
+        return task, None, "size mismatch"
+    if hash_file(path, hash_.split("=", 1)[0]) != hash_:
+        return task, None, "hash mismatch"
+    return task, stat, None
+
+
+def verify_revision(revision, pool):
+    """Verify installed files of a local revision
+
+    Files are hashed with the thread pool and compared with what recorded
+    in distribution `RECORD` files and revision metadata. Files that have
+    the same modification time and size since last verified are skipped.
+
+    Args:
+        revision (`rezup.Revision`): A ready local revision
+        pool (`multiprocessing.pool.ThreadPool`): Threads to work with
+
+    Returns:
+        dict: Verification result.
+
+    """
+    container_cache = read_cache(revision.container())
+    cache = container_cache.get(revision.dirname(), dict())
+    revision_path = str(revision.path())
+
+    tasks = []
+    for venv_name, path, hash_, size, optional in collect_files(revision):
+        key = os.path.relpath(path, revision_path)
+        tasks.append((venv_name, path, hash_, size, optional, cache.get(key)))
+
+    new_cache = dict()
+    failures = []
+    hashed = 0
+    for task, stat, reason in pool.imap_unordered(_check, tasks):
+        venv_name, path, _, _, _, cached = task
+        if reason is not None:
+            failures.append({
+                "venv": venv_name,
+                "path": path,
+                "reason": reason,
+            })
+        elif stat is not None:
+            new_cache[os.path.relpath(path, revision_path)] = stat
+            hashed += cached != stat
+
+    if new_cache != cache:
+        revisions_root = revision.container().revisions()
+        container_cache = {  # drop the ones that no longer exist
+            dirname: stats for dirname, stats in container_cache.items()
+            if (revisions_root / dirname).is_dir()
+        }
+        container_cache[revision.dirname()] = new_cache
+        try:
+            write_json(cache_file(revision.container()),
+                       {"revisions": container_cache})
+        except (OSError, IOError) as e:
+            _log.debug("Failed to write verify cache: %s" % e)
+
+    failures.sort(key=lambda f: f["path"])
+    return {
+        "container": revision.container().name(),
+        "revision": revision.dirname(),
+        "path": revision_path,
+        "checked": len(tasks),
+        "hashed": hashed,
+        "failures": failures,
+        "repaired": [],
+    }
+
+
+def verify(names=None, revision=None, jobs=8, repair=False):
+    """Verify ready revisions in local containers
+
+    Args:
+        names (list, optional): Container names, all if not given.
+        revision (str, optional): Only verify the revision that has this
+            directory name.
+        jobs (int): Number of threads for hashing files.
+        repair (bool): Rebuild venvs that failed verification.
+
+    Yields:
+        dict: Verification result of each revision, see `verify_revision()`
+
+    """
+    pool = ThreadPool(max(1, jobs))
+    try:
+        for container in iter_containers():
+            if container.is_remote() or not container.is_exists():
+                continue
+            if names and container.name() not in names:
+                continue
+
+            for rev in container.iter_revision():
+                if revision and rev.dirname() != revision:
+                    continue
+                if not rev.is_ready():
+                    continue
+
+                result = verify_revision(rev, pool)
+                if repair and result["failures"]:
+                    venvs = sorted(set(f["venv"] for f in result["failures"]))
+                    for venv_name in venvs:
+                        _log.info("Rebuilding venv %r of %s"
+                                  % (venv_name, rev.path()))
+                        rev.rebuild_venv(venv_name)
+                        result["repaired"].append(venv_name)
+
+                yield result
+    finally:
+        pool.close()
+        pool.join()
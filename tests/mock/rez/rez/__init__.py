@@ -2,3 +2,9 @@
 
 def run():
     print("Welcome to Rez.")
+
+
+def run_python():
+    import os
+    import sys
+    os.execv(sys.executable, [sys.executable] + sys.argv[1:])
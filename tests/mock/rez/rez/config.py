@@ -0,0 +1,102 @@
+import os
+from contextlib import contextmanager
+
+
+def get_module_root_config():
+    return os.path.join(os.path.dirname(__file__), "rezconfig.py")
+
+
+def _load_config_from_filepaths(filepaths):
+    data = {}
+    sourced_filepaths = []
+    for filepath in filepaths:
+        for path in (os.path.splitext(filepath)[0] + ".py", filepath):
+            if os.path.isfile(path):
+                break
+        else:
+            continue
+
+        g = {}
+        with open(path, "r") as f:
+            exec(compile(f.read(), path, "exec"), g)
+        data.update({k: v for k, v in g.items() if not k.startswith("__")})
+        sourced_filepaths.append(path)
+
+    return data, sourced_filepaths
+
+
+class Setting(object):
+
+    def __init__(self, config, key):
+        self.config = config
+        self.key = key
+
+    @property
+    def _env_var_name(self):
+        return "REZ_%s" % self.key.upper()
+
+    def _parse_env_var(self, value):
+        return value
+
+
+class PathList(Setting):
+
+    def _parse_env_var(self, value):
+        return [p for p in value.split(os.pathsep) if p]
+
+
+class Schema(object):
+
+    def __init__(self, schema):
+        self._schema = schema
+
+
+config_schema = Schema({
+    "packages_path": PathList,
+    "local_packages_path": Setting,
+})
+
+
+class Config(object):
+    schema = config_schema
+
+    def __init__(self, filepaths, overrides=None, locked=False):
+        self.filepaths = filepaths
+        self.overrides = overrides or {}
+        self.locked = locked
+
+    @property
+    def packages_path(self):
+        return self._get("packages_path")
+
+    def _get(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        setting = self.schema._schema[key](self, key)
+        value = None if self.locked else os.getenv(setting._env_var_name)
+        if value is not None:
+            return setting._parse_env_var(value)
+        return _load_config_from_filepaths(self.filepaths)[0].get(key)
+
+    def _swap(self, other):
+        self.__dict__, other.__dict__ = other.__dict__, self.__dict__
+
+
+def _create_main_config():
+    filepaths = [get_module_root_config()]
+    filepaths += [
+        p for p in os.getenv("REZ_CONFIG_FILE", "").split(os.pathsep) if p
+    ]
+    return Config(filepaths)
+
+
+config = _create_main_config()
+
+
+@contextmanager
+def _replace_config(other):
+    config._swap(other)
+    try:
+        yield
+    finally:
+        config._swap(other)
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import colorsys  # noqa, not imported by rezup, for testing isolation
+
+
+class ResolvedContext(object):
+
+    def __init__(self, package_requests):
+        self.package_requests = [str(r) for r in package_requests]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f)["package_requests"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"package_requests": self.package_requests}, f)
+
+    def get_environ(self, parent_environ=None):
+        from rez.config import config
+
+        for request in self.package_requests:
+            if request.startswith("missing"):
+                sys.stderr.write("Searched for %s\n" % request)
+                raise Exception("Package not found: %s" % request)
+            if request.startswith("noisy"):
+                print('{"broken": ::rezup.msg.start::')
+
+        environ = dict(os.environ if parent_environ is None
+                       else parent_environ)
+        environ.update({
+            "REZ_USED_REQUEST": " ".join(self.package_requests),
+            "REZ_USED_PACKAGES_PATH": os.pathsep.join(config.packages_path),
+            "REZ_RESOLVE": " ".join(
+                "%s-1.0" % r for r in self.package_requests),
+            "REZ_RESOLVED_BY": str(os.getpid()),
+        })
+        return environ
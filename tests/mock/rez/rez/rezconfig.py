@@ -0,0 +1,2 @@
+packages_path = ["~/packages"]
+local_packages_path = "~/packages"
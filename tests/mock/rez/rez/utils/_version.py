@@ -1,2 +1,2 @@
 
-__version__ = "0.0.0"
+__version__ = "2.83.0"
@@ -0,0 +1,63 @@
+"""Tests of asyncio API, Python 3.7+ only, see `tests/conftest.py`"""
+import os
+import sys
+import asyncio
+import unittest
+import subprocess
+from rezup import util_async
+from rezup.container import Container, release_lease
+from tests.util import TestBase
+
+
+class TestAsync(TestBase):
+
+    def test_async_api(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        Container.create(con_name).new_revision()
+        os.environ["REZUP_WORKER_IDLE"] = "300"
+        self.addCleanup(os.environ.pop, "REZUP_WORKER_IDLE", None)
+
+        async def main():
+            revision = await util_async.get_revision_async(con_name)
+            slow = asyncio.ensure_future(
+                util_async.resolve_environ_async(revision, ["slow"]))
+            results = await asyncio.gather(*[
+                util_async.resolve_environ_async(revision, [r])
+                for r in ("a", "b", "c")
+            ])
+            slow.cancel()
+            # share one worker
+            self.assertEqual(1, len(set(
+                env["REZ_RESOLVED_BY"] for env in results)))
+            self.assertEqual(["a", "b", "c"],
+                             [env["REZ_USED_REQUEST"] for env in results])
+            # idle stop is re-armed even the last request was cancelled
+            worker, = util_async._workers[
+                asyncio.get_running_loop()].values()
+            request = asyncio.ensure_future(worker.request("ping"))
+            await asyncio.sleep(0)
+            request.cancel()
+            while worker.waiting:
+                await asyncio.sleep(0.01)
+            self.assertIsNotNone(worker.idle_timer)
+
+            with self.assertRaises(subprocess.CalledProcessError) as error:
+                await util_async.resolve_environ_async(revision, ["missing"])
+            self.assertIn("Searched for missing", error.exception.output)
+
+            process = await revision.spawn_async(
+                [sys.executable, "-c", "print('hi')"],
+                stdout=asyncio.subprocess.PIPE)
+            self.assertEqual(1, len(revision.active_leases()))
+            out, _ = await process.communicate()
+            release_lease(process)
+            self.assertEqual("hi", out.decode().strip())
+
+            await util_async.stop_workers_async()
+
+        asyncio.run(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,32 @@
 
 import os
+import sys
+import json
+import socket
+import time
 import unittest
-from rezup.container import Container
-from tests.util import TestBase
+import subprocess
+from rezup.container import (
+    Container,
+    Revision,
+    find_dist_info,
+    read_dist_version,
+    locate_dist_package,
+    list_distributions,
+    pinned_requirements,
+    Tool,
+)
+from rezup.recipe import ContainerRecipe
+from rezup.exceptions import ContainerError
+from rezup import util, resolve_cache
+from rezup.sync import find_missing_revisions
+from rezup.daemon import Daemon
+from rezup import packages
+from rezup.verify import verify
+from rezup.cleanup import find_garbage, _purge
+from rezup.usage import measure, revision_usage, get_cached
+from rezup._trash import move_to_trash, has_garbage, empty_trash, trash_dir
+from tests.util import TestBase, temp_env, wait_until
 
 
 class TestContainer(TestBase):
@@ -81,6 +105,645 @@ class TestContainer(TestBase):
         self.assertEqual("orange", local.recipe()["description"])
         self.assertEqual("apple", local_rev.recipe()["description"])
 
+    def test_remote_manifest(self):
+        con_name = "foo"
+        self.setup_remote()
+
+        self.save_recipe(con_name, data={"description": "apple"})
+        container = Container.create(con_name)
+        revision = container.new_revision()
+        self.assertTrue(container.manifest().is_file())
+        # manifest just written is within mtime resolution, still stale
+        self.assertIsNone(container.read_manifest())
+
+        past = time.time() - 60
+        os.utime(str(container.revisions()), (past, past))
+        os.utime(str(container.manifest()), (past + 10, past + 10))
+
+        # revisions should be sourced from manifest, not revision dir
+        os.remove(str(revision.path() / "rezup.toml"))
+        container = Container.create(con_name)
+        revision = container.get_latest_revision()
+        self.assertTrue(revision.is_ready())
+        self.assertEqual("apple", revision.recipe()["description"])
+
+        # same mtime can't tell which comes first, treated as stale
+        os.utime(str(container.revisions()), (past + 10, past + 10))
+        self.assertIsNone(container.read_manifest())
+
+        # stale manifest should be ignored
+        os.utime(str(container.manifest()), (past, past))
+        os.makedirs(str(container.revisions() / "not.a.revision"))
+        container = Container.create(con_name)
+        self.assertIsNone(container.read_manifest())
+        self.assertIsNone(container.get_latest_revision())
+
+    def test_pull_steals_stale_lock(self):
+        con_name = "foo"
+        self.setup_remote()
+        self.save_recipe(con_name)
+        remote_rev = Container.create(con_name).new_revision()
+
+        # lock left by a crashed builder on this host
+        local = Container.create(con_name, force_local=True)
+        lock = Revision(container=local, dirname=remote_rev.dirname())
+        lock = lock.build_lock()
+        os.makedirs(str(local.locks()))
+        with lock:  # being pulled by other
+            self.assertIsNone(remote_rev.pull(blocking=False))
+        with open(lock.path(), "w") as f:
+            json.dump({"hostname": socket.gethostname(), "pid": 2 ** 22 + 1,
+                       "time": time.time()}, f)
+        self.assertFalse(lock.is_locked())
+
+        pulled_rev = remote_rev.pull()
+        self.assertTrue(pulled_rev.is_ready())
+        self.assertFalse(os.path.isfile(lock.path()))
+
+    def test_stale_revision(self):
+        con_name = "foo"
+        self.setup_remote()
+        self.save_recipe(con_name)
+
+        # local only revision should never be picked as stale one
+        Container.create(con_name, force_local=True).new_revision()
+        container = Container.create(con_name)
+        first_rev = container.new_revision()
+        self.assertIsNone(first_rev.get_stale())
+
+        first_rev.pull()
+        Container.create(con_name, force_local=True).new_revision()
+        latest_rev = container.new_revision()
+        stale_rev = latest_rev.get_stale()
+        self.assertEqual(first_rev, stale_rev)
+        self.assertFalse(stale_rev.is_remote())
+
+    def test_sync_find_missing(self):
+        con_name = "foo"
+        self.setup_remote()
+        self.save_recipe(con_name)
+
+        container = Container.create(con_name)
+        first_rev = container.new_revision()
+        first_rev.pull()
+        latest_rev = container.new_revision()
+
+        missing, existing = find_missing_revisions(container)
+        self.assertEqual([latest_rev], missing)
+        self.assertEqual([], existing)
+
+        missing, existing = find_missing_revisions(container, backfill=3)
+        self.assertEqual([latest_rev], missing)
+        self.assertEqual([first_rev], existing)
+
+    def test_sync_pull_raised(self):
+        from rezup import sync as _sync
+        con_name = "foo"
+        self.setup_remote()
+        self.save_recipe(con_name)
+        Container.create(con_name).new_revision()
+
+        def _raise(revision, low_priority=True):
+            raise OSError("disk full")
+
+        self.addCleanup(setattr, _sync, "pull_revision", _sync.pull_revision)
+        _sync.pull_revision = _raise
+
+        # exception from one pull should be reported, not raised
+        result, = list(_sync.sync([con_name], jobs=1))
+        self.assertEqual("failed", result["status"])
+        self.assertEqual(-1, result["failed"][0]["returncode"])
+        self.assertIn("disk full", result["failed"][0]["output"])
+
+    def test_daemon_retry_skipped(self):
+        con_name = "foo"
+        self.setup_remote()
+        self.save_recipe(con_name)
+        remote_rev = Container.create(con_name).new_revision()
+        local = Container.create(con_name, force_local=True)
+        lock = Revision(container=local, dirname=remote_rev.dirname())
+        lock = lock.build_lock()
+        os.makedirs(str(local.locks()))
+
+        daemon = Daemon(min_interval=1, low_priority=False,
+                        status_file=os.path.join(self.base, "d.json"))
+        with lock:  # being pulled by other
+            daemon._pull(remote_rev)
+        (revision, _, not_before), = daemon._queue
+        self.assertEqual("skipped", daemon._history[-1]["result"])
+        self.assertGreater(not_before, time.time())
+
+        daemon._queue = []
+        daemon._pull(revision)
+        self.assertEqual("pulled", daemon._history[-1]["result"])
+        self.assertEqual([], daemon._queue)
+        self.assertTrue(remote_rev.pull(check_out=False).is_ready())
+
+    def test_locate_editable_dist(self):
+        site_packages = os.path.join(self.base, "site-packages")
+        source = os.path.join(self.base, "source", "src")
+        os.makedirs(os.path.join(source, "rez"))
+        os.makedirs(os.path.join(site_packages, "rez-2.0.0.dist-info"))
+        with open(os.path.join(site_packages, "rez-2.0.0.dist-info",
+                               "METADATA"), "w") as f:
+            f.write("Metadata-Version: 2.1\nName: rez\nVersion: 2.0.0\n\n")
+        self.assertIsNone(locate_dist_package(site_packages, "rez"))
+
+        # PEP-660 editable install, with setuptools finder
+        finder = os.path.join(site_packages, "__editable___rez_2_0_0_finder.py")
+        with open(finder, "w") as f:
+            f.write("MAPPING = {%r: %r}\n"
+                    % ("rez", os.path.join(source, "rez")))
+        dist_info = find_dist_info(site_packages, "rez")
+        self.assertEqual("2.0.0", read_dist_version(dist_info))
+        self.assertEqual(source,
+                         str(locate_dist_package(site_packages, "rez")))
+
+        # PEP-660 editable install, with path file
+        os.remove(finder)
+        with open(os.path.join(site_packages, "__editable__.rez-2.0.0.pth"),
+                  "w") as f:
+            f.write(source + "\n")
+        self.assertEqual(source,
+                         str(locate_dist_package(site_packages, "rez")))
+
+    def test_list_broken_distributions(self):
+        site_packages = os.path.join(self.base, "site-packages")
+        for name, direct_url in [("foo", "{}"), ("bar", "{broken")]:
+            dist_info = os.path.join(site_packages, "%s-1.0.dist-info" % name)
+            os.makedirs(dist_info)
+            with open(os.path.join(dist_info, "METADATA"), "w") as f:
+                f.write("Name: %s\nVersion: 1.0\n\n" % name)
+            with open(os.path.join(dist_info, "direct_url.json"), "w") as f:
+                f.write(direct_url)
+        os.makedirs(os.path.join(site_packages, "baz.egg-link"))  # unreadable
+
+        self.assertEqual(["foo"], [
+            d["name"] for d in list_distributions(site_packages)
+        ])
+
+    def test_find_garbage(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        container = Container.create(con_name)
+        first_rev = container.new_revision()
+        second_rev = container.new_revision()
+        latest_rev = container.new_revision()
+
+        garbage = [r for r, _ in find_garbage(container, keep=2)]
+        self.assertEqual([first_rev], garbage)
+
+        # latest revision is always kept
+        garbage = [r for r, _ in find_garbage(container, max_age=0)]
+        self.assertEqual([second_rev, first_rev], garbage)
+        self.assertNotIn(latest_rev, garbage)
+
+        # revision in use is kept
+        with second_rev.build_lock():
+            garbage = [r for r, _ in find_garbage(container, max_age=0)]
+        self.assertEqual([first_rev], garbage)
+
+        # leased after found as garbage
+        first_rev._acquire_lease(os.getpid())
+        self.assertFalse(_purge(first_rev))
+        self.assertTrue(first_rev.path().is_dir())
+
+    def test_revision_leases(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        container = Container.create(con_name)
+        revision = container.new_revision()
+        self.assertEqual([], revision.active_leases())
+
+        # lease of dead process is reclaimed
+        dead = revision._acquire_lease(2 ** 22 + 1)
+        self.assertEqual([], revision.active_leases())
+        self.assertFalse(os.path.isfile(str(dead)))
+
+        revision._acquire_lease(os.getpid())
+        leases = revision.active_leases()
+        self.assertEqual(1, len(leases))
+        self.assertEqual(os.getpid(), leases[0]["pid"])
+        self.assertTrue(revision.is_in_use())
+        self.assertRaises(ContainerError, container.purge)
+
+    def test_empty_trash(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        container = Container.create(con_name)
+        revision = container.new_revision()
+
+        # revision is gone right after moved into trash
+        self.assertIsNotNone(move_to_trash(revision.path(), container.root()))
+        self.assertIsNone(container.get_latest_revision())
+        self.assertTrue(has_garbage(container.root()))
+
+        self.assertTrue(empty_trash(container.root(), jobs=2))
+        self.assertFalse(has_garbage(container.root()))
+        self.assertFalse(os.path.isdir(trash_dir(container.root())))
+
+    def test_disk_usage(self):
+        tree = os.path.join(self.base, "tree")
+        os.makedirs(os.path.join(tree, "sub"))
+        for name in ("inner", "outer"):
+            with open(os.path.join(tree, name), "w") as f:
+                f.write("x" * 10000)
+        os.link(os.path.join(tree, "inner"),
+                os.path.join(tree, "sub", "inner"))
+        os.link(os.path.join(tree, "outer"),
+                os.path.join(self.base, "outer"))
+
+        usage = measure(tree, jobs=2)
+        inner = os.lstat(os.path.join(tree, "inner"))
+        outer = os.lstat(os.path.join(tree, "outer"))
+        block = getattr(outer, "st_blocks", None)
+        self.assertEqual(outer.st_size if block is None else block * 512,
+                         usage["shared"])
+        self.assertEqual(4, usage["files"])  # every entry, including dir
+        self.assertGreaterEqual(usage["unique"], inner.st_size)
+
+        # measured at build time
+        self.save_recipe("foo")
+        revision = Container.create("foo").new_revision()
+        cached = get_cached(revision)
+        self.assertIsNotNone(cached)
+        self.assertEqual(cached, revision_usage(revision))
+
+    def test_recipe_registry(self):
+        self.save_recipe("foo")
+        recipes_dir = str(ContainerRecipe.RECIPES_DIR)
+        past = time.time() - 10
+        os.utime(recipes_dir, (past, past))
+        names = [r.name() for r in ContainerRecipe.iter_recipes()]
+        self.assertEqual(["foo"], names)
+        self.assertTrue(ContainerRecipe.registry().is_file())
+
+        # registry goes stale by recipe creation, and rescanned
+        os.utime(recipes_dir, (past, past))
+        list(ContainerRecipe.iter_recipes())
+        self.save_recipe("bar")
+        with open(str(ContainerRecipe.registry()), "r") as f:
+            registry = json.load(f)
+        self.assertNotEqual(os.stat(recipes_dir).st_mtime, registry["mtime"])
+        names = [r.name() for r in ContainerRecipe.iter_recipes()]
+        self.assertEqual(["bar", "foo"], sorted(names))
+
+        # but re-stamped by full scan once out of the resolution
+        past += 1
+        os.utime(recipes_dir, (past, past))
+        list(ContainerRecipe.iter_recipes())
+        with open(str(ContainerRecipe.registry()), "r") as f:
+            registry = json.load(f)
+        self.assertEqual(past, registry["mtime"])
+        self.assertEqual(["rezup.bar.toml", "rezup.foo.toml"],
+                         registry["files"])
+
+        # recipe added by hand is found by full scan
+        with open(os.path.join(recipes_dir, "rezup.bee.toml"), "w"):
+            pass
+        names = [r.name() for r in ContainerRecipe.iter_recipes()]
+        self.assertEqual(["bar", "bee", "foo"], sorted(names))
+
+    def test_query_revisions(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        container = Container.create(con_name)
+        first_rev = container.new_revision()
+        latest_rev = container.new_revision()
+
+        self.assertEqual([latest_rev, first_rev], container.query())
+        self.assertEqual([first_rev, latest_rev],
+                         container.query(latest_first=False))
+        self.assertEqual([latest_rev],
+                         container.query(since=float(latest_rev.dirname())))
+        self.assertEqual([], container.query(rez=">=99999"))
+        self.assertEqual([], container.query(creator="nobody"))
+        self.assertEqual(2, len(container.query(
+            recipe_hash=first_rev.recipe_hash()[:8])))
+
+        # index is updated as revisions being purged
+        first_rev.purge()
+        self.assertEqual([latest_rev], container.query())
+
+    def test_package_index(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        container = Container.create(con_name)
+        first_rev = container.new_revision()
+        latest_rev = container.new_revision()
+
+        rez_version = latest_rev.get_rez_version()
+        found = packages.find("Rez==%s" % rez_version)
+        self.assertEqual([latest_rev.dirname(), first_rev.dirname()],
+                         [r["revision"] for r in found])
+        self.assertEqual("rez", found[0]["venv"])
+        self.assertEqual([], packages.find("rez>%s" % rez_version))
+        self.assertEqual([], packages.find("not-installed"))
+
+        first_rev.purge()
+        found = packages.find("rez")
+        self.assertEqual([latest_rev.dirname()],
+                         [r["revision"] for r in found])
+
+    def test_verify_revision(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        revision = Container.create(con_name).new_revision()
+
+        usage = get_cached(revision)
+        self.assertIsNotNone(usage)
+        result = next(verify([con_name]))
+        self.assertEqual([], result["failures"])
+        self.assertGreater(result["hashed"], 0)
+        # unchanged files are not hashed again
+        self.assertEqual(0, next(verify([con_name]))["hashed"])
+        # verify cache doesn't invalidate disk usage cache
+        self.assertEqual(usage, get_cached(revision))
+
+        script = os.path.join(str(revision.production_bin_dir("rez")), "rez")
+        with open(script, "a") as f:
+            f.write("# edited")
+        result = next(verify([con_name]))
+        self.assertEqual([script], [f["path"] for f in result["failures"]])
+
+        result = next(verify([con_name], repair=True))
+        self.assertEqual(["rez"], result["repaired"])
+        self.assertEqual([], next(verify([con_name]))["failures"])
+
+        # reinstalled with recorded versions, except the ones from path
+        venv_path = os.path.join(str(revision.path()), "venv", "rez")
+        site_packages = os.path.join(venv_path, "site-packages")
+        dists = [
+            {"name": "rez", "version": "2.0.0", "location": site_packages},
+            {"name": "six", "version": "1.16.0", "location": site_packages},
+            {"name": "foo", "version": "1.0", "location": self.base},
+        ]
+        rez_ = Tool({"name": "rez", "url": self.test_dir})
+        self.assertEqual(["six==1.16.0"],
+                         pinned_requirements(dists, venv_path, [rez_]))
+        rez_ = Tool({"name": "rez", "url": "rez>=2"})
+        self.assertEqual(["rez==2.0.0", "six==1.16.0"],
+                         pinned_requirements(dists, venv_path, [rez_]))
+
+    def test_resolve_worker(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        revision = Container.create(con_name).new_revision()
+        self.addCleanup(util.stop_workers)
+        # not started by default
+        util.resolve_environ(revision, ["bar"])
+        self.assertEqual({}, util._workers)
+
+        os.environ["REZUP_WORKER_IDLE"] = "300"
+        self.addCleanup(os.environ.pop, "REZUP_WORKER_IDLE", None)
+        env = util.resolve_environ(revision, ["bar", "baz"])
+        self.assertEqual("bar baz", env["REZ_USED_REQUEST"])
+        # reused
+        pid = env["REZ_RESOLVED_BY"]
+        self.assertEqual(pid, util.resolve_environ(revision, ["bar"])[
+            "REZ_RESOLVED_BY"])
+        # resolve error doesn't kill worker, and comes with stderr
+        with self.assertRaises(subprocess.CalledProcessError) as error:
+            util.resolve_environ(revision, ["missing_pkg"])
+        self.assertIn("Searched for missing_pkg", error.exception.output)
+        self.assertEqual(pid, util.resolve_environ(revision, ["bar"])[
+            "REZ_RESOLVED_BY"])
+
+        # restart on crash
+        for worker in util._workers.values():
+            worker.popen.kill()
+        env = util.resolve_environ(revision, ["bar"])
+        self.assertNotEqual(pid, env["REZ_RESOLVED_BY"])
+
+        util.stop_workers()
+        self.assertEqual({}, util._workers)
+
+    def test_resolve_many(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        revision = Container.create(con_name).new_revision()
+        self.addCleanup(util.stop_workers)
+        os.environ["REZUP_WORKER_IDLE"] = "300"
+        self.addCleanup(os.environ.pop, "REZUP_WORKER_IDLE", None)
+
+        requests_list = [["a"], ["missing_b"], "c d", ["noisy_e"]]
+        results = util.resolve_environ_many(revision, requests_list, jobs=2)
+        self.assertEqual(
+            ["a", None, "c d", "noisy_e"],
+            [env and env["REZ_USED_REQUEST"] for env, _ in results])
+        self.assertIsInstance(results[1][1], subprocess.CalledProcessError)
+        # spread over two workers
+        self.assertEqual(2, len(set(
+            env["REZ_RESOLVED_BY"] for env, _ in results if env)))
+
+        with temp_env("REZUP_WORKER_IDLE", "0"):
+            results = util.resolve_environ_many(revision, requests_list)
+        self.assertEqual([True, False, True, True],
+                         [error is None for _, error in results])
+        self.assertEqual(1, len(set(
+            env["REZ_RESOLVED_BY"] for env, _ in results if env)))
+
+    def test_memoized_revision(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        container = Container.create(con_name)
+        first = container.new_revision()
+        # backdate, so the next write changes mtime on any file system
+        past = time.time() - 60
+        os.utime(str(container.manifest()), (past, past))
+
+        revision = util.get_revision(con_name)
+        self.assertEqual(first, revision)
+        self.assertIs(revision, util.get_revision(con_name))
+
+        second = container.new_revision()
+        revision = util.get_revision(con_name)
+        self.assertEqual(second, revision)
+        self.assertIs(revision, util.get_revision(con_name))
+
+        util.refresh(con_name)
+        self.assertIsNot(revision, util.get_revision(con_name))
+        self.assertIsNot(revision, util.get_revision(con_name, cached=False))
+
+    @unittest.skipIf(sys.version_info < (3, 7), "util_env needs 3.7+")
+    def test_util_env_snapshot(self):
+        from rezup import util_env
+
+        con_name = "foo"
+        self.save_recipe(con_name, {"env": {"BAR": "bee"}})
+        container = Container.create(con_name)
+        container.new_revision()
+        # backdate, so the next writes change mtime on any file system
+        past = time.time() - 60
+        for path in (ContainerRecipe(con_name).path(), container.manifest()):
+            os.utime(str(path), (past, past))
+        self.addCleanup(util_env.refresh)
+        self.addCleanup(os.environ.pop, "BAR", None)
+
+        self.assertEqual(["foo"], dir(util_env))
+        with temp_env("REZUP_ENV_SNAPSHOT", "yes"):
+            self.assertEqual("bee", util_env.foo["BAR"])
+            self.assertEqual("bee", os.environ["BAR"])
+            self.assertEqual(util_env.foo, util_env._read_snapshot(con_name))
+
+            # revision changed
+            self.save_recipe(con_name, {"env": {"BAR": "tea"}})
+            Container(con_name).new_revision()
+            self.assertIsNone(util_env._read_snapshot(con_name))
+            self.assertEqual("bee", util_env.foo["BAR"])  # cached in module
+
+            util_env.refresh()
+            self.assertEqual("tea", util_env.foo["BAR"])
+
+            # earlier local revision that fallback to is not cached
+            self.setup_remote()
+            Container.create(con_name).new_revision().pull()
+            self.save_recipe(con_name, {"env": {"BAR": "cake"}})
+            latest = Container.create(con_name).new_revision()
+            util_env.refresh()
+            self.assertEqual("tea", util_env.foo["BAR"])
+            self.assertIsNone(util_env._read_snapshot(con_name))
+            latest.pull()
+            self.assertEqual("cake", util_env.foo["BAR"])
+
+    def test_resolve_in_process(self):
+        con_name = "foo"
+        repo = os.path.join(self.base, "packages")
+        self.save_recipe(con_name, {"env": {"BAR": "bee",
+                                            "REZ_PACKAGES_PATH": repo}})
+        revision = Container.create(con_name).new_revision()
+        environ = os.environ.copy()
+
+        env = util.resolve_environ(revision, ["bar"], in_process=True)
+        self.assertEqual(str(os.getpid()), env["REZ_RESOLVED_BY"])
+        self.assertEqual("bee", env["BAR"])
+        self.assertEqual(repo, env["REZ_USED_PACKAGES_PATH"])
+        # isolated, but non-rez modules are shared
+        self.assertNotIn("rez", sys.modules)
+        self.assertIn("colorsys", sys.modules)
+        self.assertEqual(environ, os.environ)
+        with self.assertRaises(subprocess.CalledProcessError):
+            util.resolve_environ(revision, ["missing"], in_process=True)
+
+        # rez too old
+        metadata = dict(revision.metadata(), rez_version="2.82.0")
+        with open(str(revision.path() / "revision.json"), "w") as f:
+            json.dump(metadata, f)
+        old_rez = Revision(container=revision.container(),
+                           dirname=revision.dirname())
+        with temp_env("REZUP_WORKER_IDLE", "0"):
+            env = util.resolve_environ(old_rez, ["bar"], in_process=True)
+        self.assertNotEqual(str(os.getpid()), env["REZ_RESOLVED_BY"])
+
+        # interpreter mismatch
+        cfg = str(revision.path() / "venv" / "rez" / "pyvenv.cfg")
+        with open(cfg, "a") as f:
+            f.write("version_info = 2.6.0.final.0\n")
+        with temp_env("REZUP_WORKER_IDLE", "0"):
+            env = util.resolve_environ(revision, ["bar"], in_process=True)
+        self.assertNotEqual(str(os.getpid()), env["REZ_RESOLVED_BY"])
+
+    def test_resolve_cache(self):
+        con_name = "foo"
+        self.save_recipe(con_name)
+        revision = Container.create(con_name).new_revision()
+        repo = os.path.join(self.base, "packages")
+        os.makedirs(os.path.join(repo, "bar", "1.0"))
+
+        with temp_env("REZUP_WORKER_IDLE", "0"), \
+                temp_env("REZ_PACKAGES_PATH", repo):
+            env = util.resolve_environ(revision, ["bar"], cache=True)
+            pid = env["REZ_RESOLVED_BY"]
+            self.assertEqual(env, util.resolve_environ(
+                revision, ["bar"], cache=True))
+            # re-evaluated from saved context
+            env = util.resolve_environ(revision, ["bar"], cache="rxt")
+            self.assertEqual("bar", env["REZ_USED_REQUEST"])
+            self.assertNotEqual(pid, env["REZ_RESOLVED_BY"])
+
+            # package released
+            os.makedirs(os.path.join(repo, "bar", "1.1"))
+            env = util.resolve_environ(revision, ["bar"], cache=True)
+            self.assertNotEqual(pid, env["REZ_RESOLVED_BY"])
+
+            self.assertEqual(1, resolve_cache.invalidate(revision))
+            self.assertEqual([], os.listdir(resolve_cache.cache_dir(revision)))
+
+    def test_prewarm_contexts(self):
+        from rezup import prewarm
+
+        con_name = "foo"
+        self.save_recipe(con_name, {"prewarm": {"contexts": {"a": "bar"}}})
+        repo = os.path.join(self.base, "packages")
+        os.makedirs(os.path.join(repo, "bar"))
+
+        with temp_env("REZUP_WORKER_IDLE", "0"), \
+                temp_env("REZ_PACKAGES_PATH", repo):
+            revision = Container.create(con_name).new_revision()
+            # prewarmed in background
+            wait_until(lambda: "a" in prewarm.read_index(revision))
+            rxt = prewarm.get_context(revision, "a")
+            self.assertTrue(os.path.isfile(rxt))
+            self.assertEqual("a", prewarm.match(revision, " bar "))
+            created = prewarm.read_index(revision)["a"]["created"]
+
+            env = util.resolve_environ(revision, ["bar"])
+            self.assertEqual("bar", env["REZ_USED_REQUEST"])
+            self.assertEqual(
+                created, prewarm.read_index(revision)["a"]["created"])
+
+            # package released, stale context is not used for resolving
+            os.makedirs(os.path.join(repo, "bar", "1.0"))
+            self.assertIsNone(prewarm.get_context(revision, "a", refresh=False))
+            env = util.resolve_environ(revision, ["bar"])
+            self.assertEqual("bar", env["REZ_USED_REQUEST"])
+            self.assertEqual(
+                created, prewarm.read_index(revision)["a"]["created"])
+            # not saved if released within mtime resolution of resolving
+            self.assertIsNone(prewarm.get_context(revision, "a"))
+            past = time.time() - 10
+            for path in ("bar", os.path.join("bar", "1.0")):
+                os.utime(os.path.join(repo, path), (past, past))
+            self.assertEqual(rxt, prewarm.get_context(revision, "a"))
+            self.assertNotEqual(
+                created, prewarm.read_index(revision)["a"]["created"])
+            self.assertIsNone(prewarm.get_context(revision, "b"))
+
+    def test_baked_rez_config(self):
+        from rezup import prewarm
+
+        con_name = "foo"
+        config_file = os.path.join(self.base, "rezconfig.py")
+        with open(config_file, "w") as f:
+            f.write("packages_path = ['/bar']\n")
+        self.save_recipe(con_name, {"env": {"REZ_CONFIG_FILE": config_file},
+                                    "prewarm": {"config": True}})
+
+        with temp_env("REZUP_WORKER_IDLE", "0"):
+            revision = Container.create(con_name).new_revision()
+            wait_until(lambda: prewarm.baked_config(
+                revision, revision.recipe_env(baked=False)))
+            baked = revision.recipe_env()["REZ_CONFIG_FILE"]
+            self.assertNotEqual(config_file, baked)
+            data = {}
+            with open(baked, "r") as f:
+                exec(f.read(), data)
+            self.assertEqual(["/bar"], data["packages_path"])
+            self.assertEqual("~/packages", data["local_packages_path"])
+
+            # source config changed
+            with open(config_file, "w") as f:
+                f.write("packages_path = ['/baz']\n")
+            os.utime(config_file, (0, 0))
+            self.assertEqual(
+                config_file, revision.recipe_env()["REZ_CONFIG_FILE"])
+
+            result = prewarm.prewarm_revision(revision)
+            self.assertEqual(baked, result["config"])
+            self.assertEqual(baked, revision.recipe_env()["REZ_CONFIG_FILE"])
+            with open(baked, "r") as f:
+                self.assertIn("['/baz']", f.read())
+
     def test_recipe_env(self):
         con_name = "foo"
         self.save_recipe(con_name, {"env": {"bar": "bee"}})
@@ -93,3 +93,12 @@ def temp_env(key, value):
     finally:
         if key in os.environ:
             del os.environ[key]
+
+
+def wait_until(condition, timeout=60):
+    """Poll until condition returns true, e.g. for background process"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("Timed out waiting for %s" % condition)
+        time.sleep(0.2)